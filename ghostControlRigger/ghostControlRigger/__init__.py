@@ -1,3 +1,15 @@
-from . import ghostControlRigger
-from . import ghostControlRiggerUI
-from . import templates
\ No newline at end of file
+# Nothing is imported with the package. The core modules need Maya and the UI also needs Qt and pymel, and importing
+# pymel.core starts Maya standalone, so batch workers (batchRig.py, thumbnails.py), the stand-in benchmarks and the
+# offline template tools only pay for the modules they use.
+# The modules are still attributes of the package: ghostControlRigger.ghostControlRiggerUI imports the UI the first
+# time it's used.
+import importlib
+
+# modules loaded on first use, see __getattr__
+lazy_modules = ('ghostControlRigger', 'ghostControlRiggerUI', 'templates', 'templateFormat', 'catalog')
+
+
+def __getattr__(name):
+    if name in lazy_modules:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,277 @@
+# OpenMaya 2.0 build backend for ghostControlRigger.buildControls
+#
+# Builds the same controls, w_controls, joints and connections as iterMakeRig,
+# but creates the whole hierarchy and the control shapes in one MDagModifier transaction and wires it in one
+# MDGModifier transaction instead of making separate maya.cmds calls for every guide.
+#
+# Maya's undo queue only holds commands, so every change is made through a modifier and every modifier is run
+# through an undoable command registered by modifierPlugin.py (see doIt). Undoing the command undoes the modifier
+# and redoing it runs the modifier again. Nothing is changed with function sets like MFnTransform, whose changes
+# can't be undone.
+
+import os
+
+import maya.cmds as cmds
+import maya.api.OpenMaya as om
+
+from . import curves
+
+# Suffix of the multMatrix nodes that drive wcontrols in 'matrix' wiring and joints in 'lean' wiring,
+# added to the name of the driven node
+matrix_driver_suffix = '_mult'
+# Boolean attribute that tags the matrix drivers, so they are found and deleted without touching other multMatrix nodes
+matrix_driver_attr = 'ghostControlRiggerDriver'
+
+# Command that runs a modifier on Maya's undo queue, and the plug-in file that registers it
+# (modifierPlugin.command_name)
+modifier_command = 'ghostControlRiggerModifier'
+modifier_plugin = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modifierPlugin.py')
+
+# Modifiers handed to the modifier command by doIt. The command finds them by the name of this module
+pending_modifiers = []
+
+
+def loadModifierCommand():
+    '''
+    Loads the plug-in of the modifier command if it isn't loaded yet
+    '''
+    if not hasattr(cmds, modifier_command):
+        cmds.loadPlugin(modifier_plugin, quiet=True)
+
+
+def doIt(modifier):
+    '''
+    Runs a modifier through the modifier command, so its changes are one step on Maya's undo queue
+    Args:
+        modifier: (MDGModifier or MDagModifier) modifier with its changes queued
+    '''
+    loadModifierCommand()
+    pending_modifiers.append(modifier)
+    try:
+        getattr(cmds, modifier_command)(__name__)
+    finally:
+        # the command didn't get as far as taking the modifier
+        if modifier in pending_modifiers:
+            pending_modifiers.remove(modifier)
+
+
+def buildRig(guides, matrices, guide_curves, controls_grp, w_grp, wiring='direct', nodes=None):
+    '''
+    Creates controls, w_controls and joints for the given guides and connects them.
+    A rig can be built in steps by calling this for groups of guides, parents first, with the same nodes dict
+    Args:
+        guides: (list) guides determine location and hierarchy of controls. The parent guide of each one is either
+            in guides or was built by an earlier call
+        matrices: (dict) guide world matrices from ghostControlRigger.getWorldMatrices
+        guide_curves: (dict) guide curve data from curves.getCurveDataForNodes
+        controls_grp: (string) group that holds the top control offset groups
+        w_grp: (string) group that holds the top wcontrol offset groups
+        wiring: (string) how wcontrols follow controls, one of ghostControlRigger.wiring_modes
+        nodes: (dict) guide -> nodes made for it by earlier calls, the new guides are added
+    Returns:
+        controls: (list) list of control names, in the same order as guides
+        wcontrols: (list) list of wcontrol names, in the same order as guides. Joint names with 'lean' wiring
+    '''
+
+    sel = om.MSelectionList()
+    for guide in guides:
+        sel.add(guide)
+    sel.add(controls_grp)
+    sel.add(w_grp)
+
+    guide_paths = {}
+    for i in range(len(guides)):
+        guide_paths[guides[i]] = sel.getDagPath(i)
+    controls_grp_path = sel.getDagPath(len(guides))
+    w_grp_path = sel.getDagPath(len(guides) + 1)
+
+    # Create parents before children so every node is made straight under its final parent
+    ordered = sorted(guides, key=lambda guide: guide_paths[guide].length())
+
+    dag_mod = om.MDagModifier()
+    if nodes is None:
+        nodes = {}
+    for guide in ordered:
+        guide_parent = getGuideParent(guide_paths[guide], nodes)
+        if guide_parent:
+            ctr_parent = nodes[guide_parent]['ctr']
+            wctr_parent = nodes[guide_parent]['jnt' if wiring == 'lean' else 'wctr']
+        else:
+            ctr_parent = controls_grp_path.node()
+            wctr_parent = w_grp_path.node()
+
+        node = {}
+        node['ctr_offset'] = createTransform(dag_mod, guide + '_ctr_Offset', ctr_parent)
+        node['ctr_extra'] = createTransform(dag_mod, guide + '_ctr_Extra', node['ctr_offset'])
+        node['ctr'] = createTransform(dag_mod, guide + '_ctr', node['ctr_extra'])
+        # copy the guide shapes onto the control
+        curves.createCurveShapes(dag_mod, guide_curves[guide], node['ctr'], guide + '_ctr')
+        if wiring == 'lean':
+            # the w side is just the joint, placed by the static offset of its matrix driver
+            node['jnt'] = dag_mod.createNode('joint', wctr_parent)
+            dag_mod.renameNode(node['jnt'], guide + '_jnt')
+            nodes[guide] = node
+            continue
+        node['wctr_offset'] = createTransform(dag_mod, guide + '_ctr_w_Offset', wctr_parent)
+        if wiring == 'matrix':
+            # the Extra motion comes in through the wcontrol's offsetParentMatrix instead
+            node['wctr'] = createTransform(dag_mod, guide + '_ctr_w', node['wctr_offset'])
+        else:
+            node['wctr_extra'] = createTransform(dag_mod, guide + '_ctr_w_Extra', node['wctr_offset'])
+            node['wctr'] = createTransform(dag_mod, guide + '_ctr_w', node['wctr_extra'])
+        node['jnt'] = dag_mod.createNode('joint', node['wctr'])
+        dag_mod.renameNode(node['jnt'], guide + '_jnt')
+        nodes[guide] = node
+    doIt(dag_mod)
+
+    # Match offset groups to guides. The parent control sits exactly on the parent guide,
+    # so the local matrix of the offset is the guide matrix relative to its parent guide.
+    guide_matrices = dict((guide, om.MMatrix(matrices[guide])) for guide in guides)
+    lean_offsets = {}
+    place_mod = om.MDGModifier()
+    for guide in ordered:
+        guide_parent = getGuideParent(guide_paths[guide], nodes)
+        if guide_parent:
+            parent_inverse = om.MMatrix(matrices[guide_parent]).inverse()
+            w_parent_inverse = parent_inverse
+        else:
+            parent_inverse = controls_grp_path.inclusiveMatrixInverse()
+            w_parent_inverse = w_grp_path.inclusiveMatrixInverse()
+        world_matrix = guide_matrices[guide]
+        setLocalMatrix(place_mod, nodes[guide]['ctr_offset'], world_matrix * parent_inverse)
+        if wiring == 'lean':
+            lean_offsets[guide] = world_matrix * w_parent_inverse
+        else:
+            setLocalMatrix(place_mod, nodes[guide]['wctr_offset'], world_matrix * w_parent_inverse)
+    doIt(place_mod)
+
+    # Connect controls to wcontrols
+    if wiring == 'lean':
+        connectMatrixDrivers([(nodes[guide]['ctr'], nodes[guide]['ctr_extra'], nodes[guide]['jnt'],
+                               lean_offsets[guide]) for guide in ordered])
+        disableScaleCompensation([nodes[guide]['jnt'] for guide in ordered])
+    elif wiring == 'matrix':
+        connectMatrixDrivers([(nodes[guide]['ctr'], nodes[guide]['ctr_extra'], nodes[guide]['wctr'], None)
+                              for guide in ordered])
+    else:
+        pairs = []
+        for guide in ordered:
+            node = nodes[guide]
+            pairs.append((node['ctr'], node['wctr']))
+            pairs.append((node['ctr_extra'], node['wctr_extra']))
+        connectTransformPairs(pairs)
+
+    controls = [om.MFnDependencyNode(nodes[guide]['ctr']).name() for guide in guides]
+    w_key = 'jnt' if wiring == 'lean' else 'wctr'
+    wcontrols = [om.MFnDependencyNode(nodes[guide][w_key]).name() for guide in guides]
+    return controls, wcontrols
+
+
+def createTransform(dag_mod, name, parent):
+    '''
+    Queues creation of a named transform under the given parent
+    Args:
+        dag_mod: (MDagModifier) modifier the creation is queued on
+        name: (string) name of the new transform
+        parent: (MObject) parent node
+    Returns:
+        node: (MObject) the new transform
+    '''
+    node = dag_mod.createNode('transform', parent)
+    dag_mod.renameNode(node, name)
+    return node
+
+
+def connectTransformPairs(pairs):
+    '''
+    Connects translate, rotate and scale of every source transform to its destination in one MDGModifier transaction
+    Args:
+        pairs: (list) (source, destination) MObject pairs
+    '''
+    dg_mod = om.MDGModifier()
+    for src, dst in pairs:
+        src_fn = om.MFnDependencyNode(src)
+        dst_fn = om.MFnDependencyNode(dst)
+        for attr in ('translate', 'rotate', 'scale'):
+            dg_mod.connect(src_fn.findPlug(attr, False), dst_fn.findPlug(attr, False))
+    doIt(dg_mod)
+
+
+def connectMatrixDrivers(drivers):
+    '''
+    Drives the offsetParentMatrix of every wcontrol with its control matrix times the control's Extra group matrix,
+    times a static offset if one is given. Each wcontrol gets one multMatrix node and all of them are created
+    and connected in one MDGModifier transaction, and is tagged with matrix_driver_attr.
+    Needs Maya 2020 or later for offsetParentMatrix.
+    Args:
+        drivers: (list) (control, Extra group, wcontrol, offset) tuples. The nodes are MObjects,
+            offset is an MMatrix set as the last multMatrix input, or None
+    Returns:
+        mult_nodes: (list) the new multMatrix nodes, named <wcontrol>_mult
+    '''
+    dg_mod = om.MDGModifier()
+    mult_nodes = []
+    for ctr, extra, wctr, offset in drivers:
+        wctr_fn = om.MFnDependencyNode(wctr)
+        mult = dg_mod.createNode('multMatrix')
+        dg_mod.renameNode(mult, wctr_fn.name() + matrix_driver_suffix)
+        tag = om.MFnNumericAttribute().create(matrix_driver_attr, matrix_driver_attr, om.MFnNumericData.kBoolean, True)
+        dg_mod.addAttribute(mult, tag)
+        mult_fn = om.MFnDependencyNode(mult)
+        matrix_in = mult_fn.findPlug('matrixIn', False)
+        dg_mod.connect(om.MFnDependencyNode(ctr).findPlug('matrix', False), matrix_in.elementByLogicalIndex(0))
+        dg_mod.connect(om.MFnDependencyNode(extra).findPlug('matrix', False), matrix_in.elementByLogicalIndex(1))
+        if offset is not None:
+            dg_mod.newPlugValue(matrix_in.elementByLogicalIndex(2), om.MFnMatrixData().create(offset))
+        dg_mod.connect(mult_fn.findPlug('matrixSum', False), wctr_fn.findPlug('offsetParentMatrix', False))
+        mult_nodes.append(mult)
+    doIt(dg_mod)
+    return mult_nodes
+
+
+def disableScaleCompensation(joints):
+    '''
+    Turns segmentScaleCompensate off on the given joints in one MDGModifier transaction,
+    so a joint chain passes its scale on like a transform hierarchy does
+    Args:
+        joints: (list) joint MObjects
+    '''
+    dg_mod = om.MDGModifier()
+    for joint in joints:
+        dg_mod.newPlugValueBool(om.MFnDependencyNode(joint).findPlug('segmentScaleCompensate', False), False)
+    doIt(dg_mod)
+
+
+def getGuideParent(guide_path, guides):
+    '''
+    Returns the name of the guide's parent if that parent is one of the given guides, otherwise None
+    '''
+    parent_path = om.MDagPath(guide_path)
+    parent_path.pop()
+    if parent_path.length() == 0:
+        return None
+    parent = om.MFnDagNode(parent_path).name()
+    if parent in guides:
+        return parent
+    return None
+
+
+def setLocalMatrix(dg_mod, node, matrix):
+    '''
+    Queues setting the translate, rotate, scale and shear of a transform from a matrix
+    Args:
+        dg_mod: (MDGModifier) modifier the values are queued on
+        node: (MObject) transform with the default xyz rotate order
+        matrix: (MMatrix) local matrix
+    '''
+    transformation = om.MTransformationMatrix(matrix)
+    node_fn = om.MFnDependencyNode(node)
+    rotation = transformation.rotation()
+    values = list(zip(('translateX', 'translateY', 'translateZ'), transformation.translation(om.MSpace.kTransform)))
+    values += zip(('scaleX', 'scaleY', 'scaleZ'), transformation.scale(om.MSpace.kTransform))
+    values += zip(('shearXY', 'shearXZ', 'shearYZ'), transformation.shear(om.MSpace.kTransform))
+    for attr, value in values:
+        dg_mod.newPlugValueDouble(node_fn.findPlug(attr, False), value)
+    for attr, value in (('rotateX', rotation.x), ('rotateY', rotation.y), ('rotateZ', rotation.z)):
+        dg_mod.newPlugValueMAngle(node_fn.findPlug(attr, False), om.MAngle(value))
+
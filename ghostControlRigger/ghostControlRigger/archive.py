@@ -0,0 +1,465 @@
+'''
+Template archives: a whole library of guide templates in one zip file
+
+Listing and opening thousands of small template files on a network share is slow. An archive (.gcrlib) is a zip
+file that holds:
+    index.json              - name, tags, guide count, guide names, content hash, guide hash, size, time written
+                              and zip member of every template, the same fields as a template catalog entry
+                              (see catalog.py)
+    templates/<hash>/<name> - the content of every template, deflate compressed, under its content hash
+Listing a library only reads the index, and a template is read by name without reading the others. Templates
+keep their file names, .ma or .json, and their content, so they can be extracted to loose files again.
+
+The rest of the tool addresses a template in an archive as if the archive were a directory:
+'/path/to/library.gcrlib/collar.ma'. Setting the templates directory to an archive (see templates.py) makes
+template_import, template_export and the template list use it instead of loose files.
+
+Archives live on network shares (SMB, NFS), where file locking can't be trusted, so an archive is never changed
+in place. A change copies the archive byte for byte to a temporary file next to it, appends the templates whose
+content is new and a new index.json, and then replaces the archive with os.replace: readers see the old archive or
+the new one, never half of one. Nothing is decompressed or compressed again, so exporting one template costs a
+file copy and the compression of that template, not of the whole library. The last index.json in the zip is the
+one that counts. Replaced templates and old indexes stay behind as dead bytes until they outweigh the live
+ones, then the change writes a compacted archive with only the live templates instead. Writers take a lock file made
+with O_EXCL first, and read the archive once they have it, so two artists writing at the same time don't lose
+each other's templates. A writer waits up to lock_timeout seconds for the lock, a lock older than
+stale_lock_age is left over from a writer that crashed and is taken over.
+The parsed index is kept in memory until the archive file changes.
+
+Only the Python standard library is needed, no Maya.
+
+How to run (from the folder that holds the ghostControlRigger package):
+python -m ghostControlRigger.archive pack /path/to/guide_templates /path/to/library.gcrlib
+python -m ghostControlRigger.archive list /path/to/library.gcrlib
+python -m ghostControlRigger.archive extract /path/to/library.gcrlib /path/to/guide_templates
+'''
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import warnings
+import zipfile
+
+from . import catalog
+from . import maParser
+from . import templateFormat
+
+archive_extension = '.gcrlib'
+archive_format = 'ghostControlRigger.archive'
+# version 3 stores templates under their content hash and appends changes, version 2 archives are still read
+archive_version = 3
+
+index_member = 'index.json'
+template_folder = 'templates/'
+
+# seconds to wait for another artist's write to finish
+lock_timeout = 30.0
+# seconds between tries to take the lock
+lock_retry_delay = 0.1
+# seconds after which a lock is from a writer that crashed
+stale_lock_age = 600.0
+
+# archive path -> (stat stamp, index templates) of the archives read, see loadIndex
+index_cache = {}
+
+
+def isArchive(path):
+    '''
+    Returns True if a path is a template archive
+    '''
+    return path.lower().endswith(archive_extension) and os.path.isfile(path)
+
+
+def isMemberPath(path):
+    '''
+    Returns True if a path names a template in an archive, like /path/to/library.gcrlib/collar.ma
+    '''
+    return isArchive(os.path.dirname(path))
+
+
+def getMemberName(name, entry=None):
+    '''
+    Returns the zip member that holds the content of a template
+    Args:
+        name: (string) template name
+        entry: (dict) index entry of the template. Templates of version 2 archives have no 'member' in it
+    '''
+    if entry is not None and entry.get('member'):
+        return entry['member']
+    return template_folder + name
+
+
+def getStamp(path):
+    '''
+    Returns what changes when an archive file is replaced or written
+    '''
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def loadIndex(path):
+    '''
+    Reads the index of an archive, from memory if the archive didn't change since it was last read
+    Args:
+        path: (string) archive file
+    Returns:
+        templates: (dict) name -> catalog entry with 'tags'. Don't change it, it's shared by every caller
+    Raises RuntimeError if the archive can't be read
+    '''
+    try:
+        stamp = getStamp(path)
+    except OSError:
+        index_cache.pop(path, None)
+        raise RuntimeError('Template archive not found: {}'.format(path))
+    cached = index_cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        with zipfile.ZipFile(path) as archive_zip:
+            index = json.loads(archive_zip.read(index_member).decode('utf-8'))
+    except (EnvironmentError, zipfile.BadZipFile, KeyError, ValueError) as error:
+        raise RuntimeError('Template archive {} could not be read: {}'.format(path, error))
+    if not isinstance(index, dict) or index.get('format') != archive_format:
+        raise RuntimeError('{} is not a template archive'.format(path))
+    if index.get('version', 0) > archive_version:
+        raise RuntimeError('Template archive version {} is newer than this tool supports ({})'.format(
+            index['version'], archive_version))
+    index_cache[path] = (stamp, index['templates'])
+    return index['templates']
+
+
+@contextlib.contextmanager
+def lockArchive(path):
+    '''
+    Holds the write lock of an archive, see the module docs
+    Raises RuntimeError if the lock isn't free after lock_timeout seconds
+    '''
+    lock_path = path + '.lock'
+    end = time.time() + lock_timeout
+    while True:
+        try:
+            lock_file = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_lock_age:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                # the other writer just let go of the lock
+                continue
+            if time.time() > end:
+                raise RuntimeError('Template archive {} is being written by someone else, try again later. '
+                                   'If nobody is, delete {}'.format(path, lock_path))
+            time.sleep(lock_retry_delay)
+        except OSError as error:
+            raise RuntimeError('Template archive {} could not be locked: {}'.format(path, error))
+    try:
+        os.write(lock_file, str(os.getpid()).encode('ascii'))
+        os.close(lock_file)
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def rewriteArchive(path, update, create=False):
+    '''
+    Changes an archive under its lock: the archive is read and changed by update, then copied to a temporary file
+    that gets the new templates and index appended and replaces it. See the module docs
+    Args:
+        path: (string) archive file
+        update: (function) called with (templates, data): name -> index entry of the templates, which it changes in
+            place, and an empty dict it fills with name -> content bytes of the templates it adds or replaces
+        create: (bool) make the archive if it doesn't exist
+    Raises RuntimeError if the archive can't be read or written
+    '''
+    with lockArchive(path):
+        exists = os.path.isfile(path)
+        if not exists and not create:
+            raise RuntimeError('Template archive not found: {}'.format(path))
+        templates = dict((name, dict(entry)) for name, entry in loadIndex(path).items()) if exists else {}
+        data = {}
+        update(templates, data)
+        for name in data:
+            templates[name]['member'] = '{}{}/{}'.format(template_folder, templates[name]['hash'], name)
+        index = json.dumps({'format': archive_format, 'version': archive_version, 'templates': templates},
+                           separators=(',', ':'))
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            if exists:
+                shutil.copyfile(path, temp_path)
+            with warnings.catch_warnings():
+                # every change appends index.json again, the last one is read
+                warnings.filterwarnings('ignore', 'Duplicate name', UserWarning)
+                with zipfile.ZipFile(temp_path, 'a' if exists else 'w', zipfile.ZIP_DEFLATED) as new_zip:
+                    members = set(new_zip.namelist())
+                    for name in sorted(data):
+                        # a template written again with the same content is already there
+                        if templates[name]['member'] not in members:
+                            new_zip.writestr(templates[name]['member'], data[name])
+                            members.add(templates[name]['member'])
+                    new_zip.writestr(index_member, index)
+                    live_bytes = getLiveBytes(new_zip, templates)
+            if os.path.getsize(temp_path) > 2 * live_bytes:
+                compactArchive(temp_path, templates, index)
+            os.replace(temp_path, path)
+        except (EnvironmentError, zipfile.BadZipFile, KeyError) as error:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise RuntimeError('Template archive {} could not be written: {}'.format(path, error))
+
+
+def getLiveBytes(archive_zip, templates):
+    '''
+    Returns the compressed size of the members an index uses, the last index.json included
+    Args:
+        archive_zip: (ZipFile) open archive
+        templates: (dict) name -> index entry of the templates
+    '''
+    members = set(getMemberName(name, entry) for name, entry in templates.items())
+    members.add(index_member)
+    # getinfo gives the last member of a name, the one that is read
+    return sum(archive_zip.getinfo(member).compress_size for member in members)
+
+
+def compactArchive(path, templates, index):
+    '''
+    Rewrites an archive with only the templates of its index and one index.json, dropping the replaced templates
+    and old indexes appended before
+    Args:
+        path: (string) archive file, replaced through a temporary file
+        templates: (dict) name -> index entry of the templates
+        index: (string) the index.json text
+    '''
+    compact_path = path + '.compact'
+    try:
+        with zipfile.ZipFile(path) as old_zip:
+            with zipfile.ZipFile(compact_path, 'w', zipfile.ZIP_DEFLATED) as new_zip:
+                for member in sorted(set(getMemberName(name, entry) for name, entry in templates.items())):
+                    new_zip.writestr(member, old_zip.read(member))
+                new_zip.writestr(index_member, index)
+        os.replace(compact_path, path)
+    finally:
+        if os.path.exists(compact_path):
+            os.remove(compact_path)
+
+
+def getEntries(path):
+    '''
+    Returns the index of an archive
+    Args:
+        path: (string) archive file
+    Returns:
+        templates: (list) (name, catalog entry) pairs, sorted by name. Entries also have 'tags'
+    '''
+    return sorted(loadIndex(path).items())
+
+
+def getTemplateEntries(path):
+    '''
+    Returns the index entries of the readable templates in an archive, like catalog.getTemplateEntries
+    '''
+    templates = getEntries(path)
+    for name, entry in templates:
+        if entry['error']:
+            print('Skipping unreadable template {}: {}'.format(name, entry['error']))
+    return [(name, entry) for name, entry in templates if not entry['error']]
+
+
+def getEntry(path, name):
+    '''
+    Returns the index entry of one template, None if the archive doesn't have it
+    '''
+    return loadIndex(path).get(name)
+
+
+def readBytes(path, name):
+    '''
+    Returns the content of one template
+    Args:
+        path: (string) archive file
+        name: (string) template name, like collar.ma
+    Raises RuntimeError if the archive doesn't have the template
+    '''
+    entry = getEntry(path, name)
+    if entry is None:
+        raise RuntimeError('Guide template not found: {}'.format(os.path.join(path, name)))
+    try:
+        with zipfile.ZipFile(path) as archive_zip:
+            return archive_zip.read(getMemberName(name, entry))
+    except KeyError:
+        raise RuntimeError('Guide template not found: {}'.format(os.path.join(path, name)))
+    except (EnvironmentError, zipfile.BadZipFile) as error:
+        raise RuntimeError('Template archive {} could not be read: {}'.format(path, error))
+
+
+def readTemplate(path, name):
+    '''
+    Reads one template into compact template data, without Maya
+    Args:
+        path: (string) archive file
+        name: (string) template name, like collar.ma
+    Returns:
+        template: (dict) template data
+    Raises RuntimeError like thumbnails.readTemplateData
+    '''
+    member_path = os.path.join(path, name)
+    try:
+        text = readBytes(path, name).decode('utf-8')
+    except UnicodeDecodeError as error:
+        raise RuntimeError('{} is not a text file: {}'.format(member_path, error))
+    if templateFormat.isTemplateFile(name):
+        return templateFormat.parseTemplate(text, member_path)
+    template = maParser.toTemplate(maParser.parseLines(text.splitlines(True), member_path))
+    if not template['guides']:
+        raise RuntimeError('No guide curves found in {}'.format(member_path))
+    return template
+
+
+def makeEntry(name, data, template=None, tags=None):
+    '''
+    Returns the index entry of a template
+    Args:
+        name: (string) template name
+        data: (bytes) content of the template
+        template: (dict) template data the content was written from. Its guides are used instead of reading them
+        tags: (list) tags of the template
+    '''
+    names = []
+    guide_hash = None
+    error = None
+    try:
+        if template is not None:
+            names = catalog.getTemplateNames(template)
+            guide_hash = templateFormat.hashTemplate(template)
+        else:
+            names, guide_hash = catalog.readGuides(name, data.decode('utf-8'))
+    except (RuntimeError, ValueError, IndexError, KeyError, TypeError) as error_found:
+        error = '{}: {}'.format(type(error_found).__name__, error_found)
+    return {'size': len(data), 'mtime': time.time(), 'hash': hashlib.sha1(data).hexdigest(), 'guides': len(names),
+            'names': names, 'guide_hash': guide_hash, 'tags': list(tags or []), 'error': error}
+
+
+def writeTemplates(path, templates):
+    '''
+    Adds templates to an archive or replaces them, in one change of the archive. The archive is made if it doesn't
+    exist
+    Args:
+        path: (string) archive file
+        templates: (list) (name, content bytes, template data or None) of each template, see makeEntry
+    '''
+    def update(entries, data):
+        for name, content, template in templates:
+            tags = entries[name]['tags'] if name in entries else []
+            entries[name] = makeEntry(name, content, template, tags)
+            data[name] = content
+
+    rewriteArchive(path, update, create=True)
+
+
+def writeTemplate(path, name, data, template=None):
+    '''
+    Adds a template to an archive or replaces it, see writeTemplates. Its tags are kept
+    '''
+    writeTemplates(path, [(name, data, template)])
+
+
+def removeTemplate(path, name):
+    '''
+    Removes a template from an archive
+    '''
+    rewriteArchive(path, lambda entries, data: entries.pop(name, None))
+
+
+def setTags(path, name, tags):
+    '''
+    Sets the tags of a template
+    Args:
+        path: (string) archive file
+        name: (string) template name
+        tags: (list) tag strings
+    '''
+    def update(entries, data):
+        if name in entries:
+            entries[name]['tags'] = list(tags)
+
+    rewriteArchive(path, update)
+
+
+def extractTemplate(path, name, file_path):
+    '''
+    Writes one template of an archive to a file
+    '''
+    with open(file_path, 'wb') as f:
+        f.write(readBytes(path, name))
+
+
+def packDirectory(directory, path):
+    '''
+    Adds every template of a templates directory to an archive, see catalog.isTemplateName
+    Returns:
+        names: (list) names of the templates added
+    '''
+    names = sorted(name for name in os.listdir(directory)
+                   if catalog.isTemplateName(name) and os.path.isfile(os.path.join(directory, name)))
+    templates = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as f:
+            templates.append((name, f.read(), None))
+    writeTemplates(path, templates)
+    return names
+
+
+def extractArchive(path, directory):
+    '''
+    Writes every template of an archive to a templates directory
+    Returns:
+        names: (list) names of the templates written
+    '''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    names = [name for name, entry in getEntries(path)]
+    for name in names:
+        extractTemplate(path, name, os.path.join(directory, name))
+    return names
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Pack guide templates into a template archive and back.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    pack = commands.add_parser('pack', help='add the templates of a directory to an archive')
+    pack.add_argument('directory', help='templates directory')
+    pack.add_argument('archive', help='archive file, made if it doesn\'t exist')
+    listing = commands.add_parser('list', help='print the index of an archive')
+    listing.add_argument('archive', help='archive file')
+    extract = commands.add_parser('extract', help='write the templates of an archive to a directory')
+    extract.add_argument('archive', help='archive file')
+    extract.add_argument('directory', help='templates directory')
+    options = parser.parse_args(args)
+
+    try:
+        if options.command == 'pack':
+            print('Packed {} templates'.format(len(packDirectory(options.directory, options.archive))))
+        elif options.command == 'extract':
+            print('Extracted {} templates'.format(len(extractArchive(options.archive, options.directory))))
+        else:
+            for name, entry in getEntries(options.archive):
+                print('{:40} {:>5} guides {:>9} bytes  {}'.format(
+                    name, entry['guides'], entry['size'], entry['error'] or ' '.join(entry['tags'])))
+    except (RuntimeError, EnvironmentError) as error:
+        print(error)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+'''
+Batch rigging of many scenes without the UI
+
+Reads a manifest of scenes and the guide templates to rig each one with, and rigs the scenes in a pool of worker
+interpreters. Each worker opens a scene, imports its templates under the guides group (see
+templates.template_import_many), builds the controls with ghostControlRigger.buildControls and saves the result.
+A line is printed as each scene is done, and --report writes the time of every step and the error of every scene
+that failed to a JSON file. The command exits with status 1 if a scene failed.
+
+The manifest is a JSON file. Paths are relative to the manifest:
+{
+    "templates_dir": "guide_templates",
+    "output_dir": "rigged",
+    "build": {"backend": "api", "wiring": "direct"},
+    "scenes": [
+        {"scene": "characters/bob_shirt.ma", "templates": ["collar.ma", "cuff_L.json", "cuff_R.json"]},
+        {"scene": "characters/ann_coat.ma", "templates": ["coat.ma"], "output": "ann_coat_rig.ma",
+         "build": {"wiring": "lean"}},
+        {"templates": ["collar.ma"], "output": "collar_rig.ma"}
+    ]
+}
+    templates_dir   templates directory or template archive (see archive.py), the templates.py default if missing
+    output_dir      folder for the rigged scenes, next to the scenes if missing
+    build           arguments of buildControls, the ones of a scene are added to these
+    scene           scene to rig, a new scene if missing
+    templates       guide templates to import into the scene, can be empty to rig the guides the scene has
+    output          rigged scene, <scene>_rig.ma by default. Scenes are saved as Maya ASCII, or Maya binary for .mb
+
+Workers are started with mayapy and run Maya standalone. With --stand-in they run the Maya stand-in instead (see
+mayaStandIn.py), to check a manifest or time the tool without Maya. Scenes saved by the stand-in are its own JSON
+files, not Maya files.
+
+Workers are kept for the whole batch, so Maya starts once per worker, and a template used by many scenes is read
+once per worker (see templates.template_cache). .ma templates are imported by Maya every time, as they are in the UI.
+
+How to run (from the folder that holds the ghostControlRigger package):
+mayapy -m ghostControlRigger.batchRig manifest.json --jobs 4 --report report.json
+python -m ghostControlRigger.batchRig manifest.json --stand-in
+'''
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+from . import thumbnails
+
+# steps timed for every scene, in the order they run
+steps = ('open', 'import', 'build', 'save')
+
+
+def readManifest(path):
+    '''
+    Reads a manifest into one job per scene
+    Args:
+        path: (string) manifest file
+    Returns:
+        jobs: (list) dicts with absolute 'scene' (None for a new scene), 'templates', 'templates_dir', 'output'
+            and 'build' (buildControls arguments)
+    Raises RuntimeError if the manifest can't be read or a scene has no output
+    '''
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (EnvironmentError, ValueError) as error:
+        raise RuntimeError('Manifest {} could not be read: {}'.format(path, error))
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('scenes'), list):
+        raise RuntimeError("Manifest {} has no 'scenes' list".format(path))
+
+    root = os.path.dirname(os.path.abspath(path))
+
+    def getPath(value):
+        return os.path.normpath(os.path.join(root, value)) if value else None
+
+    output_dir = getPath(manifest.get('output_dir'))
+    jobs = []
+    for i, entry in enumerate(manifest['scenes']):
+        scene = getPath(entry.get('scene'))
+        output = getPath(entry.get('output'))
+        if output is None:
+            if scene is None:
+                raise RuntimeError("Scene {} of manifest {} is a new scene, it needs an 'output'".format(i, path))
+            base, extension = os.path.splitext(os.path.basename(scene))
+            output = '{}_rig{}'.format(base, extension if extension.lower() in ('.ma', '.mb') else '.ma')
+            output = os.path.join(output_dir or os.path.dirname(scene), output)
+        elif output_dir and not os.path.isabs(entry['output']):
+            output = os.path.join(output_dir, entry['output'])
+        build = dict(manifest.get('build', {}))
+        build.update(entry.get('build', {}))
+        jobs.append({
+            'scene': scene,
+            'templates': list(entry.get('templates', [])),
+            'templates_dir': getPath(entry.get('templates_dir', manifest.get('templates_dir'))),
+            'output': output,
+            'build': build,
+        })
+    return jobs
+
+
+def initWorker(stand_in):
+    '''
+    Starts Maya, or the stand-in, in a worker process
+    '''
+    if stand_in:
+        from . import mayaStandIn
+        mayaStandIn.install()
+    else:
+        import maya.standalone
+        maya.standalone.initialize(name='python')
+
+
+def rigScene(job):
+    '''
+    Rigs one scene of a manifest, in a worker process
+    Args:
+        job: (dict) from readManifest
+    Returns:
+        result: (dict) the job's 'scene' and 'output', 'times' (step -> seconds), 'total' (seconds), 'guides',
+            'nodes' and 'connections' of the rig, and 'error' and 'traceback' (None if the scene was rigged)
+    '''
+    # these need Maya, which initWorker starts
+    import maya.cmds as cmds
+    from . import ghostControlRigger as r
+    from . import templates
+
+    result = {'scene': job['scene'], 'output': job['output'], 'times': {}, 'total': 0.0, 'guides': 0, 'nodes': 0,
+              'connections': 0, 'error': None, 'traceback': None}
+    start = time.time()
+    step_start = start
+    try:
+        for step in steps:
+            if step == 'open':
+                cmds.file(new=True, force=True)
+                if job['scene']:
+                    cmds.file(job['scene'], open=True, force=True)
+            elif step == 'import':
+                # a worker rigs many scenes, one without a templates_dir mustn't use the one of the scene before
+                templates.set_templates_Dir(job['templates_dir'] or templates.default_templates_Dir)
+                if job['templates']:
+                    templates.template_import_many(job['templates'])
+                cmds.select(clear=True)
+            elif step == 'build':
+                r.buildControls(**job['build'])
+                guides = cmds.listRelatives(r.all_guides_grp, ad=True, typ='transform') or []
+                result['guides'] = len(guides)
+                result.update(r.getRigStats() or {})
+            else:
+                output_dir = os.path.dirname(job['output'])
+                if output_dir and not os.path.isdir(output_dir):
+                    os.makedirs(output_dir)
+                file_type = 'mayaBinary' if job['output'].lower().endswith('.mb') else 'mayaAscii'
+                cmds.file(rename=job['output'])
+                cmds.file(save=True, force=True, type=file_type)
+            now = time.time()
+            result['times'][step] = now - step_start
+            step_start = now
+    except Exception as error:
+        # a scene that fails, for any reason, mustn't stop the batch
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+        result['traceback'] = traceback.format_exc()
+    result['total'] = time.time() - start
+    return result
+
+
+def rigScenes(jobs, processes=None, stand_in=False, stream=None):
+    '''
+    Rigs the scenes of a manifest in a pool of worker processes
+    Args:
+        jobs: (list) from readManifest
+        processes: (int) number of worker processes, None for one per CPU
+        stand_in: (bool) run the workers on the Maya stand-in instead of Maya
+        stream: file to print a line to as each scene is done, None for stdout
+    Returns:
+        results: (list) rigScene result of every job, in the order of the jobs
+    '''
+    stream = stream or sys.stdout
+    if not jobs:
+        return []
+    processes = max(1, min(processes or multiprocessing.cpu_count(), len(jobs)))
+    results = [None] * len(jobs)
+    # unlike multiprocessing.Pool, the executor notices a worker that crashed with Maya instead of waiting for it
+    executor = concurrent.futures.ProcessPoolExecutor(processes, thumbnails.getPoolContext(), initWorker,
+                                                      (stand_in,))
+    with executor:
+        futures = dict((executor.submit(rigScene, job), i) for i, job in enumerate(jobs))
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as error:
+                results[i] = {'scene': jobs[i]['scene'], 'output': jobs[i]['output'], 'times': {}, 'total': 0.0,
+                              'guides': 0, 'nodes': 0, 'connections': 0,
+                              'error': 'Worker process stopped: {}: {}'.format(type(error).__name__, error),
+                              'traceback': None}
+            printResult(results[i], stream)
+    return results
+
+
+def printResult(result, stream):
+    '''
+    Prints one line about a rigged scene, and the error if it failed
+    '''
+    name = result['scene'] or result['output']
+    if result['error']:
+        stream.write('ERROR  {}\n       {}\n'.format(name, result['error']))
+    else:
+        stream.write('ok     {}  {} guides, {} nodes, {:.2f}s ({})\n'.format(
+            name, result['guides'], result['nodes'], result['total'],
+            ', '.join('{} {:.2f}s'.format(step, result['times'][step]) for step in steps)))
+    stream.flush()
+
+
+def getTotals(results):
+    '''
+    Returns:
+        totals: (dict) 'scenes', 'failed', 'guides', 'nodes', and 'times' (step -> seconds summed over the scenes)
+    '''
+    totals = {'scenes': len(results), 'failed': 0, 'guides': 0, 'nodes': 0, 'times': dict.fromkeys(steps, 0.0)}
+    for result in results:
+        if result['error']:
+            totals['failed'] += 1
+            continue
+        totals['guides'] += result['guides']
+        totals['nodes'] += result['nodes']
+        for step, seconds in result['times'].items():
+            totals['times'][step] += seconds
+    return totals
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Import guide templates and build controls in many scenes.')
+    parser.add_argument('manifest', help='JSON manifest of the scenes and their templates')
+    parser.add_argument('--jobs', type=int, help='worker processes, one per CPU by default. Each runs a Maya')
+    parser.add_argument('--stand-in', action='store_true', help='run the workers on the Maya stand-in')
+    parser.add_argument('--report', help='write the result of every scene to this JSON file')
+    options = parser.parse_args(args)
+
+    try:
+        jobs = readManifest(options.manifest)
+    except RuntimeError as error:
+        parser.error(str(error))
+    start = time.time()
+    results = rigScenes(jobs, options.jobs, options.stand_in)
+    totals = getTotals(results)
+    print('\n{scenes} scenes, {failed} failed, {guides} guides, {nodes} rig nodes'.format(**totals))
+    print('Rigged in {:.2f}s ({})'.format(time.time() - start, ', '.join(
+        '{} {:.2f}s'.format(step, totals['times'][step]) for step in steps)))
+    if options.report:
+        with open(options.report, 'w') as f:
+            json.dump({'manifest': os.path.abspath(options.manifest), 'stand_in': options.stand_in,
+                       'totals': totals, 'results': results}, f, indent=2)
+    return 1 if totals['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
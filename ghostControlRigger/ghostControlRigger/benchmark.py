@@ -0,0 +1,359 @@
+'''
+Scaling benchmarks for buildControls
+
+Builds synthetic guide hierarchies in the Maya stand-in (see mayaStandIn.py) and reports the wall time
+and the maya.cmds call counts of every build phase, for guide counts from 10 to 10,000 at different
+hierarchy depths and branching factors.
+
+Times are stand-in times, so compare them between builds and code changes rather than with Maya.
+Call counts are what a real Maya build would make.
+
+How to run (from the folder that holds the ghostControlRigger package, with a plain Python, not mayapy):
+python -m ghostControlRigger.benchmark
+python -m ghostControlRigger.benchmark --sizes 10 100 1000 --shapes 1x0 4x3 --backends cmds api --incremental
+python -m ghostControlRigger.benchmark --json results.json
+python -m ghostControlRigger.benchmark --sizes 10 1000 --check-budgets
+python -m ghostControlRigger.benchmark --sizes 100 1000 --wiring direct matrix lean --playback 24
+
+With --check-budgets every build is also recorded with instrument.py and checked against the call budgets
+in instrument.build_budgets. The command exits with an error as soon as a build goes over budget.
+
+With --playback every full build is also played back for the given number of frames: each frame sets new
+values on every control and Extra group, as animation curves would, then evaluates the world matrix of every
+joint. It reports the time and the number of plug reads per frame, together with the node and connection
+count of the scene, so the wiring modes (ghostControlRigger.wiring_modes) can be compared. The stand-in
+evaluates every plug again on every frame, without Maya's dirty propagation, caching or parallel evaluation, so
+its plug reads and times say little about how fast a wiring mode plays in Maya. Node and connection counts are
+the numbers to compare; evaluation speed has to be measured in Maya, e.g. with the Evaluation Toolkit.
+'''
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import math
+import random
+import sys
+import time
+
+from . import mayaStandIn
+
+if not mayaStandIn.install():
+    raise RuntimeError('The benchmarks run against the Maya stand-in. Run them with a plain Python interpreter.')
+
+import maya.cmds as cmds
+import maya.api.OpenMaya as om
+
+from . import apiBackend
+from . import curves
+from . import ghostControlRigger as r
+from . import instrument
+
+
+default_sizes = (10, 100, 1000, 10000)
+# depth x branching factor. 1x0 is a flat list of guides
+default_shapes = ('1x0', '3x4', '6x2', '12x1')
+
+# build phases, in the order buildControls runs them: (label, module, function name)
+phases = (
+    ('selection', r, 'get_selected_curves'),
+    ('setup', r, 'getBuiltFingerprints'),
+    ('setup', r, 'setup'),
+    ('guide queries', r, 'getWorldMatrices'),
+    ('guide queries', curves, 'getCurveDataForNodes'),
+    ('guide queries', r, 'getGuideFingerprints'),
+    ('create', r, 'makeControl'),
+    ('create', r, 'addControlShapes'),
+    ('create', r, 'make_wControl'),
+    ('create', apiBackend, 'buildRig'),
+    ('update', r, 'updateRig'),
+    ('update', r, 'deleteRemovedControls'),
+    ('connect', r, 'connectControlsTojointDrivers'),
+    ('fingerprints', r, 'storeFingerprint'),
+    ('cleanup', r, 'deleteUnusedConstructionHistory'),
+    ('visibility', r, 'exitEditMode'),
+)
+
+
+def circleData(radius=1.0):
+    '''
+    Returns curve data of a closed degree 3 circle, in the format of curves.getCurveData
+    '''
+    cvs = []
+    for i in range(8):
+        angle = 2.0 * math.pi * i / 8.0
+        cvs.append([math.cos(angle) * radius, 0.0, math.sin(angle) * radius])
+    return {'cvs': cvs + cvs[:3], 'knots': [float(i) for i in range(-2, 11)], 'degree': 3, 'form': 3}
+
+
+def makeGuide(name, parent, rnd, dag_mod):
+    '''
+    Creates a circle guide with a random local transform under the given parent.
+    Its shape is queued on dag_mod
+    '''
+    guide = cmds.createNode('transform', n=name, p=parent)
+    cmds.setAttr(guide + '.t', rnd.uniform(-2, 2), rnd.uniform(0, 4), rnd.uniform(-2, 2))
+    cmds.setAttr(guide + '.r', rnd.uniform(-45, 45), rnd.uniform(-45, 45), rnd.uniform(-45, 45))
+    curves.createCurveShapes(dag_mod, [circleData(rnd.uniform(0.5, 2.0))], guide, guide)
+    return guide
+
+
+def makeGuideHierarchy(count, depth, branching, seed=0):
+    '''
+    Creates guides under the guides group as trees of the given depth and branching factor.
+    New trees are started until count guides exist.
+    Args:
+        count: (int) number of guides
+        depth: (int) number of levels in each tree
+        branching: (int) number of children of every guide above the last level
+        seed: (int) seed of the random guide transforms
+    Returns:
+        guides: (list) names of the guides
+    '''
+    rnd = random.Random(seed)
+    cmds.group(em=True, n=r.all_guides_grp)
+    dag_mod = om.MDagModifier()
+    guides = []
+    while len(guides) < count:
+        root = makeGuide('guide{}'.format(len(guides)), r.all_guides_grp, rnd, dag_mod)
+        guides.append(root)
+        queue = collections.deque([(root, 1)])
+        while queue and len(guides) < count:
+            parent, level = queue.popleft()
+            if level >= depth:
+                continue
+            for i in range(branching):
+                if len(guides) >= count:
+                    break
+                child = makeGuide('guide{}'.format(len(guides)), parent, rnd, dag_mod)
+                guides.append(child)
+                queue.append((child, level + 1))
+    apiBackend.doIt(dag_mod)
+    cmds.select(cl=True)
+    return guides
+
+
+@contextlib.contextmanager
+def phaseTimers(results):
+    '''
+    Wraps the build phase functions so their time and maya.cmds calls are added to results.
+    Calls made by a phase inside another phase count towards the outer one.
+    Args:
+        results: (dict) label -> {'time': float, 'calls': Counter}, filled in while the block runs
+    '''
+    active = []
+    originals = []
+
+    def timed(label, function):
+        def wrapper(*args, **kwargs):
+            if active:
+                return function(*args, **kwargs)
+            active.append(label)
+            calls_before = collections.Counter(mayaStandIn.scene.calls)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                phase = results.setdefault(label, {'time': 0.0, 'calls': collections.Counter()})
+                phase['time'] += time.perf_counter() - start
+                phase['calls'].update(mayaStandIn.scene.calls - calls_before)
+                active.pop()
+        return wrapper
+
+    for label, module, name in phases:
+        function = getattr(module, name)
+        originals.append((module, name, function))
+        setattr(module, name, timed(label, function))
+    try:
+        yield results
+    finally:
+        for module, name, function in originals:
+            setattr(module, name, function)
+
+
+def timeBuild(guide_count, budget=None, **build_options):
+    '''
+    Runs buildControls on the current stand-in scene and measures it
+    Args:
+        guide_count: (int) number of guides in the scene, used for per guide numbers
+        budget: (dict) call budget from instrument.build_budgets to check the build against
+        build_options: passed on to buildControls
+    Returns:
+        result: (dict) 'time', 'calls', 'calls_per_guide' and per phase 'phases'
+    '''
+    mayaStandIn.resetCalls()
+    phase_results = collections.OrderedDict()
+    recorder = instrument.CallRecorder()
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if budget:
+            stack.enter_context(instrument.recording(recorder=recorder))
+        stack.enter_context(phaseTimers(phase_results))
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        r.buildControls(**build_options)
+    total_time = time.perf_counter() - start
+    if budget:
+        instrument.checkBudget(recorder, guide_count, budget)
+    total_calls = sum(mayaStandIn.scene.calls.values())
+
+    phase_calls = collections.Counter()
+    for phase in phase_results.values():
+        phase_calls.update(phase['calls'])
+    other_calls = mayaStandIn.scene.calls - phase_calls
+    phase_results['other'] = {'time': total_time - sum(phase['time'] for phase in phase_results.values()),
+                              'calls': other_calls}
+
+    return {
+        'time': total_time,
+        'calls': total_calls,
+        'calls_per_guide': float(total_calls) / guide_count,
+        'phases': collections.OrderedDict(
+            (label, {'time': phase['time'], 'calls': dict(phase['calls'])})
+            for label, phase in phase_results.items() if phase['time'] or phase['calls']),
+    }
+
+
+def sceneStats():
+    '''
+    Counts the nodes, per node type, and the connections in the stand-in scene, guides included
+    '''
+    node_types = collections.Counter(node.type for node in mayaStandIn.scene.nodes.values())
+    return {'nodes': sum(node_types.values()), 'node_types': dict(node_types),
+            'connections': len(mayaStandIn.scene.connections)}
+
+
+def timePlayback(frames, seed=0):
+    '''
+    Plays back the built rig in the stand-in scene. Every frame sets new translate and rotate values on all
+    controls and Extra groups, then evaluates the world matrix of every joint.
+    Args:
+        frames: (int) number of frames to play
+        seed: (int) seed of the random control values
+    Returns:
+        result: (dict) 'frames', 'time_per_frame' and 'reads_per_frame', the plug values read per frame
+    '''
+    scene = mayaStandIn.scene
+    rnd = random.Random(seed)
+    animated = [node for name, node in scene.nodes.items() if name.endswith(('_ctr', '_ctr_Extra'))]
+    joints = [node for node in scene.nodes.values() if node.type == 'joint']
+
+    reads = [0]
+    get_value = scene.getValue
+
+    def countedGetValue(node, attr):
+        reads[0] += 1
+        return get_value(node, attr)
+
+    scene.getValue = countedGetValue
+    start = time.perf_counter()
+    try:
+        for frame in range(frames):
+            for node in animated:
+                node.attrs['translate'] = [rnd.uniform(-1.0, 1.0) for axis in range(3)]
+                node.attrs['rotate'] = [rnd.uniform(-45.0, 45.0) for axis in range(3)]
+            for joint in joints:
+                scene.worldMatrix(joint)
+    finally:
+        del scene.getValue
+    total_time = time.perf_counter() - start
+    return {'frames': frames,
+            'time_per_frame': total_time / max(frames, 1),
+            'reads_per_frame': float(reads[0]) / max(frames, 1)}
+
+
+def runBenchmark(sizes=default_sizes, shapes=default_shapes, backends=('cmds',), incremental=False, seed=0,
+                 check_budgets=False, wirings=('direct',), playback=0):
+    '''
+    Builds every combination of guide count, hierarchy shape, backend and wiring mode
+    Args:
+        sizes: (list) guide counts
+        shapes: (list) hierarchy shapes as 'DEPTHxBRANCHING' strings
+        backends: (list) buildControls backends to measure
+        incremental: (bool) also measure an incremental rebuild after moving one guide
+        seed: (int) seed of the random guide transforms
+        check_budgets: (bool) check every build against instrument.build_budgets
+        wirings: (list) buildControls wiring modes to measure
+        playback: (int) frames to play back after every full build, 0 to skip playback
+    Returns:
+        results: (list) one dict per build
+    '''
+    results = []
+    for size in sizes:
+        for shape in shapes:
+            depth, branching = [int(value) for value in shape.lower().split('x')]
+            for backend in backends:
+                for wiring in wirings:
+                    mayaStandIn.resetScene()
+                    guides = makeGuideHierarchy(size, depth, branching, seed)
+                    info = {'guides': size, 'shape': shape, 'backend': backend, 'wiring': wiring}
+                    budget = instrument.build_budgets[backend] if check_budgets else None
+                    result = timeBuild(size, budget, backend=backend, wiring=wiring)
+                    result.update(info, build='full', stats=sceneStats())
+                    if playback:
+                        result['playback'] = timePlayback(playback, seed)
+                    results.append(result)
+                    report([result])
+
+                    if incremental and backend == 'cmds':
+                        cmds.setAttr(guides[len(guides) // 2] + '.t', 0.5, 1.5, 0.5)
+                        budget = instrument.build_budgets['incremental'] if check_budgets else None
+                        result = timeBuild(size, budget, backend=backend, incremental=True, wiring=wiring)
+                        result.update(info, build='incremental')
+                        results.append(result)
+                        report([result])
+    return results
+
+
+def report(results, stream=None):
+    '''
+    Prints a readable summary of benchmark results
+    '''
+    stream = stream or sys.stdout
+    for result in results:
+        stream.write('{guides:>6} guides  {shape:>5}  {backend:>4}  {wiring:<6}  {build:<11}  {time:9.3f}s  '
+                     '{calls:>8} calls  {calls_per_guide:7.2f} calls/guide\n'.format(**result))
+        if 'stats' in result:
+            stream.write('        {:<14} {} nodes, {} connections  ({})\n'.format(
+                'scene', result['stats']['nodes'], result['stats']['connections'],
+                ', '.join('{} {}'.format(node_type, count)
+                          for node_type, count in sorted(result['stats']['node_types'].items()))))
+        if 'playback' in result:
+            stream.write('        {:<14} {:9.3f}ms/frame  {:.0f} plug reads/frame over {} frames\n'.format(
+                'playback', result['playback']['time_per_frame'] * 1000.0, result['playback']['reads_per_frame'],
+                result['playback']['frames']))
+        for label, phase in result['phases'].items():
+            top_calls = sorted(phase['calls'].items(), key=lambda item: -item[1])
+            stream.write('        {:<14} {:9.3f}s  {}\n'.format(
+                label, phase['time'], ', '.join('{} {}'.format(name, count) for name, count in top_calls) or '-'))
+    stream.flush()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark buildControls on synthetic guide hierarchies.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help='guide counts')
+    parser.add_argument('--shapes', nargs='+', default=default_shapes,
+                        help='hierarchy shapes as DEPTHxBRANCHING, 1x0 is flat')
+    parser.add_argument('--backends', nargs='+', default=['cmds'], choices=r.build_backends)
+    parser.add_argument('--incremental', action='store_true',
+                        help='also time an incremental rebuild after moving one guide')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check-budgets', action='store_true',
+                        help='fail if a build makes more maya.cmds calls than instrument.build_budgets allows')
+    parser.add_argument('--wiring', nargs='+', default=['direct'], choices=r.wiring_modes,
+                        help='wiring modes to build with')
+    parser.add_argument('--playback', type=int, default=0, metavar='FRAMES',
+                        help='play back every full build for this many frames and report evaluation cost')
+    parser.add_argument('--json', help='write the results to this file')
+    options = parser.parse_args(args)
+
+    results = runBenchmark(options.sizes, options.shapes, options.backends, options.incremental, options.seed,
+                           options.check_budgets, options.wiring, options.playback)
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# Cooperative build scheduler
+#
+# buildControls keeps Maya busy until the whole rig is built. BuildScheduler runs the same build from Maya's
+# idle queue (maya.utils.executeDeferred) instead: each time Maya is idle it runs steps of
+# ghostControlRigger.iterBuildControls for a short time slice and queues itself again, so Maya redraws and the
+# UI can show the progress of every phase. A build that runs every step gives the same rig as buildControls.
+#
+# A build can be cancelled between steps. A cancelled build, or one that fails, is rolled back to the scene it
+# started from: the build runs in one undo chunk, which is undone. OpenMaya modifiers run through an undoable
+# command (see apiBackend.doIt), so their changes are in the chunk too. The chunk is only undone if it's the last
+# step on the undo queue, a build that changed nothing leaves no chunk and undoing would undo the step before it,
+# which may be an earlier build. Each build's chunk has a name of its own.
+# Anything done anywhere in Maya while a build runs ends up in its undo chunk and would be rolled back with it, so
+# the UI has to block all of Maya meanwhile, with an application modal dialog.
+#
+# How to run:
+# from ghostControlRigger import buildScheduler
+# scheduler = buildScheduler.BuildScheduler(progress=lambda phase, done, total: print(phase, done, total),
+#                                           finished=lambda status, error: print(status, error), backend='api')
+# scheduler.start()
+# scheduler.cancel()
+
+import itertools
+import time
+
+import maya.cmds as cmds
+import maya.utils
+
+from . import ghostControlRigger as r
+
+# numbers the undo chunks of the builds of a session
+build_ids = itertools.count(1)
+
+
+class BuildScheduler(object):
+    '''
+    Runs a build in steps from Maya's idle queue, see the module docs
+    '''
+
+    # seconds of building per idle call
+    time_slice = 0.05
+    undo_chunk_name = 'ghostControlRiggerBuild'
+
+    def __init__(self, progress=None, finished=None, **build_options):
+        '''
+        Args:
+            progress: (function) called with (phase, done, total) after every step, see iterBuildControls
+            finished: (function) called with (status, error) when the build is over. status is 'done',
+                'cancelled' or 'failed', error is the exception a failed build raised, otherwise None
+            build_options: arguments of ghostControlRigger.iterBuildControls
+        '''
+        self.progress = progress
+        self.finished = finished
+        self.build_options = build_options
+        self.steps = None
+        # 'ready', 'running', then 'done', 'cancelled' or 'failed'
+        self.status = 'ready'
+        self.cancel_requested = False
+        self.error = None
+        # undo state when the build started, the build is only rolled back if it was on
+        self.undo_enabled = False
+        self.chunk_name = '{}{}'.format(self.undo_chunk_name, next(build_ids))
+
+    def start(self):
+        '''
+        Queues the first step of the build
+        '''
+        if self.status != 'ready':
+            raise RuntimeError('A build scheduler can only run once')
+        self.undo_enabled = cmds.undoInfo(q=True, state=True)
+        if not self.undo_enabled:
+            print('Undo is turned off, a cancelled or failed build will not be rolled back')
+        cmds.undoInfo(openChunk=True, chunkName=self.chunk_name)
+        self.steps = r.iterBuildControls(**self.build_options)
+        self.status = 'running'
+        maya.utils.executeDeferred(self.step)
+
+    def cancel(self):
+        '''
+        Stops the build and rolls it back before its next step
+        '''
+        if self.status == 'running':
+            self.cancel_requested = True
+
+    def isRunning(self):
+        return self.status == 'running'
+
+    def step(self):
+        '''
+        Runs steps of the build for time_slice seconds and queues the next call
+        '''
+        if self.status != 'running':
+            return
+        if self.cancel_requested:
+            self.rollBack()
+            return
+        end = time.time() + self.time_slice
+        try:
+            while not self.cancel_requested:
+                phase, done, total = next(self.steps)
+                if self.progress:
+                    self.progress(phase, done, total)
+                if time.time() >= end:
+                    break
+        except StopIteration:
+            self.finish('done')
+            return
+        except Exception as error:
+            # whatever the error, the undo chunk has to be closed, or the rest of the Maya session would end up in it
+            self.error = error
+            self.rollBack('failed')
+            return
+        maya.utils.executeDeferred(self.step)
+
+    def rollBack(self, status='cancelled'):
+        '''
+        Undoes everything the build did so far
+        Args:
+            status: (string) 'cancelled' or 'failed'
+        '''
+        self.steps.close()
+        cmds.undoInfo(closeChunk=True)
+        if self.undo_enabled and cmds.undoInfo(q=True, undoName=True) == self.chunk_name:
+            cmds.undo()
+        self.finish(status, close_chunk=False)
+
+    def finish(self, status, close_chunk=True):
+        if close_chunk:
+            cmds.undoInfo(closeChunk=True)
+        self.status = status
+        if self.finished:
+            self.finished(status, self.error)
@@ -0,0 +1,335 @@
+# Template catalog
+#
+# A sidecar file in the templates directory, .template_catalog.json, that keeps what the UI needs to know about
+# every template: file size, mtime, content hash, guide count, guide names and guide hash.
+#
+# {
+#     "format": "ghostControlRigger.catalog",
+#     "version": 3,
+#     "templates": {
+#         "collar.ma": {"size": 2495, "mtime": 1666000000.0, "hash": "9f2c...", "guides": 1,
+#                       "names": ["collar"], "guide_hash": "41d7...", "error": null},
+#     }
+# }
+#
+# refreshCatalog lists the directory once and only reads the templates whose size or mtime changed since the
+# catalog was written, so opening a library that hasn't changed doesn't open a single template.
+# Templates that can't be read, like files that aren't Maya ASCII or hold no guide curves, stay in the catalog with
+# an "error" so they aren't read again until they change.
+# The catalog is written through a temporary file, so artists refreshing the same directory never see half a file.
+# If the directory isn't writable the catalog is still returned, it just isn't saved.
+#
+# The guide hash is templateFormat.hashTemplate of the guides in the file. Unlike the file hash it only changes
+# when the guides do, so template export compares it with the guides it's about to write and skips the write if
+# they're the same. It's null for .ma templates whose curves can only be read by Maya.
+#
+# This module doesn't need Maya.
+#
+# How to run:
+# from ghostControlRigger import catalog
+# catalog.getTemplates('/path/to/guide_templates')
+# catalog.refreshCatalog('/path/to/guide_templates')['templates']['collar.ma']['names']
+
+import hashlib
+import json
+import os
+
+from . import maParser
+from . import templateFormat
+
+catalog_filename = '.template_catalog.json'
+catalog_format = 'ghostControlRigger.catalog'
+# version 3 records files without guides as errors, older catalogs listed them as templates with 0 guides
+catalog_version = 3
+
+# files listed as templates, see templates.template_import
+template_extensions = ('.ma', templateFormat.template_extension)
+
+
+def getCatalogPath(directory):
+    '''
+    Returns the path of the catalog file of a templates directory
+    '''
+    return os.path.join(directory, catalog_filename)
+
+
+def isTemplateName(filename):
+    '''
+    Returns True if a file name in a templates directory is a guide template
+    '''
+    return not filename.startswith('.') and filename.lower().endswith(template_extensions)
+
+
+def makeCatalog():
+    '''
+    Returns an empty catalog
+    '''
+    return {'format': catalog_format, 'version': catalog_version, 'templates': {}}
+
+
+def loadCatalog(directory):
+    '''
+    Reads the catalog of a templates directory
+    Args:
+        directory: (string) templates directory
+    Returns:
+        catalog: (dict) an empty catalog if there is none yet, or it can't be read or is from another version
+    '''
+    path = getCatalogPath(directory)
+    try:
+        with open(path) as f:
+            catalog = json.load(f)
+    except (EnvironmentError, ValueError):
+        return makeCatalog()
+    if (not isinstance(catalog, dict) or catalog.get('format') != catalog_format
+            or catalog.get('version') != catalog_version):
+        return makeCatalog()
+    return catalog
+
+
+def saveCatalog(directory, catalog):
+    '''
+    Writes the catalog of a templates directory through a temporary file
+    Args:
+        directory: (string) templates directory
+        catalog: (dict) catalog to write
+    Returns:
+        saved: (bool) False if the directory isn't writable
+    '''
+    path = getCatalogPath(directory)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temp_path, 'w') as f:
+            json.dump(catalog, f, separators=(',', ':'))
+        os.replace(temp_path, path)
+    except EnvironmentError as error:
+        print('Template catalog not saved: {}'.format(error))
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    return True
+
+
+def hashFile(path, block_size=1 << 20):
+    '''
+    Returns the sha1 hex digest of a file's content
+    '''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def getTemplateNames(template):
+    '''
+    Returns the names of the guides with curves in template data
+    '''
+    return [guide['name'] for guide in template['guides'] if guide['curves']]
+
+
+def readGuides(path, text=None):
+    '''
+    Reads the guides of a template file without Maya
+    Args:
+        path: (string) .ma or compact template file
+        text: (string) content of the file, read from path if None. Then path only names the template
+    Returns:
+        names: (list) guide names
+        guide_hash: (string) templateFormat.hashTemplate of the guides, None if only Maya can read their curves
+    Raises RuntimeError if the file isn't a template or has no guide curves
+    '''
+    if templateFormat.isTemplateFile(path):
+        if text is None:
+            template = templateFormat.readTemplate(path)
+        else:
+            template = templateFormat.parseTemplate(text, path)
+        names = getTemplateNames(template)
+        if not names:
+            raise RuntimeError('No guide curves found in {}'.format(path))
+        return names, templateFormat.hashTemplate(template)
+    if text is None:
+        info = maParser.parseFile(path)
+    else:
+        info = maParser.parseLines(text.splitlines(True), path)
+    names = [guide_path.split('|')[-1] for guide_path in maParser.getGuidePaths(info)]
+    if not names:
+        raise RuntimeError('No guide curves found in {}'.format(path))
+    try:
+        guide_hash = templateFormat.hashTemplate(maParser.toTemplate(info))
+    except RuntimeError:
+        guide_hash = None
+    return names, guide_hash
+
+
+def getGuideNames(path):
+    '''
+    Returns the names of the guides in a template file, read without Maya
+    Args:
+        path: (string) .ma or compact template file
+    '''
+    if templateFormat.isTemplateFile(path):
+        return getTemplateNames(templateFormat.readTemplate(path))
+    return [guide_path.split('|')[-1] for guide_path in maParser.getGuidePaths(maParser.parseFile(path))]
+
+
+def readEntry(path, stat, entry=None, template=None):
+    '''
+    Returns the catalog entry of a template file
+    Args:
+        path: (string) template file
+        stat: os.stat result of the file
+        entry: (dict) the file's previous catalog entry. Its guides are kept if the content hash didn't change
+        template: (dict) template data the file was just written from. Its guides are used instead of reading them
+    Returns:
+        entry: (dict) with 'size', 'mtime', 'hash', 'guides' (count), 'names', 'guide_hash' and 'error' (None if the
+            file was read)
+    '''
+    new_entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': None, 'guides': 0, 'names': [],
+                 'guide_hash': None, 'error': None}
+    try:
+        new_entry['hash'] = hashFile(path)
+        if template is not None:
+            new_entry['names'] = getTemplateNames(template)
+            new_entry['guide_hash'] = templateFormat.hashTemplate(template)
+        elif entry and entry.get('hash') == new_entry['hash'] and not entry.get('error'):
+            new_entry['names'] = entry['names']
+            new_entry['guide_hash'] = entry.get('guide_hash')
+        else:
+            new_entry['names'], new_entry['guide_hash'] = readGuides(path)
+    except (RuntimeError, EnvironmentError, ValueError, IndexError, KeyError, TypeError) as error:
+        new_entry['error'] = '{}: {}'.format(type(error).__name__, error)
+    new_entry['guides'] = len(new_entry['names'])
+    return new_entry
+
+
+def iterRefreshCatalog(directory, catalog, save=True):
+    '''
+    Brings a catalog up to date one template at a time, for callers that show templates as they are found.
+    Only templates that were added or whose size or mtime changed are read, entries of deleted templates are
+    dropped. The catalog is updated and saved once the last template was yielded
+    Args:
+        directory: (string) templates directory
+        catalog: (dict) the directory's catalog from loadCatalog, updated in place
+        save: (bool) write the catalog back if anything changed
+    Yields:
+        (file name, catalog entry) of every template in the directory, sorted by file name
+    '''
+    entries = catalog['templates']
+    found = {}
+    changed = False
+    dir_entries = sorted((dir_entry for dir_entry in os.scandir(directory) if isTemplateName(dir_entry.name)),
+                         key=lambda dir_entry: dir_entry.name)
+    for dir_entry in dir_entries:
+        if not dir_entry.is_file():
+            continue
+        stat = dir_entry.stat()
+        entry = entries.get(dir_entry.name)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entry = readEntry(dir_entry.path, stat, entry)
+            changed = True
+        found[dir_entry.name] = entry
+        yield dir_entry.name, entry
+    changed = changed or len(found) != len(entries)
+    catalog['templates'] = found
+    if changed and save:
+        saveCatalog(directory, catalog)
+
+
+def iterRefreshEntries(directory, catalog, filenames, save=True):
+    '''
+    Brings the catalog entries of some templates up to date, without listing the rest of the directory. Like
+    iterRefreshCatalog, a template is only read if it's new or its size or mtime changed
+    Args:
+        directory: (string) templates directory
+        catalog: (dict) the directory's catalog from loadCatalog, updated in place
+        filenames: (list) file names of the templates
+        save: (bool) write the catalog back if anything changed
+    Yields:
+        (file name, catalog entry) of every template in filenames, sorted. The entry is None if there is no such file
+    '''
+    entries = catalog['templates']
+    changed = False
+    for filename in sorted(filenames):
+        path = os.path.join(directory, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is None or not os.path.isfile(path):
+            changed = entries.pop(filename, None) is not None or changed
+            yield filename, None
+            continue
+        entry = entries.get(filename)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entry = readEntry(path, stat, entry)
+            entries[filename] = entry
+            changed = True
+        yield filename, entry
+    if changed and save:
+        saveCatalog(directory, catalog)
+
+
+def getEntry(directory, filename, template=None):
+    '''
+    Brings the catalog entry of one template up to date, without looking at the rest of the directory
+    Args:
+        directory: (string) templates directory
+        filename: (string) file name of the template
+        template: (dict) template data the file was just written from, see readEntry
+    Returns:
+        entry: (dict) catalog entry, None if there is no such file
+    '''
+    catalog = loadCatalog(directory)
+    entries = catalog['templates']
+    try:
+        stat = os.stat(os.path.join(directory, filename))
+    except OSError:
+        if entries.pop(filename, None) is not None:
+            saveCatalog(directory, catalog)
+        return None
+    entry = entries.get(filename)
+    if template is not None or entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+        entry = readEntry(os.path.join(directory, filename), stat, entry, template)
+        entries[filename] = entry
+        saveCatalog(directory, catalog)
+    return entry
+
+
+def refreshCatalog(directory, save=True):
+    '''
+    Brings the catalog of a templates directory up to date, see iterRefreshCatalog
+    Args:
+        directory: (string) templates directory
+        save: (bool) write the catalog back if anything changed
+    Returns:
+        catalog: (dict) the up to date catalog
+    '''
+    catalog = loadCatalog(directory)
+    for name, entry in iterRefreshCatalog(directory, catalog, save):
+        pass
+    return catalog
+
+
+def getTemplateEntries(directory):
+    '''
+    Returns the catalog entries of the readable templates in a templates directory
+    Args:
+        directory: (string) templates directory
+    Returns:
+        templates: (list) (file name, catalog entry) pairs, sorted by file name
+    '''
+    templates = sorted(refreshCatalog(directory)['templates'].items())
+    for name, entry in templates:
+        if entry['error']:
+            print('Skipping unreadable template {}: {}'.format(name, entry['error']))
+    return [(name, entry) for name, entry in templates if not entry['error']]
+
+
+def getTemplates(directory):
+    '''
+    Returns the file names of the readable templates in a templates directory, sorted
+    Args:
+        directory: (string) templates directory
+    '''
+    return [name for name, entry in getTemplateEntries(directory)]
@@ -0,0 +1,144 @@
+# This contains functions for reading nurbsCurve data from guides and building curve shapes from it
+
+import maya.api.OpenMaya as om
+
+from . import templateFormat
+
+
+def getCurveData(transform):
+    '''
+    Reads the data of every nurbsCurve shape under a transform
+    Args:
+        transform: (string) transform that holds the curve shapes
+    Returns:
+        curves: (list) one dict per shape with 'cvs', 'knots', 'degree', 'form' and 'display'
+    '''
+    sel = om.MSelectionList()
+    sel.add(transform)
+    return getCurveDataFromPath(sel.getDagPath(0))
+
+
+def getCurveDataForNodes(transforms):
+    '''
+    Reads the curve data of many transforms in one query
+    Args:
+        transforms: (list) transforms that hold the curve shapes
+    Returns:
+        curves: (dict) transform -> list of curve dicts, see getCurveData
+    '''
+    sel = om.MSelectionList()
+    for transform in transforms:
+        sel.add(transform)
+    curves = {}
+    for i in range(len(transforms)):
+        curves[transforms[i]] = getCurveDataFromPath(sel.getDagPath(i))
+    return curves
+
+
+def getCurveDataFromPath(path):
+    '''
+    Reads the data of every nurbsCurve shape under a transform
+    Args:
+        path: (MDagPath) transform that holds the curve shapes
+    Returns:
+        curves: (list) one dict per shape with 'cvs', 'knots', 'degree', 'form' and 'display'. 'display' holds the
+            display attributes of the shape that aren't at their default, see templateFormat.display_attrs
+    '''
+    curves = []
+    for i in range(path.childCount()):
+        child = path.child(i)
+        if not child.hasFn(om.MFn.kNurbsCurve):
+            continue
+        curve = om.MFnNurbsCurve(child)
+        if curve.isIntermediateObject:
+            continue
+        curves.append({
+            'cvs': [[point.x, point.y, point.z] for point in curve.cvPositions(om.MSpace.kObject)],
+            'knots': list(curve.knots()),
+            'degree': curve.degree,
+            'form': curve.form,
+            'display': getDisplayValues(curve),
+        })
+    return curves
+
+
+def getDisplayValues(node_fn):
+    '''
+    Returns the display attributes of a shape that aren't at their default
+    Args:
+        node_fn: (MFnDependencyNode) function set of the shape
+    Returns:
+        display: (dict) attribute name -> value
+    '''
+    display = {}
+    for name, short_name, attr_type, default in templateFormat.display_attrs:
+        plug = node_fn.findPlug(name, False)
+        if attr_type == 'bool':
+            value = plug.asBool()
+        elif attr_type == 'int':
+            value = plug.asInt()
+        else:
+            value = plug.asFloat()
+        if value != default:
+            display[name] = value
+    return display
+
+
+def createCurveShapes(dag_mod, curves, parent, name):
+    '''
+    Queues creating nurbsCurve shapes from curve data directly under a transform, with their display attributes.
+    The shapes are made when the modifier runs, see apiBackend.doIt
+    Args:
+        dag_mod: (MDagModifier) modifier the shapes are queued on
+        curves: (list) curve dicts from getCurveData
+        parent: (string or MObject) transform that receives the shapes
+        name: (string) shapes are named <name>Shape, <name>Shape1, ...
+    Returns:
+        shapes: (list) MObjects of the new shapes
+    '''
+    if not isinstance(parent, om.MObject):
+        sel = om.MSelectionList()
+        sel.add(parent)
+        parent = sel.getDependNode(0)
+
+    display_types = dict((attr, attr_type) for attr, short_name, attr_type, default in templateFormat.display_attrs)
+    shapes = []
+    for curve in curves:
+        data = om.MFnNurbsCurveData().create()
+        om.MFnNurbsCurve().create(om.MPointArray([om.MPoint(cv) for cv in curve['cvs']]),
+                                  om.MDoubleArray(curve['knots']),
+                                  curve['degree'],
+                                  curve['form'],
+                                  False,
+                                  False,
+                                  data)
+        shape = dag_mod.createNode('nurbsCurve', parent)
+        dag_mod.renameNode(shape, '{}Shape{}'.format(name, len(shapes) or ''))
+        shape_fn = om.MFnDependencyNode(shape)
+        # the curve is stored like Maya ASCII files store curves without history
+        dag_mod.newPlugValue(shape_fn.findPlug('cached', False), data)
+        for attr, value in (curve.get('display') or {}).items():
+            plug = shape_fn.findPlug(attr, False)
+            if display_types.get(attr) == 'bool':
+                dag_mod.newPlugValueBool(plug, value)
+            elif display_types.get(attr) == 'int':
+                dag_mod.newPlugValueInt(plug, value)
+            else:
+                dag_mod.newPlugValueFloat(plug, value)
+        shapes.append(shape)
+    return shapes
+
+
+def createCurveShapesForNodes(dag_mod, transforms, curves):
+    '''
+    Queues creating the curve shapes of many transforms, looking the transforms up in one query
+    Args:
+        dag_mod: (MDagModifier) modifier the shapes are queued on
+        transforms: (list) transforms that receive the shapes. Shapes are named after them
+        curves: (list) curve dicts from getCurveData for each transform
+    '''
+    sel = om.MSelectionList()
+    for transform in transforms:
+        sel.add(transform)
+    for i in range(len(transforms)):
+        createCurveShapes(dag_mod, curves[i], sel.getDependNode(i), transforms[i].split('|')[-1])
@@ -1,4 +1,11 @@
+import hashlib
+import json
+
 import maya.cmds as cmds
+import maya.api.OpenMaya as om
+
+from . import apiBackend
+from . import curves
 
 # To do:
 # Put check that guides have unique names from anything in scene. if so dont build and spit out warning message
@@ -7,6 +14,32 @@ all_guides_grp = 'guides'
 all_w_grp = 'all_w_group'
 all_controls_grp = 'clothing_controls'
 
+# Build engines buildControls can use:
+#   'cmds' - builds with maya.cmds, one guide at a time
+#   'api'  - builds with batched OpenMaya 2.0 modifiers, see apiBackend.py
+build_backends = ('cmds', 'api')
+
+# How wcontrols follow their controls:
+#   'direct' - translate, rotate and scale of the control and its Extra group are connected to
+#              the wcontrol and its Extra group, six connections per guide
+#   'matrix' - the wcontrol has no Extra group. A multMatrix of the control and Extra group matrices
+#              drives its offsetParentMatrix, three connections per guide. Needs Maya 2020 or later
+#   'lean'   - the w side is only a joint chain. A multMatrix of the control matrix, the Extra group matrix
+#              and the static offset to the parent joint drives each joint's offsetParentMatrix, with
+#              segmentScaleCompensate off. Same joint motion with four fewer transforms per guide.
+#              Needs Maya 2020 or later
+# benchmark.py --playback compares node and connection counts of the modes. How fast each one evaluates has to be
+# measured in Maya, the stand-in doesn't evaluate the way Maya does
+wiring_modes = ('direct', 'matrix', 'lean')
+
+# Phases iterBuildControls reports progress of, in the order they run
+build_phases = ('guides', 'create', 'connect', 'fingerprints', 'cleanup')
+# Guides handled per step of a phase by iterBuildControls
+build_chunk_size = 50
+
+# String attribute on each guide's _ctr_Offset group holding the fingerprint of the guide it was built from
+fingerprint_attr = 'guideFingerprint'
+
 
 def exitEditMode():
     cmds.hide(all_guides_grp)
@@ -20,283 +53,818 @@ def editMode():
     cmds.hide(all_controls_grp)
 
 
-def setup():
+def setup(clean=True):
     '''
     Makes empty groups to hold guides, controls and wcontrols
+    Args:
+        clean: (bool) delete existing controls and wcontrols. If False existing groups are kept
     '''
 
     # Create a group to hold all guides
     if not cmds.objExists(all_guides_grp):
         cmds.group(em=True, n=all_guides_grp)
 
+    # matrix and lean wiring drivers are DG nodes, so they don't go away with the groups
+    if clean:
+        drivers = getMatrixDrivers()
+        if drivers:
+            cmds.delete(drivers)
+
     # Create a group to hold all w_controls
-    if cmds.objExists(all_w_grp):
+    if clean and cmds.objExists(all_w_grp):
         cmds.delete(all_w_grp)
-    cmds.group(em=True, n=all_w_grp)
+    if not cmds.objExists(all_w_grp):
+        cmds.group(em=True, n=all_w_grp)
 
     # Create a group to hold all controls
-    if cmds.objExists(all_controls_grp):
+    if clean and cmds.objExists(all_controls_grp):
         cmds.delete(all_controls_grp)
-    cmds.group(em=True, n=all_controls_grp)
+    if not cmds.objExists(all_controls_grp):
+        cmds.group(em=True, n=all_controls_grp)
 
 
-def buildControls():
+def getMatrixDrivers():
+    '''
+    Returns the multMatrix nodes that drive the wcontrols or joints of a 'matrix' or 'lean' rig. They are found by
+    the attribute apiBackend.connectMatrixDrivers tags them with, other multMatrix nodes are left alone whatever
+    their names
+    '''
+    return cmds.ls('*.' + apiBackend.matrix_driver_attr, o=True) or []
+
+
+def buildControls(backend='cmds', incremental=False, wiring='direct', lean=False, clean_history=False):
     '''
     Makes anim controls, offset groups, joints, and all needed connections based on guides
+    Args:
+        backend: (string) build engine to use, one of build_backends
+        incremental: (bool) keep the existing controls and only create, update or delete
+            the ones whose guides changed since the last build
+        wiring: (string) how wcontrols follow controls, one of wiring_modes
+        lean: (bool) build the smallest rig that gives the same joint motion, the same as wiring='lean'
+        clean_history: (bool) also delete the circle history earlier versions of the tool left behind,
+            see deleteUnusedConstructionHistory
+    The build is one step on Maya's undo queue
     '''
 
+    cmds.undoInfo(openChunk=True, chunkName='buildControls')
+    try:
+        for progress in iterBuildControls(backend, incremental, wiring, lean, chunk_size=None, clean_history=clean_history):
+            pass
+    finally:
+        cmds.undoInfo(closeChunk=True)
+
+
+def iterBuildControls(backend='cmds', incremental=False, wiring='direct', lean=False, chunk_size=build_chunk_size,
+                      clean_history=False):
+    '''
+    Runs buildControls in steps, so a caller can keep Maya responsive between them, see buildScheduler.py.
+    Running every step gives the same rig as buildControls
+    Args:
+        backend, incremental, wiring, lean, clean_history: see buildControls
+        chunk_size: (int) number of guides a step of the 'create', 'connect' and 'fingerprints' phases handles,
+            None for one step per phase. The 'api' backend and incremental rebuilds connect the controls and store
+            their fingerprints in the same steps that create them
+    Yields:
+        (phase, done, total): one of build_phases, and how many of the guides it has handled
+    '''
+
+    if lean:
+        if wiring not in ('direct', 'lean'):
+            raise RuntimeError("lean=True can't be combined with wiring='{}'".format(wiring))
+        wiring = 'lean'
+    if backend not in build_backends:
+        raise RuntimeError("Unknown build backend '{}'. Use one of: {}".format(backend, ', '.join(build_backends)))
+    if wiring not in wiring_modes:
+        raise RuntimeError("Unknown wiring mode '{}'. Use one of: {}".format(wiring, ', '.join(wiring_modes)))
+    if incremental and backend != 'cmds':
+        raise RuntimeError("Incremental rebuilds are only supported by the 'cmds' backend")
+
     # if any objects are selected, parent then under the guides group. Make sure selected objects are curves
 
 
     selection = get_selected_curves()
-    setup()
+    # an incremental rebuild falls back to a full build if nothing was built yet
+    built = getBuiltFingerprints() if incremental else {}
+    # a rig wired the other way can't be updated in place
+    if any(fingerprint.get('wiring', 'direct') != wiring for fingerprint in built.values()):
+        built = {}
+    stats_before = getRigStats()
+    setup(clean=not built)
     if selection:
-        topSelected = getTopNodes(selection)
+        selection_parents = getHierarchyIndex(selection)
+        topSelected = getTopNodes(selection, selection_parents)
         for each in topSelected:
-                parent = cmds.listRelatives(each, p=True)
-                if parent == None:
-                    cmds.parent(each, all_guides_grp)
-                elif parent[0] != all_guides_grp:
+                if selection_parents.get(shortName(each)) != all_guides_grp:
                     cmds.parent(each, all_guides_grp)
 
-    # Get all objects under guides grp
-    guides = []
-    guides = cmds.listRelatives(all_guides_grp, ad=1, typ='transform')
-    if not guides:
+    # Get all objects under guides grp. Their full paths also give us the guide hierarchy.
+    guide_paths = cmds.listRelatives(all_guides_grp, ad=1, typ='transform', f=True)
+    if not guide_paths:
         raise RuntimeError("Please select some curve objects to make into clothing controls!")
-
-
-    # make controls
-    controls = makeControls(guides)
-    # make wControls
-    wcontrols = make_wControls(guides)
-    connectControlsTojointDrivers(controls, wcontrols)
-
-    # parent controls and wcontrols to groups
-
-    # find top guide nodes and use them to get top control and wcontrol nodes
-    guide_topNodes = getTopNodes(guides)
-    for each in guide_topNodes:
-        wctr_offset = each + '_ctr_w_Offset'
-        cmds.parent(wctr_offset, all_w_grp)
-        ctr_offset = each + '_ctr_Offset'
-        cmds.parent(ctr_offset, all_controls_grp)
-
+    guides = [shortName(path) for path in guide_paths]
+    guide_parents = hierarchyIndexFromPaths(guide_paths)
+    # every placement step reads guide positions from this cache instead of querying the guides again
+    guide_matrices = getWorldMatrices(guides)
+    guide_curves = curves.getCurveDataForNodes(guides)
+    # nodes that were deleted or renamed by hand can't be updated in place, and would clash with new ones
+    if built and not isRigConsistent(guides, built, wiring):
+        print('The controls no longer match the guides they were built from, rebuilding all of them')
+        setup(clean=True)
+        built = {}
+    fingerprints = getGuideFingerprints(guides, guide_parents, guide_matrices, guide_curves, wiring)
+    total = len(guides)
+    chunk_size = chunk_size or total
+    yield 'guides', total, total
+
+    if built:
+        for done in iterUpdateRig(guides, guide_parents, guide_matrices, guide_curves, fingerprints, built, wiring,
+                                  chunk_size):
+            yield 'create', done, total
+        yield 'connect', total, total
+        yield 'fingerprints', total, total
+    else:
+        if backend == 'api':
+            # controls and wcontrols are made straight under their groups and already connected, parents in
+            # earlier steps than their children
+            ordered = sortParentFirst(guides, guide_parents)
+            nodes = {}
+            for i in range(0, total, chunk_size):
+                apiBackend.buildRig(ordered[i:i + chunk_size], guide_matrices, guide_curves, all_controls_grp,
+                                    all_w_grp, wiring, nodes)
+                yield 'create', min(i + chunk_size, total), total
+            yield 'connect', total, total
+        else:
+            # make controls and wControls straight under their groups
+            rig = ([], [], [], [], [])
+            for done in iterMakeRig(guides, guide_parents, guide_matrices, guide_curves, wiring, rig, chunk_size):
+                yield 'create', done, total
+            controls, wcontrols, extra_grps, w_extra_grps, offsets = rig
+            for i in range(0, total, chunk_size):
+                chunk = slice(i, i + chunk_size)
+                connectControlsTojointDrivers(controls[chunk], wcontrols[chunk], extra_grps[chunk],
+                                              w_extra_grps[chunk], wiring, offsets[chunk])
+                yield 'connect', min(i + chunk_size, total), total
+
+        for i in range(0, total, chunk_size):
+            for guide in guides[i:i + chunk_size]:
+                storeFingerprint(guide + '_ctr_Offset', fingerprints[guide], new=True)
+            yield 'fingerprints', min(i + chunk_size, total), total
+
+    stats = getRigStats()
+    if stats_before:
+        print('Rig nodes: {} -> {}, connections: {} -> {}'.format(stats_before['nodes'], stats['nodes'],
+                                                                  stats_before['connections'], stats['connections']))
+    else:
+        print('Rig nodes: {nodes}, connections: {connections}'.format(**stats))
+
+    if clean_history:
+        print('Removed {} unused circle history nodes'.format(deleteUnusedConstructionHistory()))
 
     # set group visibilities
     exitEditMode()
+    yield 'cleanup', total, total
 
 
-def connectControlsTojointDrivers(controls, wcontrols):
+def connectControlsTojointDrivers(controls, wcontrols, extra_grps, w_extra_grps, wiring='direct', offsets=None):
     '''
-    Creates direct connections on translate, rotate, and scale between controls and 'w_controls' AND their Extra offset group
+    Creates direct connections on translate, rotate, and scale between controls and 'w_controls' AND their Extra offset group.
+    With 'matrix' and 'lean' wiring each wcontrol or joint is driven through its offsetParentMatrix instead.
+    The Extra groups are the ones returned when the controls were made, so nothing is looked up again,
+    and every connection is made in one MDGModifier transaction, run as one undoable command (see apiBackend.doIt).
+    Args:
+        controls: (list) control names
+        wcontrols: (list) wcontrol names, in the same order as controls
+        extra_grps: (list) Extra group of each control
+        w_extra_grps: (list) Extra group of each wcontrol, None with 'matrix' and 'lean' wiring
+        wiring: (string) one of wiring_modes
+        offsets: (list) with 'lean' wiring, the static offset of each joint from iterMakeRig
     '''
 
-    for i in range(len(controls)):
-        ctr = controls[i]
-        extra_grp = cmds.listRelatives(ctr, p=1)
-        wctr = wcontrols[i]
-        w_extra_grp = cmds.listRelatives(wctr, p=1)
-
-        cmds.connectAttr(str(ctr) + '.t', wctr + '.t')
-        cmds.connectAttr(str(ctr) + '.r', wctr + '.r')
-        cmds.connectAttr(str(ctr) + '.s', wctr + '.s')
-
-        cmds.connectAttr(str(extra_grp[0]) + '.t', w_extra_grp[0] + '.t')
-        cmds.connectAttr(str(extra_grp[0]) + '.r', w_extra_grp[0] + '.r')
-        cmds.connectAttr(str(extra_grp[0]) + '.s', w_extra_grp[0] + '.s')
+    if not controls:
+        return
+
+    sel = om.MSelectionList()
+    for node in controls + wcontrols + extra_grps:
+        sel.add(node)
+    count = len(controls)
+    if wiring in ('matrix', 'lean'):
+        drivers = []
+        for i in range(count):
+            offset = om.MMatrix(offsets[i]) if wiring == 'lean' else None
+            drivers.append((sel.getDependNode(i), sel.getDependNode(2 * count + i), sel.getDependNode(count + i),
+                            offset))
+        apiBackend.connectMatrixDrivers(drivers)
+        if wiring == 'lean':
+            apiBackend.disableScaleCompensation([sel.getDependNode(count + i) for i in range(count)])
+        return
+
+    for node in w_extra_grps:
+        sel.add(node)
+    pairs = []
+    for i in range(count):
+        pairs.append((sel.getDependNode(i), sel.getDependNode(count + i)))
+        pairs.append((sel.getDependNode(2 * count + i), sel.getDependNode(3 * count + i)))
+    apiBackend.connectTransformPairs(pairs)
 
 
 def createJoints(objects):
     '''
-    Creates a joint at each given object and parents it to that object
+    Creates a joint at each given object and parents it to that object.
+    The joint is created straight under the object with no transform, so it already sits on it.
     '''
 
     for each in objects:
         joint = str(each).replace('ctr_w', 'jnt')
-        cmds.joint(n=joint)
-        cmds.matchTransform(joint, each)
-        cmds.parent(joint, each)
+        cmds.createNode('joint', n=joint, p=each)
 
 
-def makeControls(guides):
+def getWorldMatrices(nodes):
     '''
-    Creates the anim controls and their offset groups
+    Reads the world matrix of every given node in one query
     Args:
-        guides: (list) guides determine location and hierarchy of controls
+        nodes: (list) given maya objects
+    Returns:
+        matrices: (dict) node -> world matrix as a flat list of 16 floats
+    '''
+
+    sel = om.MSelectionList()
+    for node in nodes:
+        sel.add(node)
+    matrices = {}
+    for i in range(len(nodes)):
+        matrices[nodes[i]] = list(sel.getDagPath(i).inclusiveMatrix())
+    return matrices
+
+
+def makeRig(guides, parents, matrices, guide_curves, wiring='direct'):
+    '''
+    Creates the controls and wcontrols of the guides in one step, see iterMakeRig
+    Args:
+        guides, parents, matrices, guide_curves, wiring: see iterMakeRig
     Returns:
         controls: (list) list of control names
+        wcontrols: (list) list of wcontrol names, in the same order as controls. Joint names with 'lean' wiring
+        extra_grps: (list) Extra group of each control
+        w_extra_grps: (list) Extra group of each wcontrol, None with 'matrix' and 'lean' wiring
+        offsets: (list) with 'lean' wiring the static offset of each joint from its parent, otherwise empty
     '''
 
-    controls = []
-    extra_grps = []
-    offset_grps = []
+    rig = ([], [], [], [], [])
+    for done in iterMakeRig(guides, parents, matrices, guide_curves, wiring, rig, len(guides) or 1):
+        pass
+    return rig
 
-    for guide in guides:
-        name = str(guide)
-        control = str(name) + '_ctr'
-
-        # Create control
-        cmds.circle(n=control)
-        # Create offset groups
-        extra_grp = control + '_Extra'
-        top_grp = control + '_Offset'
-
-        cmds.group(em=True, n=extra_grp)
-        cmds.group(em=True, n=top_grp)
-        # Move offset grps to match control location
-        cmds.parent(control, extra_grp)
-        cmds.parent(extra_grp, top_grp)
-        cmds.matchTransform(top_grp, guide)
+
+def iterMakeRig(guides, parents, matrices, guide_curves, wiring, rig, chunk_size=build_chunk_size):
+    '''
+    Creates the controls and wcontrols in a single walk over the guides, parents before children,
+    so every offset group is created straight under its final parent. Runs in steps of chunk_size guides
+    Args:
+        guides: (list) guides determine location and hierarchy of controls
+        parents: (dict) hierarchy index of the guides from getHierarchyIndex
+        matrices: (dict) guide world matrices from getWorldMatrices
+        guide_curves: (dict) guide curve data from curves.getCurveDataForNodes
+        wiring: (string) one of wiring_modes
+        rig: (tuple) five empty lists, filled as the controls are made:
+            controls: control names
+            wcontrols: wcontrol names, in the same order as controls. Joint names with 'lean' wiring
+            extra_grps: Extra group of each control
+            w_extra_grps: Extra group of each wcontrol, None with 'matrix' and 'lean' wiring
+            offsets: with 'lean' wiring the static offset of each joint from its parent, otherwise empty
+        chunk_size: (int) number of guides made per step
+    Yields:
+        done: (int) number of guides made so far
+    '''
+
+    controls, wcontrols, extra_grps, w_extra_grps, offsets = rig
+    guide_set = set(guides)
+    w_suffix = getWSuffix(wiring)
+    w_grp_matrix = getWorldMatrices([all_w_grp])[all_w_grp] if wiring == 'lean' else None
+    # guides of this step, their control shapes are built together at the end of the step
+    step_guides = []
+
+    for done, guide in enumerate(sortParentFirst(guides, parents), 1):
+        guide_parent = parents.get(guide)
+        if guide_parent in guide_set:
+            control_parent = guide_parent + '_ctr'
+            wcontrol_parent = guide_parent + w_suffix
+            parent_matrix = matrices[guide_parent]
+        else:
+            control_parent = all_controls_grp
+            wcontrol_parent = all_w_grp
+            parent_matrix = w_grp_matrix
+
+        control, extra_grp = makeControl(guide, control_parent, matrices[guide])
+        wcontrol, w_extra_grp = make_wControl(guide, wcontrol_parent, matrices[guide], wiring)
         controls.append(control)
         extra_grps.append(extra_grp)
-        offset_grps.append(top_grp)
-
-
-    # Copy over shape nodes
-    for i in range(len(guides)):
-        # Duplicate guide
-        guide = guides[i]
-        shapeTransform = cmds.duplicate(guide, renameChildren=1)[0]
-        # Get shape nodes
-        shape_node = cmds.listRelatives(shapeTransform, c=True, s=True, pa=True)[0]
-        # Get circle shape node
-        old_shape_node = cmds.listRelatives(controls[i], c=True, s=True, pa=True)
-        cmds.delete(old_shape_node)
-        # Parent duplicate guide shape to control transform
-        cmds.parent(shape_node, controls[i], s=True, r=True)
-        print(shape_node)
-        print(old_shape_node[0])
-        #cmds.rename(shape_node, str(old_shape_node[0]))
-        cmds.delete(shapeTransform)
-
-    # Match parenting structure
-    for i in range(len(guides)):
-        # Find corresponding control offset group
-        offset_grp = str(controls[i]) + '_Offset'
-        # Find guide parent
-        guide_parent = cmds.listRelatives(guides[i], p=True)
-        if guide_parent:
-            if guide_parent == all_guides_grp:
-                continue
-            control_parent = str(guide_parent[0]) + '_ctr'
-            if cmds.objExists(control_parent):
-                cmds.parent(offset_grp, control_parent)
-
-
-
-    return controls
-
-
-def make_wControls(guides):
-    '''
-    Creates "w_Controls" which are just the same as the controls
-    but they have joints parented under them, no shape node and are directly connected to anim controls.
+        wcontrols.append(wcontrol)
+        w_extra_grps.append(w_extra_grp)
+        step_guides.append(guide)
+        if wiring == 'lean':
+            offsets.append(getLocalMatrix(matrices[guide], parent_matrix))
+        if done % chunk_size == 0 or done == len(guides):
+            addControlShapes([each + '_ctr' for each in step_guides], [guide_curves[each] for each in step_guides])
+            step_guides = []
+            yield done
+
+
+def getWSuffix(wiring):
+    '''
+    Returns the suffix of the node that carries a guide's w side and that child w nodes are parented to
+    '''
+    return '_jnt' if wiring == 'lean' else '_ctr_w'
+
+
+def getLocalMatrix(matrix, parent_matrix):
+    '''
+    Returns a world matrix relative to a parent world matrix, both as flat lists of 16 floats
+    '''
+    return list(om.MMatrix(matrix) * om.MMatrix(parent_matrix).inverse())
+
+
+def sortParentFirst(guides, parents):
+    '''
+    Orders guides depth first so that every guide comes after its parent guide
+    Args:
+        guides: (list) guides to sort
+        parents: (dict) hierarchy index of the guides from getHierarchyIndex
+    Returns:
+        ordered: (list) the same guides, parents first
+    '''
+
+    guide_set = set(guides)
+    roots = []
+    children = {}
+    for guide in guides:
+        guide_parent = parents.get(guide)
+        if guide_parent in guide_set:
+            children.setdefault(guide_parent, []).append(guide)
+        else:
+            roots.append(guide)
+
+    ordered = []
+    stack = list(reversed(roots))
+    while stack:
+        guide = stack.pop()
+        ordered.append(guide)
+        stack.extend(reversed(children.get(guide, [])))
+    return ordered
+
+
+def makeControl(guide, parent, matrix):
+    '''
+    Creates the anim control of a guide and its offset groups under the given parent.
+    The control is a bare transform, its shapes are added with addControlShapes
+    Args:
+        guide: (string) guide that determines location of the control
+        parent: (string) node the control offset group is created under
+        matrix: (list) world matrix of the guide
+    Returns:
+        control: (string) control name
+        extra_grp: (string) Extra group the control sits under
+    '''
+
+    control = str(guide) + '_ctr'
+    extra_grp = control + '_Extra'
+    top_grp = control + '_Offset'
+
+    # Create offset groups under their final parent and move them to match control location
+    cmds.group(em=True, n=top_grp, p=parent)
+    cmds.xform(top_grp, ws=True, m=matrix)
+    cmds.group(em=True, n=extra_grp, p=top_grp)
+
+    # Create control as a bare transform
+    cmds.group(em=True, n=control, p=extra_grp)
+
+    return control, extra_grp
+
+
+def addControlShapes(controls, curve_lists):
+    '''
+    Builds copies of the guide shapes under controls, with their display overrides.
+    The shapes of every control are made in one MDagModifier transaction, run as one undoable command
+    (see apiBackend.doIt)
+    Args:
+        controls: (list) control transforms that receive the shapes
+        curve_lists: (list) curve data of the guide shapes from curves.getCurveData, for each control
+    '''
+
+    if not controls:
+        return
+    dag_mod = om.MDagModifier()
+    curves.createCurveShapesForNodes(dag_mod, controls, curve_lists)
+    apiBackend.doIt(dag_mod)
+
+
+def replaceControlShapes(controls, curve_lists):
+    '''
+    Replaces the shape nodes of controls with copies of the guide shapes, see addControlShapes
+    Args:
+        controls: (list) control transforms that receive the shapes
+        curve_lists: (list) curve data of the guide shapes from curves.getCurveData, for each control
+    '''
+
+    if not controls:
+        return
+    old_shapes = cmds.listRelatives(controls, c=True, s=True, pa=True)
+    if old_shapes:
+        cmds.delete(old_shapes)
+    addControlShapes(controls, curve_lists)
+
+
+def make_wControl(guide, parent, matrix, wiring='direct'):
+    '''
+    Creates the "w_Control" of a guide, which is just the same as the control
+    but it has a joint parented under it, no shape node and is directly connected to the anim control.
+    With 'matrix' wiring it has no Extra group, its offsetParentMatrix carries the Extra motion instead.
+    With 'lean' wiring only the joint is made. It is placed by its matrix driver, so matrix isn't used.
+    Args:
+        guide: (string) guide that determines location of the wcontrol
+        parent: (string) node the wcontrol offset group is created under
+        matrix: (list) world matrix of the guide
+        wiring: (string) one of wiring_modes
+    Returns:
+        wcontrol: (string) wcontrol name, the joint name with 'lean' wiring
+        extra_grp: (string) Extra group the wcontrol sits under, None with 'matrix' and 'lean' wiring
+    '''
+
+    if wiring == 'lean':
+        joint = str(guide) + '_jnt'
+        cmds.createNode('joint', n=joint, p=parent)
+        return joint, None
+
+    control = str(guide) + '_ctr_w'
+    extra_grp = control + '_Extra'
+    top_grp = control + '_Offset'
+
+    cmds.group(em=True, n=top_grp, p=parent)
+    cmds.xform(top_grp, ws=True, m=matrix)
+    if wiring == 'matrix':
+        extra_grp = None
+        cmds.group(em=True, n=control, p=top_grp)
+    else:
+        cmds.group(em=True, n=extra_grp, p=top_grp)
+        cmds.group(em=True, n=control, p=extra_grp)
+
+    # Create joint
+    createJoints([control])
+    return control, extra_grp
+
+def iterUpdateRig(guides, parents, matrices, guide_curves, fingerprints, built, wiring='direct',
+                  chunk_size=build_chunk_size):
+    '''
+    Brings an existing rig up to date with the guides, only touching the controls whose guides changed.
+    Guides are compared by fingerprint: new guides get controls, changed ones are reparented,
+    moved or get a new shape, and controls of guides that no longer exist are deleted.
+    Runs in steps of chunk_size guides, parents before children, see updateRig
+    Args:
+        guides: (list) guides determine location and hierarchy of controls
+        parents: (dict) hierarchy index of the guides from getHierarchyIndex
+        matrices: (dict) guide world matrices from getWorldMatrices
+        guide_curves: (dict) guide curve data from curves.getCurveDataForNodes
+        fingerprints: (dict) current guide fingerprints from getGuideFingerprints
+        built: (dict) fingerprints stored on the existing rig from getBuiltFingerprints
+        wiring: (string) one of wiring_modes, the existing rig must have been built with it
+        chunk_size: (int) number of guides updated per step
+    Yields:
+        done: (int) number of guides updated so far
+    '''
+
+    ordered = sortParentFirst(guides, parents)
+    guide_set = set(guides)
+    moved = set()
+    counts = {'created': 0, 'updated': 0, 'deleted': 0}
+    for i in range(0, len(ordered), chunk_size):
+        updateRig(ordered[i:i + chunk_size], guide_set, parents, matrices, guide_curves, fingerprints, built, wiring,
+                  moved, counts)
+        yield min(i + chunk_size, len(ordered))
+    counts['deleted'] = deleteRemovedControls(guide_set, built, wiring)
+    print('Incremental rebuild: {created} created, {updated} updated, {deleted} deleted'.format(**counts))
+
+
+def updateRig(step_guides, guide_set, parents, matrices, guide_curves, fingerprints, built, wiring, moved, counts):
+    '''
+    Runs one step of iterUpdateRig: creates or updates the controls of some guides, with their shapes and
+    connections
+    Args:
+        step_guides: (list) guides of the step, after the guides of earlier steps in parent first order
+        guide_set: (set) every guide
+        parents, matrices, guide_curves, fingerprints, built, wiring: see iterUpdateRig
+        moved: (set) guides whose controls moved in earlier steps, the moved guides of this step are added
+        counts: (dict) number of controls 'created' and 'updated' so far, increased by the ones of this step
+    '''
+
+    new_controls = []
+    new_wcontrols = []
+    new_extra_grps = []
+    new_w_extra_grps = []
+    new_offsets = []
+    # controls whose shapes are built, or rebuilt, together once every guide is handled
+    shape_guides = []
+    reshaped_guides = []
+    w_suffix = getWSuffix(wiring)
+    w_grp_matrix = getWorldMatrices([all_w_grp])[all_w_grp] if wiring == 'lean' else None
+
+    for guide in step_guides:
+        guide_parent = parents.get(guide)
+        if guide_parent in guide_set:
+            control_parent = guide_parent + '_ctr'
+            wcontrol_parent = guide_parent + w_suffix
+            parent_matrix = matrices[guide_parent]
+        else:
+            control_parent = all_controls_grp
+            wcontrol_parent = all_w_grp
+            parent_matrix = w_grp_matrix
+
+        fingerprint = fingerprints[guide]
+        old_fingerprint = built.get(guide)
+        if old_fingerprint is None:
+            control, extra_grp = makeControl(guide, control_parent, matrices[guide])
+            wcontrol, w_extra_grp = make_wControl(guide, wcontrol_parent, matrices[guide], wiring)
+            shape_guides.append(guide)
+            new_controls.append(control)
+            new_extra_grps.append(extra_grp)
+            new_wcontrols.append(wcontrol)
+            new_w_extra_grps.append(w_extra_grp)
+            if wiring == 'lean':
+                new_offsets.append(getLocalMatrix(matrices[guide], parent_matrix))
+            storeFingerprint(guide + '_ctr_Offset', fingerprint, new=True)
+            counts['created'] += 1
+            continue
+
+        control = guide + '_ctr'
+        wcontrol = guide + '_ctr_w'
+        joint = guide + '_jnt'
+        changed = False
+        if fingerprint['parent'] != old_fingerprint['parent']:
+            cmds.parent(control + '_Offset', control_parent)
+            if wiring == 'lean':
+                # keep the joint's own transform at rest, its placement lives in the matrix driver
+                cmds.parent(joint, wcontrol_parent, r=True)
+            else:
+                cmds.parent(wcontrol + '_Offset', wcontrol_parent)
+            changed = True
+        # a moved parent control drags this offset along even if the guide itself stayed put
+        if changed or fingerprint['matrix'] != old_fingerprint['matrix'] or guide_parent in moved:
+            cmds.xform(control + '_Offset', ws=True, m=matrices[guide])
+            if wiring == 'lean':
+                cmds.setAttr(joint + apiBackend.matrix_driver_suffix + '.matrixIn[2]',
+                             getLocalMatrix(matrices[guide], parent_matrix), type='matrix')
+            else:
+                cmds.xform(wcontrol + '_Offset', ws=True, m=matrices[guide])
+            moved.add(guide)
+            changed = True
+        if fingerprint['curves'] != old_fingerprint['curves']:
+            reshaped_guides.append(guide)
+            changed = True
+        if changed:
+            storeFingerprint(control + '_Offset', fingerprint)
+            counts['updated'] += 1
+
+    replaceControlShapes([guide + '_ctr' for guide in reshaped_guides],
+                         [guide_curves[guide] for guide in reshaped_guides])
+    addControlShapes([guide + '_ctr' for guide in shape_guides], [guide_curves[guide] for guide in shape_guides])
+    connectControlsTojointDrivers(new_controls, new_wcontrols, new_extra_grps, new_w_extra_grps, wiring, new_offsets)
+
+
+def deleteRemovedControls(guide_set, built, wiring='direct'):
+    '''
+    Deletes the controls of guides that no longer exist, the last step of iterUpdateRig.
+    Controls of surviving children have been moved out already, so whole offset groups can go
+    Args:
+        guide_set: (set) every guide
+        built: (dict) fingerprints stored on the existing rig from getBuiltFingerprints
+        wiring: (string) one of wiring_modes
+    Returns:
+        deleted: (int) number of guides whose controls were deleted
+    '''
+
+    deleted = 0
+    w_suffix = getWSuffix(wiring)
+    for guide in built:
+        if guide in guide_set:
+            continue
+        w_node = guide + ('_jnt' if wiring == 'lean' else '_ctr_w_Offset')
+        matrix_driver = guide + w_suffix + apiBackend.matrix_driver_suffix
+        for node in (guide + '_ctr_Offset', w_node, matrix_driver):
+            if cmds.objExists(node):
+                cmds.delete(node)
+        deleted += 1
+    return deleted
+
+
+def getRigNodeNames(guide, wiring='direct'):
+    '''
+    Returns the names of the nodes a build makes for a guide, shapes aside
+    '''
+    if wiring == 'lean':
+        return [guide + '_ctr_Offset', guide + '_ctr', guide + '_jnt', guide + '_jnt' + apiBackend.matrix_driver_suffix]
+    names = [guide + '_ctr_Offset', guide + '_ctr', guide + '_ctr_w_Offset', guide + '_ctr_w', guide + '_jnt']
+    if wiring == 'matrix':
+        names.append(guide + '_ctr_w' + apiBackend.matrix_driver_suffix)
+    return names
+
+
+def isRigConsistent(guides, built, wiring='direct'):
+    '''
+    Checks that an existing rig can be brought up to date with updateRig: every guide with a stored fingerprint
+    still has all its nodes, and guides without one have none, so none are made twice. Looked up in one query
     Args:
         guides: (list) guides determine location and hierarchy of controls
+        built: (dict) fingerprints stored on the existing rig from getBuiltFingerprints
+        wiring: (string) one of wiring_modes, the existing rig was built with it
     Returns:
-        wcontrols: (list) list of wcontrol names
+        consistent: (bool)
     '''
 
-    wcontrols = []
-    extra_grps = []
-    offset_grps = []
-    suffix = '_w'
+    names = dict((guide, getRigNodeNames(guide, wiring)) for guide in guides)
+    existing = set(cmds.ls([name for guide in guides for name in names[guide]]) or [])
+    for guide in guides:
+        found = sum(name in existing for name in names[guide])
+        if found != (len(names[guide]) if guide in built else 0):
+            return False
+    return True
 
+
+def getGuideFingerprints(guides, parents, matrices, guide_curves, wiring='direct'):
+    '''
+    Fingerprints each guide from its name, parent, world matrix and curve data
+    Args:
+        guides: (list) guides to fingerprint
+        parents: (dict) hierarchy index of the guides from getHierarchyIndex
+        matrices: (dict) guide world matrices from getWorldMatrices
+        guide_curves: (dict) guide curve data from curves.getCurveDataForNodes
+        wiring: (string) wiring mode the controls are built with, stored alongside
+    Returns:
+        fingerprints: (dict) guide -> fingerprint dict with 'name', 'parent', 'matrix', 'curves' and 'wiring'
+    '''
+
+    fingerprints = {}
     for guide in guides:
-        name = str(guide)
-        control = str(name) + '_ctr' + suffix
-
-        # Create control
-        cmds.circle(n=control)
-        # Create offset groups
-        extra_grp = control + '_Extra'
-        top_grp = control + '_Offset'
-
-        cmds.group(em=True, n=extra_grp)
-        cmds.group(em=True, n=top_grp)
-        # Move offset grps to match control location
-        cmds.parent(control, extra_grp)
-        cmds.parent(extra_grp, top_grp)
-        cmds.matchTransform(top_grp, guide)
-        wcontrols.append(control)
-        extra_grps.append(extra_grp)
-        offset_grps.append(top_grp)
-
-    # Match parenting structure
-    for i in range(len(guides)):
-        # Find corresponding control offset group
-        offset_grp = str(wcontrols[i]) + '_Offset'
-        # Find guide parent
-        guide_parent = cmds.listRelatives(guides[i], p=True)
-        if guide_parent:
-            if guide_parent == all_guides_grp:
-                continue
-            control_parent = str(guide_parent[0]) + '_ctr' + suffix
-            if cmds.objExists(control_parent):
-                cmds.parent(offset_grp, control_parent)
-
-    for i in range(len(wcontrols)):
-        # Delete circle shape node
-        shape_node = cmds.listRelatives(wcontrols[i], c=True, s=True, pa=True)
-        cmds.delete(shape_node)
-
-    # Create joints
-    createJoints(wcontrols)
-    return wcontrols
-
-def getTopNodes(objects):
+        curve_values = []
+        for curve in guide_curves[guide]:
+            values = [curve['cvs'], curve['knots'], curve['degree'], curve['form']]
+            # only changed display attributes count, so rigs built before they were copied keep their fingerprints
+            if curve.get('display'):
+                values.append(sorted(curve['display'].items()))
+            curve_values.append(values)
+        fingerprints[guide] = {
+            'name': guide,
+            'parent': parents.get(guide),
+            'matrix': hashData(matrices[guide]),
+            'curves': hashData(curve_values),
+            'wiring': wiring,
+        }
+    return fingerprints
+
+
+def hashData(data):
+    '''
+    Returns a short hash of nested lists of numbers. Floats are rounded so float noise doesn't count as a change
+    '''
+
+    def rounded(value):
+        if isinstance(value, float):
+            return round(value, 6) + 0.0
+        if isinstance(value, (list, tuple)):
+            return [rounded(each) for each in value]
+        return value
+
+    return hashlib.md5(json.dumps(rounded(data)).encode('utf-8')).hexdigest()
+
+
+def storeFingerprint(node, fingerprint, new=False):
+    '''
+    Stores a guide fingerprint on a generated node
+    Args:
+        node: (string) node to store the fingerprint on
+        fingerprint: (dict) fingerprint from getGuideFingerprints
+        new: (bool) the node was just created, so the attribute doesn't exist yet
+    '''
+
+    if new or not cmds.attributeQuery(fingerprint_attr, node=node, exists=True):
+        cmds.addAttr(node, ln=fingerprint_attr, dt='string')
+    cmds.setAttr(node + '.' + fingerprint_attr, json.dumps(fingerprint, sort_keys=True), type='string')
+
+
+def getRigStats():
+    '''
+    Counts the nodes of the built rig and the connections coming into them.
+    The rig is everything under the controls and w groups plus the matrix drivers.
+    Returns:
+        stats: (dict) 'nodes' and 'connections', None if there is no rig
+    '''
+
+    if not cmds.objExists(all_controls_grp):
+        return None
+    nodes = cmds.listRelatives(all_controls_grp, all_w_grp, ad=True, pa=True) or []
+    nodes += getMatrixDrivers()
+    connections = cmds.listConnections(nodes, s=True, d=False, c=True, p=True) or [] if nodes else []
+    return {'nodes': len(nodes), 'connections': len(connections) // 2}
+
+
+def getBuiltFingerprints():
+    '''
+    Reads the guide fingerprints stored on the existing rig
+    Returns:
+        built: (dict) guide -> fingerprint dict the guide's controls were built from
+    '''
+
+    built = {}
+    if not cmds.objExists(all_controls_grp):
+        return built
+    for node in cmds.ls('*.' + fingerprint_attr, o=True) or []:
+        fingerprint = json.loads(cmds.getAttr(node + '.' + fingerprint_attr))
+        built[fingerprint['name']] = fingerprint
+    return built
+
+
+def deleteUnusedConstructionHistory():
+    '''
+    Deletes the makeNurbCircle nodes earlier versions of the tool left behind. They started every control and
+    wcontrol as a circle and then deleted its shape, which left the circle's history node with no connections.
+    Builds no longer make circles, and these nodes can't be told apart from other unused circles, so only nodes
+    with their default name and no connections at all are deleted, and only when the build is asked to
+    Returns:
+        removed: (int) number of nodes deleted
+    '''
+
+    unused = []
+    for node in cmds.ls('makeNurbCircle*', type='makeNurbCircle') or []:
+        if not cmds.listConnections(node):
+            unused.append(node)
+    if unused:
+        cmds.delete(unused)
+    return len(unused)
+
+
+def getTopNodes(objects, parents=None):
     '''
     Gets the top nodes from given objects. Each selection is a top node unless it's parent is also selected, then just the parent is the top node
     Args:
         objects: (list) given maya objects
+        parents: (dict) hierarchy index of the objects from getHierarchyIndex. Queried if not given
     Returns:
         topNodes: (list) list of all the top nodes selected of their own hierarchies
     '''
 
+    if parents is None:
+        parents = getHierarchyIndex(objects)
+    selected = set(shortName(each) for each in objects)
+
     topNodes = []
+    added = set()
     for each in objects:
-        parents = cmds.listRelatives(each, allParents=1, pa=1, type='transform')
-
-        # does it have a parent that isn't world?
-        if parents:
-            # is its parent also in selection?
-            if (common_data(parents, objects)):
-                print('parent in selection. Skipping :' + str(each))
-                continue
-
-            else:
-                print('Parent not in selection. Adding: ' + str(each))
-                topNodes.append(each)
-        # no parent
-        else:
-            # skip if its already in topNodes
-            if (each in topNodes):
-                continue
-            else:
-                topNodes.append(each)
+        name = shortName(each)
+        # is its parent also in selection?
+        if parents.get(name) in selected:
+            print('parent in selection. Skipping :' + str(each))
+            continue
+        # skip if its already in topNodes
+        if name in added:
+            continue
+        if parents.get(name):
+            print('Parent not in selection. Adding: ' + str(each))
+        topNodes.append(each)
+        added.add(name)
     return topNodes
 
 
-def common_data(list1, list2):
+def getHierarchyIndex(objects):
     '''
-    Function to check if two lists have at least one common element
+    Finds the parent of every given object with a single query
+    Args:
+        objects: (list) given maya objects
+    Returns:
+        parents: (dict) short name of each object -> short name of its parent, None if parented to world
     '''
 
-    result = False
+    return hierarchyIndexFromPaths(cmds.ls(objects, long=True) or [])
+
+
+def hierarchyIndexFromPaths(paths):
+    '''
+    Builds the object -> parent index from full DAG paths, without querying maya
+    Args:
+        paths: (list) full paths such as '|guides|collar|collar_tip'
+    Returns:
+        parents: (dict) short name of each object -> short name of its parent, None if parented to world
+    '''
 
-    # traverse in the 1st list
-    for x in list1:
+    parents = {}
+    for path in paths:
+        names = path.split('|')
+        parents[names[-1]] = names[-2] if len(names) > 2 else None
+    return parents
 
-        # traverse in the 2nd list
-        for y in list2:
 
-            # if one common
-            if x == y:
-                result = True
-                return result
+def shortName(name):
+    '''
+    Returns the short name of a node given by its short name, partial path or full path
+    '''
+    return str(name).split('|')[-1]
 
-    return result
 
 def get_selected_curves():
     '''
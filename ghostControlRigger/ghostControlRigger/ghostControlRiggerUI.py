@@ -38,6 +38,12 @@ from . import ghostControlRigger as r
 importlib.reload(r)
 from . import templates as t
 importlib.reload(t)
+from . import archive
+importlib.reload(archive)
+from . import templateBrowser
+importlib.reload(templateBrowser)
+from . import buildScheduler
+importlib.reload(buildScheduler)
 
 import sys
 import os
@@ -110,8 +116,25 @@ class ClothingRiggerUI(QtWidgets.QWidget):
         importtemplateLabel.setText('Import pre-made guides:')
         guide_path_field = QtWidgets.QLineEdit()
         set_guidepathBtn = QtWidgets.QPushButton('Set')
-
-        guidestemplatesList = QtWidgets.QListWidget()
+        set_archivepathBtn = QtWidgets.QPushButton('Archive')
+        set_archivepathBtn.setToolTip('Use a template archive instead of a folder, see archive.py')
+
+        templateSearchField = QtWidgets.QLineEdit()
+        templateSearchField.setPlaceholderText('Search templates and guides')
+        templateSearchField.setClearButtonEnabled(True)
+        # the list only asks the model for the rows it shows and the library fills the model from a worker
+        # thread, see templateBrowser.py
+        templatesLibrary = templateBrowser.TemplateLibrary(self)
+        templatesModel = templatesLibrary.model
+        templatesProxy = templateBrowser.TemplateFilterProxy(self)
+        templatesProxy.setSourceModel(templatesModel)
+        guidestemplatesList = QtWidgets.QListView()
+        guidestemplatesList.setModel(templatesProxy)
+        guidestemplatesList.setUniformItemSizes(True)
+        guidestemplatesList.setIconSize(QtCore.QSize(templateBrowser.thumbnails.thumbnail_size,
+                                                     templateBrowser.thumbnails.thumbnail_size))
+        guidestemplatesList.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        guidestemplatesList.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
         importBtn = QtWidgets.QPushButton('Import Selected')
         exportBtn = QtWidgets.QPushButton('Export Selected as Template')
         guidecreationLine = QtWidgets.QFrame()
@@ -125,6 +148,10 @@ class ClothingRiggerUI(QtWidgets.QWidget):
         buildBtn = QtWidgets.QPushButton('Build')
         editBtn = QtWidgets.QPushButton('Edit Mode')
         exitEditBtn = QtWidgets.QPushButton('Exit Edit Mode')
+        fullRebuildCheck = QtWidgets.QCheckBox('Full Rebuild')
+        fullRebuildCheck.setToolTip('Rebuild every control, not only the ones whose guides changed')
+        cleanHistoryCheck = QtWidgets.QCheckBox('Clean Circle History')
+        cleanHistoryCheck.setToolTip('Delete the unused makeNurbCircle nodes older versions of the tool left behind')
 
 
 
@@ -142,7 +169,9 @@ class ClothingRiggerUI(QtWidgets.QWidget):
         setguidepath_h_layout.addWidget(importtemplateLabel)
         setguidepath_h_layout.addWidget(guide_path_field)
         setguidepath_h_layout.addWidget(set_guidepathBtn)
+        setguidepath_h_layout.addWidget(set_archivepathBtn)
 
+        createGuides_v_layout.addWidget(templateSearchField)
         createGuides_v_layout.addWidget(guidestemplatesList)
         createGuides_v_layout.addLayout(importexport_h_layout)
         importexport_h_layout.addWidget(importBtn)
@@ -158,17 +187,24 @@ class ClothingRiggerUI(QtWidgets.QWidget):
         buildbuttons_h_layout.addWidget(buildBtn)
         buildbuttons_h_layout.addWidget(editBtn)
         buildbuttons_h_layout.addWidget(exitEditBtn)
+        build_v_layout.addWidget(fullRebuildCheck)
+        build_v_layout.addWidget(cleanHistoryCheck)
 
 
         self.data = {
             'buttons': {
                 'setGuidePath' : set_guidepathBtn,
+                'setArchivePath' : set_archivepathBtn,
                 'importguides' : importBtn,
                 'exportguides' : exportBtn,
                 'build' : buildBtn,
                 'editmode' : editBtn,
                 'exiteditmode' : exitEditBtn
             },
+            'checkboxes': {
+                'fullrebuild': fullRebuildCheck,
+                'cleanhistory': cleanHistoryCheck
+            },
             'lists':{
                 'guidetemplates': guidestemplatesList
             },
@@ -179,7 +215,13 @@ class ClothingRiggerUI(QtWidgets.QWidget):
                 'buildbuttons': buildbuttons_h_layout
             },
             'textfields':{
-                'guidepath': guide_path_field
+                'guidepath': guide_path_field,
+                'templatesearch': templateSearchField
+            },
+            'models':{
+                'guidetemplateslibrary': templatesLibrary,
+                'guidetemplates': templatesModel,
+                'guidetemplatesfilter': templatesProxy
             }
 
 
@@ -215,7 +257,49 @@ class ClothingRiggerUI(QtWidgets.QWidget):
         self.setButtonState_1()
         self.data['buttons']['build'].setText('Rebuild')
 
-        r.buildControls()
+        # unless a full rebuild is asked for, only rebuild the controls whose guides changed since the last build,
+        # see ghostControlRigger.iterUpdateRig. The build runs in steps from Maya's idle queue, so Maya redraws and the
+        # dialog shows its progress, see buildScheduler.py. The build's undo chunk stays open until it's done, so
+        # the dialog blocks all of Maya, not only this window, and is shown right away
+        progress = QtWidgets.QProgressDialog('Building controls...', 'Cancel', 0, 100, self)
+        progress.setWindowTitle('Build')
+        progress.setWindowModality(QtCore.Qt.ApplicationModal)
+        progress.setAutoReset(False)
+        progress.setAutoClose(False)
+        progress.setMinimumDuration(0)
+        progress.show()
+        scheduler = buildScheduler.BuildScheduler(self.showBuildProgress, self.buildFinished,
+                                                  incremental=not self.data['checkboxes']['fullrebuild'].isChecked(),
+                                                  clean_history=self.data['checkboxes']['cleanhistory'].isChecked())
+        progress.canceled.connect(scheduler.cancel)
+        self.data['build'] = {'progress': progress, 'scheduler': scheduler}
+        scheduler.start()
+
+    def showBuildProgress(self, phase, done, total):
+        '''
+        Called after every step of a build
+        Args:
+            phase: (string) one of ghostControlRigger.build_phases
+            done: (int) guides the phase has handled
+            total: (int) number of guides
+        '''
+        progress = self.data['build']['progress']
+        phase_index = r.build_phases.index(phase)
+        progress.setLabelText('{}: {} / {} guides'.format(phase.capitalize(), done, total))
+        progress.setValue(int(100 * (phase_index + float(done) / max(total, 1)) / len(r.build_phases)))
+
+    def buildFinished(self, status, error):
+        '''
+        Called when a build is done, cancelled or failed
+        Args:
+            status: (string) 'done', 'cancelled' or 'failed'
+            error: (Exception) why the build failed
+        '''
+        self.data['build']['progress'].close()
+        if status == 'cancelled':
+            print('Build cancelled, the scene was rolled back')
+        elif status == 'failed':
+            QtWidgets.QMessageBox.warning(self, 'Build failed', '{}\n\nThe scene was rolled back.'.format(error))
 
 
     def enterEditMode(self):
@@ -246,20 +330,45 @@ class ClothingRiggerUI(QtWidgets.QWidget):
         # set guide directory in guides.py
         t.set_templates_Dir(dir)
 
-        # set the text box and templates list to match selected folder
+        # set the text box and templates list to match selected folder, the list fills in as it's scanned
         self.data['textfields']['guidepath'].setText(t.get_templates_Dir())
         self.data['textfields']['guidepath'].deselect()
-        self.refreshInSceneList()
+        self.data['models']['guidetemplateslibrary'].setDirectory(t.get_templates_Dir())
+
+    def setTemplatesArchive(self):
+        '''
+        Called when archive button is clicked
+        Opens file dialog and sets the returned template archive as guide template path. A new archive is made
+        if the file doesn't exist, see archive.py
+        '''
+
+        path, selected_filter = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Open Template Archive", t.get_templates_Dir(),
+            "Template archives (*{})".format(archive.archive_extension),
+            options=QtWidgets.QFileDialog.DontConfirmOverwrite)
+        if not path:
+            return
+        if not path.lower().endswith(archive.archive_extension):
+            path += archive.archive_extension
+        if not os.path.isfile(path):
+            archive.writeTemplates(path, [])
+        t.set_templates_Dir(path)
+
+        self.data['textfields']['guidepath'].setText(t.get_templates_Dir())
+        self.data['textfields']['guidepath'].deselect()
+        self.data['models']['guidetemplateslibrary'].setDirectory(t.get_templates_Dir())
 
     def importGuides(self):
         '''
         Called when import button is clicked
         '''
-        # Get selected item from list
-        getSelectedItem = self.data['lists']['guidetemplates'].currentItem()
-        if getSelectedItem is not None:
-            template = getSelectedItem.text()
-            t.template_import(template)
+        # Get selected items from list
+        selectedItems = self.data['lists']['guidetemplates'].selectionModel().selectedIndexes()
+        templates = [item.data(templateBrowser.name_role) for item in sorted(selectedItems, key=lambda i: i.row())]
+        if len(templates) == 1:
+            t.template_import(templates[0])
+        elif templates:
+            t.template_import_many(templates)
 
     def exportGuides(self):
         '''
@@ -274,35 +383,16 @@ class ClothingRiggerUI(QtWidgets.QWidget):
         t.template_export(filename)
         self.refreshInSceneList()
 
-    def getExistingTemplates(self):
-        '''
-        Looks in guide directory and returns a list of all items found in directory
-        Returns:
-            templates: (list) of all fbx items found in guides Dir
-        '''
-        templates = []
-        path = t.get_templates_Dir()
-        for file in os.listdir(path):
-            #if file.endswith(".ma"):
-            templates.append(file)
-
-
-        return templates
-
     def refreshInSceneList(self):
         '''
-        Refreshes the list existing guide templates
+        Refreshes the list existing guide templates. The guide directory is scanned in a worker thread and the list
+        is updated in place as changes are found. Changes made by others are also picked up on their own
         '''
-
-        # clear list
-        self.data['lists']['guidetemplates'].clear()
-
-        # get a list guide templates in above path
-        templates = self.getExistingTemplates()
-
-        if templates is not None and len(templates) > 0:
-            for each in templates:
-                self.data['lists']['guidetemplates'].addItem(each)
+        library = self.data['models']['guidetemplateslibrary']
+        if library.directory != t.get_templates_Dir():
+            library.setDirectory(t.get_templates_Dir())
+        else:
+            library.rescan()
 
 
     def initialState(self):
@@ -331,6 +421,9 @@ class ClothingRiggerUI(QtWidgets.QWidget):
         Associates all of the UI clicks with their functions
         '''
         self.data['buttons']['setGuidePath'].clicked.connect(self.setTemplatesDir)
+        self.data['buttons']['setArchivePath'].clicked.connect(self.setTemplatesArchive)
+        self.data['textfields']['templatesearch'].textChanged.connect(
+            self.data['models']['guidetemplatesfilter'].setSearchText)
 
         self.data['buttons']['importguides'].clicked.connect(self.importGuides)
         self.data['buttons']['exportguides'].clicked.connect(self.exportGuides)
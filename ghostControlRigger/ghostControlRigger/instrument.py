@@ -0,0 +1,187 @@
+'''
+Opt-in maya.cmds call instrumentation with per guide call budgets
+
+While recording, the cmds module used by ghostControlRigger, apiBackend and templates is swapped for a proxy that
+counts and times every call, per command and per calling function (iterMakeRig, connectControlsTojointDrivers,
+getTopNodes, ...). Works in Maya and with the stand-in (mayaStandIn.py).
+
+Budgets declare how many calls of each command a build may make per guide, plus a small fixed allowance
+for one-off calls. Any command that is not listed only gets the fixed allowance, so a change that adds
+a hidden per guide listRelatives or objExists goes over budget as soon as the rig has more than a
+handful of guides.
+
+How to run:
+from ghostControlRigger import instrument
+from ghostControlRigger import ghostControlRigger as r
+with instrument.recording() as recorder:
+    r.buildControls()
+print(recorder.report())
+instrument.checkBudget(recorder, guide_count, instrument.build_budgets['cmds'])
+'''
+
+import collections
+import contextlib
+import sys
+import time
+
+
+# Calls a build may make: 'per_guide' calls of each command for every guide, plus 'fixed' calls of any command
+build_budgets = {
+    'cmds': {
+        'per_guide': {
+            'group': 6,
+            'xform': 2,
+            'createNode': 1,
+            'addAttr': 1,
+            'setAttr': 1,
+        },
+        'fixed': 20,
+    },
+    'api': {
+        'per_guide': {
+            'addAttr': 1,
+            'setAttr': 1,
+        },
+        'fixed': 20,
+    },
+    # rebuild after a small edit: reading back the stored fingerprints is the only per guide work
+    'incremental': {
+        'per_guide': {
+            'getAttr': 1,
+        },
+        'fixed': 50,
+    },
+}
+
+
+class CallRecorder(object):
+    '''
+    Collects call counts and cumulative time per command and per calling function
+    '''
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.times = collections.defaultdict(float)
+        self.function_calls = collections.defaultdict(collections.Counter)
+        self.function_times = collections.defaultdict(float)
+
+    def record(self, command, function, elapsed):
+        self.calls[command] += 1
+        self.times[command] += elapsed
+        self.function_calls[function][command] += 1
+        self.function_times[function] += elapsed
+
+    def total(self):
+        return sum(self.calls.values())
+
+    def report(self):
+        '''
+        Returns a readable summary of the recorded calls
+        '''
+        lines = ['{} maya.cmds calls, {:.3f}s'.format(self.total(), sum(self.times.values())), 'by command:']
+        for command, count in self.calls.most_common():
+            lines.append('    {:<24} {:>8} calls  {:9.3f}s'.format(command, count, self.times[command]))
+        lines.append('by function:')
+        for function in sorted(self.function_calls, key=lambda name: -self.function_times[name]):
+            commands = self.function_calls[function]
+            lines.append('    {:<48} {:>8} calls  {:9.3f}s  {}'.format(
+                function, sum(commands.values()), self.function_times[function],
+                ', '.join('{} {}'.format(command, count) for command, count in commands.most_common())))
+        return '\n'.join(lines)
+
+
+class RecordingCmds(object):
+    '''
+    Stands in for maya.cmds inside an instrumented module and records every call made through it
+    '''
+
+    def __init__(self, cmds, recorder, module_name):
+        self._cmds = cmds
+        self._recorder = recorder
+        self._module_name = module_name
+        self._wrappers = {}
+
+    def __getattr__(self, name):
+        wrapper = self._wrappers.get(name)
+        if wrapper is not None:
+            return wrapper
+        command = getattr(self._cmds, name)
+        if not callable(command):
+            return command
+
+        def wrapper(*args, **kwargs):
+            function = callingFunction(sys._getframe(1), self._module_name)
+            start = time.perf_counter()
+            try:
+                return command(*args, **kwargs)
+            finally:
+                self._recorder.record(name, function, time.perf_counter() - start)
+
+        wrapper.__name__ = name
+        self._wrappers[name] = wrapper
+        return wrapper
+
+
+def callingFunction(frame, module_name):
+    '''
+    Returns 'module.function' for the function that made a call, skipping comprehensions and lambdas
+    '''
+    while frame.f_back is not None and frame.f_code.co_name.startswith('<') and frame.f_code.co_name != '<module>':
+        frame = frame.f_back
+    return '{}.{}'.format(module_name.split('.')[-1], frame.f_code.co_name)
+
+
+def defaultModules():
+    '''
+    Returns the modules instrumented when none are given: ghostControlRigger, apiBackend and templates
+    '''
+    from . import apiBackend
+    from . import ghostControlRigger
+    from . import templates
+    return [ghostControlRigger, apiBackend, templates]
+
+
+@contextlib.contextmanager
+def recording(modules=None, recorder=None):
+    '''
+    Records every maya.cmds call the given modules make while the block runs
+    Args:
+        modules: (list) modules whose cmds calls are recorded, see defaultModules
+        recorder: (CallRecorder) recorder to add to, a new one is made if not given
+    Returns:
+        recorder: (CallRecorder) filled in while the block runs
+    '''
+    recorder = recorder or CallRecorder()
+    modules = modules or defaultModules()
+    originals = []
+    for module in modules:
+        originals.append((module, module.cmds))
+        module.cmds = RecordingCmds(module.cmds, recorder, module.__name__)
+    try:
+        yield recorder
+    finally:
+        for module, cmds in originals:
+            module.cmds = cmds
+
+
+def checkBudget(recorder, guide_count, budget):
+    '''
+    Checks recorded calls against a call budget
+    Args:
+        recorder: (CallRecorder) recorded calls of one build
+        guide_count: (int) number of guides the build was made from
+        budget: (dict) with 'per_guide' calls per command and 'fixed' allowance, see build_budgets
+    Raises RuntimeError listing every command that went over budget and the functions that called it
+    '''
+    violations = []
+    for command, count in sorted(recorder.calls.items()):
+        allowed = budget['per_guide'].get(command, 0) * guide_count + budget['fixed']
+        if count > allowed:
+            callers = sorted((calls[command], function) for function, calls in recorder.function_calls.items()
+                             if calls[command])
+            violations.append('{}: {} calls, budget {} ({} per guide + {}). Called from {}'.format(
+                command, count, allowed, budget['per_guide'].get(command, 0), budget['fixed'],
+                ', '.join('{} ({})'.format(function, calls) for calls, function in reversed(callers))))
+    if violations:
+        raise RuntimeError('maya.cmds call budget exceeded for {} guides:\n    {}'.format(
+            guide_count, '\n    '.join(violations)))
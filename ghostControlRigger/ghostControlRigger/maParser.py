@@ -0,0 +1,577 @@
+# Streaming Maya ASCII parser for guide templates
+#
+# Reads .ma files one statement at a time, without Maya and without holding the whole file in memory.
+# Only what guide templates are made of is kept: createNode records with their parents, the attributes of
+# transforms, joints, nurbsCurves and makeNurbCircle nodes, connections, requires and fileInfo lines and
+# the shared nodes edited with select -ne (render globals, color management, shading lists...).
+# setAttr data of every other node is skipped without being collected.
+#
+# Curve data comes from the .cc attribute of a curve shape. Shapes driven by a makeNurbCircle node, like
+# the ones in a scene saved with construction history, are evaluated from the node's normal, radius,
+# sections and degree. Display overrides and line width set on a curve shape are kept with its curve data.
+#
+# Pivots and shear are ignored. Lengths are kept in the file's linear unit.
+#
+# A file has to start with the //Maya ASCII header Maya writes, anything else is rejected before it's parsed.
+#
+# How to run:
+# from ghostControlRigger import maParser
+# info = maParser.parseFile(path)
+# print(maParser.getSummary(info))
+# template = maParser.toTemplate(info)
+# maParser.convertFile('shirt.ma', 'shirt.json')
+
+import collections
+import math
+import re
+
+from . import templateFormat
+
+# node types whose attributes are kept
+kept_node_types = ('transform', 'joint', 'nurbsCurve', 'makeNurbCircle')
+transform_types = ('transform', 'joint')
+
+# rotate orders of the .ro attribute
+rotate_orders = ('xyz', 'yzx', 'zxy', 'xzy', 'yxz', 'zyx')
+
+token_pattern = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+# first line of every Maya ASCII file, followed by the Maya version
+ma_header = '//Maya ASCII'
+
+
+def iterStatements(lines, keep=None):
+    '''
+    Yields the MEL statements of a .ma file one at a time. A statement ends with the line that ends in ';'.
+    Args:
+        lines: (iterable) lines of the file, such as an open file object
+        keep: (callable) gets the first line of each statement and returns False for statements that
+            don't need their text. Those are skipped without collecting their lines
+    Returns:
+        statements: (generator) (first line, statement text) pairs. The text is None for skipped statements
+    '''
+    first = None
+    parts = None
+    for line in lines:
+        stripped = line.strip()
+        if first is None:
+            if not stripped or stripped.startswith('//'):
+                continue
+            first = stripped
+            if keep is None or keep(stripped):
+                parts = []
+        if parts is not None:
+            parts.append(stripped)
+        if stripped.endswith(';'):
+            yield first, ' '.join(parts) if parts is not None else None
+            first = None
+            parts = None
+
+
+def tokenize(statement):
+    '''
+    Splits a MEL statement into its words. Quoted strings become one word without their quotes.
+    '''
+    statement = statement.rstrip()
+    if statement.endswith(';'):
+        statement = statement[:-1]
+    # long values such as curve cvs come after the last quoted word, plain splitting is enough for them
+    last_quote = statement.rfind('"')
+    tokens = []
+    for match in token_pattern.finditer(statement, 0, last_quote + 1):
+        if match.group(1) is not None:
+            tokens.append(match.group(1).replace('\\"', '"').replace('\\\\', '\\'))
+        else:
+            tokens.append(match.group(2))
+    tokens.extend(statement[last_quote + 1:].split())
+    return tokens
+
+
+def parseFile(path):
+    '''
+    Parses a Maya ASCII file, see parseLines
+    Args:
+        path: (string) .ma file
+    Raises RuntimeError if the file isn't UTF-8 text or isn't a Maya ASCII file
+    '''
+    with open(path, encoding='utf-8') as f:
+        try:
+            return parseLines(f, path)
+        except UnicodeDecodeError as error:
+            raise RuntimeError('{} is not a Maya ASCII file: {}'.format(path, error))
+
+
+def parseLines(lines, path=None):
+    '''
+    Parses the lines of a Maya ASCII file
+    Args:
+        lines: (iterable) lines of the file, an open file or a list
+        path: (string) name of the parsed file, kept in the info and error messages
+    Returns:
+        info: (dict) with
+            'path': the parsed file
+            'requires': (list) words of every requires line, such as ['maya', '2023'] or ['mtoa', '5.1.0']
+            'file_info': (dict) fileInfo keys and values
+            'units': (dict) 'linear' and 'angle' units of the file
+            'nodes': (OrderedDict) full path -> node record, in file order. A record is a dict with 'name', 'path',
+                'type', 'parent' (full path or None) and 'attrs' (attr -> (type, values) of kept node types)
+            'shared': (OrderedDict) shared node name -> number of attributes set on it
+            'connections': (list) (source plug, destination plug) pairs
+            'history': (dict) full path of a curve shape -> full path of the node connected to its create input
+            'children': (dict) full path of a node -> full paths of the nodes created under it
+    Raises RuntimeError if the first line isn't the Maya ASCII header
+    '''
+    lines = iter(lines)
+    if not next(lines, '').startswith(ma_header):
+        raise RuntimeError("{} is not a Maya ASCII file, it doesn't start with '{}'".format(path, ma_header))
+    info = {
+        'path': path,
+        'requires': [],
+        'file_info': {},
+        'units': {'linear': 'centimeter', 'angle': 'degree'},
+        'nodes': collections.OrderedDict(),
+        'shared': collections.OrderedDict(),
+        'connections': [],
+        'history': {},
+        'children': {},
+    }
+    paths_by_name = {}
+    # node the following setAttr lines apply to: a record, a shared node name or None
+    current = [None]
+
+    def keep(first_line):
+        if first_line.startswith('setAttr'):
+            return isinstance(current[0], dict) and current[0]['type'] in kept_node_types
+        return not first_line.startswith(('rename', 'addAttr', 'dataStructure', 'lockNode'))
+
+    for first_line, statement in iterStatements(lines, keep):
+        command = first_line.split(None, 1)[0].rstrip(';')
+        if statement is None:
+            if command == 'setAttr' and isinstance(current[0], str):
+                info['shared'][current[0]] += 1
+            continue
+        tokens = tokenize(statement)
+
+        if command == 'createNode':
+            record = parseCreateNode(tokens, paths_by_name)
+            info['nodes'][record['path']] = record
+            paths_by_name.setdefault(record['name'], []).append(record['path'])
+            info['children'].setdefault(record['parent'], []).append(record['path'])
+            current[0] = record
+        elif command == 'setAttr':
+            attr, attr_type, values = parseSetAttr(tokens)
+            if attr is not None:
+                current[0]['attrs'][attr] = (attr_type, values)
+        elif command == 'select':
+            # select -ne :defaultRenderGlobals edits a node every scene has
+            names = [token for token in tokens[1:] if not token.startswith('-')]
+            current[0] = names[-1] if names else None
+            if current[0] is not None:
+                info['shared'].setdefault(current[0], 0)
+        elif command == 'connectAttr':
+            plugs = [token for token in tokens[1:] if not token.startswith('-')]
+            if len(plugs) >= 2:
+                info['connections'].append((plugs[0], plugs[1]))
+                node, attr = plugs[1].rsplit('.', 1)
+                if attr in ('cr', 'create'):
+                    source = plugs[0].rsplit('.', 1)[0]
+                    info['history'][resolvePath(node, paths_by_name)] = resolvePath(source, paths_by_name)
+        elif command == 'requires':
+            info['requires'].append([token for token in tokens[1:] if not token.startswith('-')])
+        elif command == 'fileInfo' and len(tokens) >= 3:
+            info['file_info'][tokens[1]] = tokens[2]
+        elif command == 'currentUnit':
+            for flag, value in zip(tokens[1::2], tokens[2::2]):
+                if flag in ('-l', '-linear'):
+                    info['units']['linear'] = value
+                elif flag in ('-a', '-angle'):
+                    info['units']['angle'] = value
+        else:
+            current[0] = None
+    return info
+
+
+def parseCreateNode(tokens, paths_by_name):
+    '''
+    Returns the node record of a createNode statement
+    Args:
+        tokens: (list) words of the statement
+        paths_by_name: (dict) short name -> full paths of the nodes created so far, to resolve the parent
+    '''
+    node_type = tokens[1]
+    name = None
+    parent = None
+    i = 2
+    while i < len(tokens):
+        if tokens[i] in ('-n', '-name') and i + 1 < len(tokens):
+            name = tokens[i + 1]
+            i += 2
+        elif tokens[i] in ('-p', '-parent') and i + 1 < len(tokens):
+            parent = resolvePath(tokens[i + 1], paths_by_name)
+            i += 2
+        else:
+            i += 1
+    name = name or node_type + '1'
+    path = '{}|{}'.format(parent or '', name)
+    return {'name': name, 'path': path, 'type': node_type, 'parent': parent, 'attrs': {}}
+
+
+def resolvePath(name, paths_by_name):
+    '''
+    Returns the full path of a node given by its name or partial path, the last one created if it's ambiguous
+    '''
+    if name.startswith('|'):
+        return name
+    candidates = [path for path in paths_by_name.get(name.split('|')[-1], [])
+                  if path == name or path.endswith('|' + name)]
+    return candidates[-1] if candidates else '|' + name
+
+
+def parseSetAttr(tokens):
+    '''
+    Returns (attr, type, values) of a setAttr statement. attr is None if the statement doesn't set a value
+    '''
+    for i in range(1, len(tokens)):
+        if tokens[i].startswith('.'):
+            attr = tokens[i][1:]
+            values = tokens[i + 1:]
+            attr_type = None
+            if len(values) >= 2 and values[0] == '-type':
+                attr_type = values[1]
+                values = values[2:]
+            return attr, attr_type, values
+    return None, None, None
+
+
+# ---------------------------------------------------------------------------------------------
+# Reading attribute values
+
+def getAttrValue(record, attr, default=None):
+    '''
+    Returns the value words of an attribute set on a node, or default if it wasn't set
+    '''
+    value = record['attrs'].get(attr)
+    return value[1] if value is not None else default
+
+
+def getVector(record, attr, default):
+    '''
+    Returns a double3 attribute such as t, r or s as three floats, also reading single axis attributes like tx
+    '''
+    vector = [float(value) for value in getAttrValue(record, attr, [])[:3]] or list(default)
+    for i, axis in enumerate('xyz'):
+        component = getAttrValue(record, attr + axis)
+        if component:
+            vector[i] = float(component[0])
+    return vector
+
+
+def isIntermediate(record):
+    return getAttrValue(record, 'io', ['no'])[0] in ('yes', 'true', '1')
+
+
+def getLocalMatrix(record, angle_unit='degree'):
+    '''
+    Returns the local matrix of a transform or joint record as a flat row-major list of 16 floats
+    '''
+    to_degrees = 180.0 / math.pi if angle_unit.startswith('rad') else 1.0
+    translate = getVector(record, 't', (0.0, 0.0, 0.0))
+    rotate = [angle * to_degrees for angle in getVector(record, 'r', (0.0, 0.0, 0.0))]
+    scale = getVector(record, 's', (1.0, 1.0, 1.0))
+    rotate_order = rotate_orders[int(getAttrValue(record, 'ro', ['0'])[0])]
+    joint_orient = None
+    if record['type'] == 'joint':
+        joint_orient = [angle * to_degrees for angle in getVector(record, 'jo', (0.0, 0.0, 0.0))]
+    return composeMatrix(translate, rotate, scale, rotate_order, joint_orient)
+
+
+def getWorldMatrix(info, path, cache=None):
+    '''
+    Returns the world matrix of a transform from the transforms above it
+    Args:
+        info: (dict) from parseFile
+        path: (string) full path of the transform
+        cache: (dict) full path -> world matrix of transforms already worked out, filled in as it goes
+    '''
+    if cache is not None and path in cache:
+        return cache[path]
+    record = info['nodes'].get(path)
+    if record is None:
+        return identityMatrix()
+    matrix = identityMatrix()
+    if record['type'] in transform_types:
+        matrix = getLocalMatrix(record, info['units']['angle'])
+    if record['parent'] is not None:
+        matrix = multMatrix(matrix, getWorldMatrix(info, record['parent'], cache))
+    if cache is not None:
+        cache[path] = matrix
+    return matrix
+
+
+def getCurveData(info, record):
+    '''
+    Returns the curve data of a nurbsCurve record in the format of curves.getCurveData,
+    or None if the file doesn't hold it
+    '''
+    value = record['attrs'].get('cc')
+    curve = None
+    if value is not None and value[0] == 'nurbsCurve':
+        curve = parseCurveValues(value[1])
+    else:
+        source = info['nodes'].get(info['history'].get(record['path']))
+        if source is not None and source['type'] == 'makeNurbCircle':
+            curve = evaluateCircle(source)
+    if curve is not None:
+        curve['display'] = getDisplayValues(record)
+    return curve
+
+
+def getDisplayValues(record):
+    '''
+    Returns the display attributes set on a curve shape record that aren't at their default,
+    in the format of the 'display' of curve data, see templateFormat.display_attrs
+    '''
+    rgb = getAttrValue(record, 'ovrgb')
+    display = {}
+    for name, short_name, attr_type, default in templateFormat.display_attrs:
+        words = getAttrValue(record, short_name) or getAttrValue(record, name)
+        if not words and rgb and short_name in ('ovcr', 'ovcg', 'ovcb'):
+            words = [rgb[('ovcr', 'ovcg', 'ovcb').index(short_name)]]
+        if not words:
+            continue
+        if attr_type == 'bool':
+            value = words[0] in ('yes', 'true', '1')
+        elif attr_type == 'int':
+            value = int(words[0])
+        else:
+            value = float(words[0])
+        if value != default:
+            display[name] = value
+    return display
+
+
+def parseCurveValues(values):
+    '''
+    Reads the words of a nurbsCurve attribute value: degree, spans, form, rational, dimension,
+    knot count, knots, cv count and cvs
+    '''
+    degree = int(values[0])
+    form = int(values[2])
+    rational = values[3] in ('yes', 'true', '1')
+    dimension = int(values[4])
+    knot_count = int(values[5])
+    knots = [float(value) for value in values[6:6 + knot_count]]
+    cv_count = int(values[6 + knot_count])
+    numbers = [float(value) for value in values[7 + knot_count:]]
+    width = dimension + (1 if rational else 0)
+    cvs = []
+    for i in range(cv_count):
+        point = numbers[i * width:i * width + dimension]
+        cvs.append(point + [0.0] * (3 - len(point)))
+    # .ma forms are 0 open, 1 closed, 2 periodic. MFnNurbsCurve counts from 1
+    return {'cvs': cvs, 'knots': knots, 'degree': degree, 'form': form + 1}
+
+
+def evaluateCircle(record):
+    '''
+    Returns the curve data a makeNurbCircle node makes, or None for settings it can't reproduce (partial sweeps)
+    '''
+    normal = getVector(record, 'nr', (0.0, 0.0, 1.0))
+    center = getVector(record, 'c', (0.0, 0.0, 0.0))
+    radius = float(getAttrValue(record, 'r', ['1'])[0])
+    sections = int(getAttrValue(record, 's', ['8'])[0])
+    degree = int(getAttrValue(record, 'd', ['3'])[0])
+    sweep = float(getAttrValue(record, 'sw', ['360'])[0])
+    if abs(sweep - 360.0) > 1e-6 or degree not in (1, 3) or sections < 3:
+        return None
+
+    length = math.sqrt(sum(value * value for value in normal)) or 1.0
+    normal = [value / length for value in normal]
+    helper = [1.0, 0.0, 0.0] if abs(normal[0]) < 0.9 else [0.0, 1.0, 0.0]
+    u = normalize(cross(normal, helper))
+    v = cross(normal, u)
+
+    step = 2.0 * math.pi / sections
+    if degree == 3:
+        # cvs of a periodic cubic sit outside the circle so that the curve passes through it at each knot
+        cv_radius = radius * 6.0 / (4.0 + 2.0 * math.cos(step))
+    else:
+        cv_radius = radius
+    cvs = []
+    for i in range(sections):
+        cos_angle = math.cos(i * step) * cv_radius
+        sin_angle = math.sin(i * step) * cv_radius
+        cvs.append([center[axis] + u[axis] * cos_angle + v[axis] * sin_angle for axis in range(3)])
+    if degree == 3:
+        return {'cvs': cvs + cvs[:3], 'knots': [float(i) for i in range(-2, sections + 3)], 'degree': 3, 'form': 3}
+    return {'cvs': cvs + cvs[:1], 'knots': [float(i) for i in range(sections + 1)], 'degree': 1, 'form': 2}
+
+
+# ---------------------------------------------------------------------------------------------
+# Guides
+
+def getCurveShapes(info, path):
+    '''
+    Returns the records of the non intermediate curve shapes directly under a transform
+    '''
+    shapes = [info['nodes'][child] for child in info['children'].get(path, [])]
+    return [record for record in shapes if record['type'] == 'nurbsCurve' and not isIntermediate(record)]
+
+
+def getGuidePaths(info):
+    '''
+    Returns the full paths of the transforms that carry curve shapes, in file order
+    '''
+    parents = set(record['parent'] for record in info['nodes'].values()
+                  if record['type'] == 'nurbsCurve' and not isIntermediate(record))
+    return [path for path, record in info['nodes'].items()
+            if record['type'] in transform_types and path in parents]
+
+
+def getTemplatePaths(info):
+    '''
+    Returns the full paths of the guides and every transform above them, parents first
+    '''
+    wanted = set()
+    for path in getGuidePaths(info):
+        while path is not None and path not in wanted:
+            wanted.add(path)
+            record = info['nodes'].get(path)
+            path = record['parent'] if record else None
+    return [path for path, record in info['nodes'].items() if path in wanted and record['type'] in transform_types]
+
+
+def getSummary(info):
+    '''
+    Summarizes the guides of a parsed file
+    Args:
+        info: (dict) from parseFile
+    Returns:
+        summary: (dict) 'guides' (short names), 'count', 'hierarchy' (short name -> short name of the parent
+            transform, None at the top) and 'bbox' ([min xyz, max xyz] of all curve cvs in world space,
+            None if no curve data is known)
+    '''
+    guide_paths = getGuidePaths(info)
+    hierarchy = collections.OrderedDict()
+    for path in getTemplatePaths(info):
+        parent = info['nodes'][path]['parent']
+        hierarchy[path.split('|')[-1]] = parent.split('|')[-1] if parent else None
+
+    low = None
+    high = None
+    world_matrices = {}
+    for path in guide_paths:
+        matrix = getWorldMatrix(info, path, world_matrices)
+        for shape in getCurveShapes(info, path):
+            curve = getCurveData(info, shape)
+            if curve is None:
+                continue
+            for cv in curve['cvs']:
+                point = transformPoint(cv, matrix)
+                low = point if low is None else [min(a, b) for a, b in zip(low, point)]
+                high = point if high is None else [max(a, b) for a, b in zip(high, point)]
+
+    return {
+        'guides': [path.split('|')[-1] for path in guide_paths],
+        'count': len(guide_paths),
+        'hierarchy': hierarchy,
+        'bbox': [low, high] if low is not None else None,
+    }
+
+
+def toTemplate(info):
+    '''
+    Converts a parsed file to compact template data, see templateFormat.py
+    Args:
+        info: (dict) from parseFile
+    Returns:
+        template: (dict) template data
+    Raises RuntimeError if a curve shape has no curve data in the file
+    '''
+    paths = getTemplatePaths(info)
+    index = dict((path, i) for i, path in enumerate(paths))
+    guides = []
+    for path in paths:
+        record = info['nodes'][path]
+        parent = index.get(record['parent'])
+        if parent is None:
+            matrix = getWorldMatrix(info, path)
+        else:
+            matrix = getLocalMatrix(record, info['units']['angle'])
+        curves = []
+        for shape in getCurveShapes(info, path):
+            curve = getCurveData(info, shape)
+            if curve is None:
+                raise RuntimeError("Curve shape '{}' in {} has no curve data that can be read without Maya".format(
+                    shape['path'], info['path']))
+            curves.append(curve)
+        guides.append(templateFormat.makeGuide(record['name'], parent, matrix, curves))
+    return templateFormat.makeTemplate(guides)
+
+
+def convertFile(path, template_path):
+    '''
+    Converts a .ma template to the compact template format
+    Args:
+        path: (string) .ma file to read
+        template_path: (string) compact template file to write
+    Returns:
+        template: (dict) the template data that was written
+    '''
+    template = toTemplate(parseFile(path))
+    templateFormat.writeTemplate(template_path, template)
+    return template
+
+
+# ---------------------------------------------------------------------------------------------
+# Matrix helpers. Row-major 4x4 matrices as flat lists, points are row vectors like in Maya
+
+def identityMatrix():
+    return [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+
+
+def multMatrix(a, b):
+    return [sum(a[row * 4 + i] * b[i * 4 + column] for i in range(4)) for row in range(4) for column in range(4)]
+
+
+def axisRotation(axis, degrees):
+    angle = math.radians(degrees)
+    c, s = math.cos(angle), math.sin(angle)
+    if axis == 'x':
+        return [1.0, 0.0, 0.0, 0.0, 0.0, c, s, 0.0, 0.0, -s, c, 0.0, 0.0, 0.0, 0.0, 1.0]
+    if axis == 'y':
+        return [c, 0.0, -s, 0.0, 0.0, 1.0, 0.0, 0.0, s, 0.0, c, 0.0, 0.0, 0.0, 0.0, 1.0]
+    return [c, s, 0.0, 0.0, -s, c, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+
+
+def rotationMatrix(rotate, rotate_order='xyz'):
+    matrix = identityMatrix()
+    for axis in rotate_order:
+        matrix = multMatrix(matrix, axisRotation(axis, rotate['xyz'.index(axis)]))
+    return matrix
+
+
+def composeMatrix(translate, rotate, scale, rotate_order='xyz', joint_orient=None):
+    '''
+    Returns scale * rotate * joint orient * translate, the local matrix of a transform without pivots
+    '''
+    matrix = [scale[0], 0.0, 0.0, 0.0, 0.0, scale[1], 0.0, 0.0, 0.0, 0.0, scale[2], 0.0, 0.0, 0.0, 0.0, 1.0]
+    matrix = multMatrix(matrix, rotationMatrix(rotate, rotate_order))
+    if joint_orient:
+        matrix = multMatrix(matrix, rotationMatrix(joint_orient))
+    matrix[12:15] = [matrix[12] + translate[0], matrix[13] + translate[1], matrix[14] + translate[2]]
+    return matrix
+
+
+def transformPoint(point, matrix):
+    return [point[0] * matrix[column] + point[1] * matrix[4 + column] + point[2] * matrix[8 + column] +
+            matrix[12 + column] for column in range(3)]
+
+
+def cross(a, b):
+    return [a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]]
+
+
+def normalize(vector):
+    length = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / length for value in vector]
@@ -0,0 +1,1665 @@
+'''
+In-memory stand-in for the parts of Maya this package uses
+
+Lets ghostControlRigger and templates run in a plain Python interpreter so builds can be
+benchmarked and checked without a Maya licence. It is a small scene graph, not Maya:
+    - node names are kept unique across the whole scene (Maya only needs unique names per parent)
+    - transforms only support the xyz rotate order and no shear, pivots or rotate axis
+    - connections are followed when values are read, there is no dirty propagation
+    - files written by file(exportSelected=True) / file(save=True) are JSON, not Maya ASCII
+    - Maya ASCII files are imported through maParser.py, which only brings in the guide transforms and curves
+    - undo only reverts what maya.cmds commands and undoable plug-in commands changed, like Maya's undo queue.
+      Changes made with OpenMaya outside of a command stay when they are undone, as they would in Maya
+    - maya.utils.executeDeferred calls only run when maya.utils.processIdleEvents is called
+
+How to run:
+from ghostControlRigger import mayaStandIn
+mayaStandIn.install()
+from ghostControlRigger import ghostControlRigger as r
+'''
+
+import collections
+import copy
+import functools
+import fnmatch
+import importlib.util
+import json
+import math
+import os
+import re
+import sys
+import types
+
+
+# ---------------------------------------------------------------------------------------------
+# Matrix helpers. Matrices are row-major lists of 16 floats using Maya's row vector convention,
+# so child world matrix = child local matrix * parent world matrix.
+
+def identityMatrix():
+    return [1.0, 0.0, 0.0, 0.0,
+            0.0, 1.0, 0.0, 0.0,
+            0.0, 0.0, 1.0, 0.0,
+            0.0, 0.0, 0.0, 1.0]
+
+
+def multMatrix(a, b):
+    '''
+    Returns a * b
+    '''
+    result = [0.0] * 16
+    for row in range(4):
+        for col in range(4):
+            result[row * 4 + col] = (a[row * 4] * b[col] +
+                                     a[row * 4 + 1] * b[4 + col] +
+                                     a[row * 4 + 2] * b[8 + col] +
+                                     a[row * 4 + 3] * b[12 + col])
+    return result
+
+
+def inverseMatrix(m):
+    '''
+    Returns the inverse of m using Gauss-Jordan elimination
+    '''
+    a = [list(m[row * 4:row * 4 + 4]) + [1.0 if row == col else 0.0 for col in range(4)] for row in range(4)]
+    for col in range(4):
+        pivot = max(range(col, 4), key=lambda row: abs(a[row][col]))
+        if abs(a[pivot][col]) < 1e-12:
+            raise RuntimeError('Matrix is not invertible')
+        a[col], a[pivot] = a[pivot], a[col]
+        scale = a[col][col]
+        a[col] = [value / scale for value in a[col]]
+        for row in range(4):
+            if row != col and a[row][col]:
+                factor = a[row][col]
+                a[row] = [value - factor * pivot_value for value, pivot_value in zip(a[row], a[col])]
+    return [a[row][4 + col] for row in range(4) for col in range(4)]
+
+
+def rotationMatrix(rotate):
+    '''
+    Returns the matrix of euler rotation (degrees) in xyz rotate order
+    '''
+    x, y, z = [math.radians(value) for value in rotate]
+    cx, sx = math.cos(x), math.sin(x)
+    cy, sy = math.cos(y), math.sin(y)
+    cz, sz = math.cos(z), math.sin(z)
+    rx = [1, 0, 0, 0, 0, cx, sx, 0, 0, -sx, cx, 0, 0, 0, 0, 1]
+    ry = [cy, 0, -sy, 0, 0, 1, 0, 0, sy, 0, cy, 0, 0, 0, 0, 1]
+    rz = [cz, sz, 0, 0, -sz, cz, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1]
+    return multMatrix(multMatrix(rx, ry), rz)
+
+
+def composeMatrix(translate, rotate, scale, joint_orient=None):
+    '''
+    Returns scale * rotate * jointOrient * translate
+    '''
+    m = [scale[0], 0.0, 0.0, 0.0, 0.0, scale[1], 0.0, 0.0, 0.0, 0.0, scale[2], 0.0, 0.0, 0.0, 0.0, 1.0]
+    m = multMatrix(m, rotationMatrix(rotate))
+    if joint_orient:
+        m = multMatrix(m, rotationMatrix(joint_orient))
+    m[12], m[13], m[14] = translate
+    return m
+
+
+def decomposeMatrix(m, joint_orient=None):
+    '''
+    Splits a matrix without shear into translate, rotate (degrees, xyz) and scale
+    '''
+    translate = [m[12], m[13], m[14]]
+    scale = [math.sqrt(m[row * 4] ** 2 + m[row * 4 + 1] ** 2 + m[row * 4 + 2] ** 2) for row in range(3)]
+    rot = identityMatrix()
+    for row in range(3):
+        for col in range(3):
+            rot[row * 4 + col] = m[row * 4 + col] / scale[row] if scale[row] else 0.0
+    # flip one axis back if the matrix is mirrored
+    det = (rot[0] * (rot[5] * rot[10] - rot[6] * rot[9]) -
+           rot[1] * (rot[4] * rot[10] - rot[6] * rot[8]) +
+           rot[2] * (rot[4] * rot[9] - rot[5] * rot[8]))
+    if det < 0:
+        scale[0] = -scale[0]
+        rot[0], rot[1], rot[2] = -rot[0], -rot[1], -rot[2]
+    if joint_orient:
+        rot = multMatrix(rot, inverseMatrix(rotationMatrix(joint_orient)))
+    sin_y = max(-1.0, min(1.0, -rot[2]))
+    y = math.asin(sin_y)
+    if abs(math.cos(y)) > 1e-9:
+        x = math.atan2(rot[6], rot[10])
+        z = math.atan2(rot[1], rot[0])
+    else:
+        z = 0.0
+        x = math.atan2(rot[4] / sin_y, rot[5])
+    return translate, [math.degrees(x), math.degrees(y), math.degrees(z)], scale
+
+
+# ---------------------------------------------------------------------------------------------
+# Scene graph
+
+# short and long attribute names that mean the same thing
+attr_aliases = {
+    't': 'translate', 'r': 'rotate', 's': 'scale', 'v': 'visibility',
+    'tx': 'translateX', 'ty': 'translateY', 'tz': 'translateZ',
+    'rx': 'rotateX', 'ry': 'rotateY', 'rz': 'rotateZ',
+    'sx': 'scaleX', 'sy': 'scaleY', 'sz': 'scaleZ',
+    'm': 'matrix', 'wm': 'worldMatrix', 'wim': 'worldInverseMatrix', 'pm': 'parentMatrix',
+    'opm': 'offsetParentMatrix', 'jo': 'jointOrient', 'ssc': 'segmentScaleCompensate',
+    'is': 'inverseScale', 'cc': 'cached', 'cr': 'create', 'ws': 'worldSpace', 'io': 'intermediateObject',
+    'i': 'matrixIn', 'o': 'matrixSum',
+    'ove': 'overrideEnabled', 'ovdt': 'overrideDisplayType', 'ovlod': 'overrideLevelOfDetail',
+    'ovs': 'overrideShading', 'ovt': 'overrideTexturing', 'ovp': 'overridePlayback', 'ovv': 'overrideVisibility',
+    'ovc': 'overrideColor', 'ovrgbf': 'overrideRGBColors', 'ovcr': 'overrideColorR', 'ovcg': 'overrideColorG',
+    'ovcb': 'overrideColorB', 'lw': 'lineWidth', 'adot': 'alwaysDrawOnTop',
+}
+# values of attributes that aren't 0 or False until they are set
+attr_defaults = {'overrideShading': True, 'overrideTexturing': True, 'overridePlayback': True,
+                 'overrideVisibility': True, 'lineWidth': -1.0}
+vector_attrs = {'translate': [0.0, 0.0, 0.0], 'rotate': [0.0, 0.0, 0.0], 'scale': [1.0, 1.0, 1.0],
+                'jointOrient': [0.0, 0.0, 0.0]}
+dag_types = ('transform', 'joint', 'nurbsCurve')
+shape_types = ('nurbsCurve',)
+
+
+def longAttr(attr):
+    '''
+    Returns the long name of an attribute, keeping any [index] suffix
+    '''
+    match = re.match(r'^(\w+)(\[.*\])?$', attr)
+    if not match:
+        return attr
+    name = attr_aliases.get(match.group(1), match.group(1))
+    if name in ('translateX', 'translateY', 'translateZ', 'rotateX', 'rotateY', 'rotateZ',
+                'scaleX', 'scaleY', 'scaleZ'):
+        return name
+    return name + (match.group(2) or '')
+
+
+class Node(object):
+
+    def __init__(self, name, node_type):
+        self.name = name
+        self.type = node_type
+        self.parent = None
+        self.children = []
+        self.attrs = {}
+        self.curve = None
+
+    def isDag(self):
+        return self.type in dag_types
+
+    def fullPath(self):
+        names = []
+        node = self
+        while node:
+            names.append(node.name)
+            node = node.parent
+        return '|' + '|'.join(reversed(names))
+
+    def depth(self):
+        depth = 1
+        node = self.parent
+        while node:
+            depth += 1
+            node = node.parent
+        return depth
+
+
+class UndoStep(list):
+    '''
+    (undo, redo) functions of the changes of one undo step, and its name as undoInfo -undoName returns it
+    '''
+
+    def __init__(self, changes=(), name=''):
+        super(UndoStep, self).__init__(changes)
+        self.name = name
+
+
+class Scene(object):
+    '''
+    Holds every node and connection of the stand-in scene, plus per-command call counts
+    '''
+
+    def __init__(self):
+        self.nodes = {}
+        self.name_counters = {}
+        self.connections = {}
+        self.selection = []
+        self.calls = collections.Counter()
+        self.filename = None
+        # undo steps, each an UndoStep of the changes it made
+        self.undo_stack = []
+        self.redo_stack = []
+        self.open_chunks = []
+        # changes of the command that is running, None when no command records them
+        self.journal = None
+
+    # naming
+    def uniqueName(self, name):
+        if name not in self.nodes:
+            return name
+        base = name.rstrip('0123456789')
+        index = self.name_counters.get(base, 1)
+        while '{}{}'.format(base, index) in self.nodes:
+            index += 1
+        self.name_counters[base] = index
+        return '{}{}'.format(base, index)
+
+    def defaultName(self, node_type):
+        return self.uniqueName('{}1'.format(node_type))
+
+    # lookups
+    def find(self, name):
+        '''
+        Returns the node for a short name, partial path or full path
+        '''
+        if isinstance(name, Node):
+            return name
+        name = str(name)
+        leaf = name.split('|')[-1]
+        node = self.nodes.get(leaf)
+        if node is None:
+            raise ValueError("No object matches name: {}".format(name))
+        if '|' in name:
+            path = [part for part in name.split('|') if part]
+            check = node
+            for part in reversed(path):
+                if check is None or check.name != part:
+                    raise ValueError("No object matches name: {}".format(name))
+                check = check.parent
+            if name.startswith('|') and check is not None:
+                raise ValueError("No object matches name: {}".format(name))
+        return node
+
+    def exists(self, name):
+        try:
+            self.find(name)
+        except ValueError:
+            return False
+        return True
+
+    def splitPlug(self, plug):
+        if isinstance(plug, tuple):
+            return plug
+        node_name, attr = plug.split('.', 1)
+        return self.find(node_name), longAttr(attr)
+
+    # creation and deletion
+    def createNode(self, node_type, name=None, parent=None):
+        node = self.newNode(node_type, name)
+        self.addNode(node, None if parent is None else self.find(parent))
+        return node
+
+    def newNode(self, node_type, name=None):
+        '''
+        Returns a node that isn't in the scene yet, see addNode
+        '''
+        node = Node(name or self.defaultName(node_type), node_type)
+        if node_type in ('transform', 'joint'):
+            for attr, value in vector_attrs.items():
+                if attr != 'jointOrient' or node_type == 'joint':
+                    node.attrs[attr] = list(value)
+            node.attrs['visibility'] = True
+        if node_type == 'joint':
+            node.attrs['segmentScaleCompensate'] = True
+        return node
+
+    def addNode(self, node, parent=None):
+        '''
+        Adds a node from newNode to the scene under a unique name
+        '''
+        node.name = self.uniqueName(node.name)
+        self.setNodeName(node, None, node.name)
+        if parent is not None:
+            self.setParent(node, parent)
+
+    def setParent(self, node, parent):
+        old_parent = node.parent
+        index = old_parent.children.index(node) if old_parent is not None else None
+        self.moveNode(node, parent)
+        self.record(functools.partial(self.moveNode, node, old_parent, index),
+                    functools.partial(self.moveNode, node, parent))
+
+    def moveNode(self, node, parent, index=None):
+        if node.parent is not None:
+            node.parent.children.remove(node)
+        node.parent = parent
+        if parent is not None:
+            parent.children.insert(len(parent.children) if index is None else index, node)
+
+    def deleteNode(self, node):
+        for child in list(node.children):
+            self.deleteNode(child)
+        if node.parent is not None:
+            self.setParent(node, None)
+        for key, source in list(self.connections.items()):
+            if key[0] is node or source[0] is node:
+                self.disconnect(key)
+        if node in self.selection:
+            self.setSelection([each for each in self.selection if each is not node])
+        if self.nodes.get(node.name) is node:
+            self.setNodeName(node, node.name, None)
+
+    def rename(self, node, new_name):
+        old_name = node.name
+        self.setNodeName(node, old_name, self.uniqueName(new_name))
+        return node.name
+
+    def setNodeName(self, node, old_name, new_name):
+        '''
+        Changes the name a node is listed under. A None name adds the node to the scene or removes it
+        '''
+        self.nameNode(node, old_name, new_name)
+        self.record(functools.partial(self.nameNode, node, new_name, old_name),
+                    functools.partial(self.nameNode, node, old_name, new_name))
+
+    def nameNode(self, node, old_name, new_name):
+        if old_name is not None:
+            del self.nodes[old_name]
+        if new_name is not None:
+            node.name = new_name
+            self.nodes[new_name] = node
+
+    # connections and selection
+    def connect(self, destination, source):
+        '''
+        Connects a (node, attr) source to a (node, attr) destination, replacing what drove it
+        '''
+        old_source = self.connections.get(destination)
+        self.connections[destination] = source
+        self.record(functools.partial(self.setConnection, destination, old_source),
+                    functools.partial(self.setConnection, destination, source))
+
+    def disconnect(self, destination):
+        '''
+        Returns:
+            source: (tuple) (node, attr) that drove the destination, None if it wasn't connected
+        '''
+        old_source = self.connections.pop(destination, None)
+        self.record(functools.partial(self.setConnection, destination, old_source),
+                    functools.partial(self.setConnection, destination, None))
+        return old_source
+
+    def setConnection(self, destination, source):
+        if source is None:
+            self.connections.pop(destination, None)
+        else:
+            self.connections[destination] = source
+
+    def setSelection(self, nodes):
+        old_selection = self.selection
+        self.selection = list(nodes)
+        self.record(functools.partial(setattr, self, 'selection', old_selection),
+                    functools.partial(setattr, self, 'selection', self.selection))
+
+    def descendants(self, node):
+        result = []
+        for child in node.children:
+            result.append(child)
+            result.extend(self.descendants(child))
+        return result
+
+    # values
+    def localMatrix(self, node):
+        if node.type not in ('transform', 'joint'):
+            return identityMatrix()
+        translate = self.getValue(node, 'translate')
+        rotate = self.getValue(node, 'rotate')
+        scale = self.getValue(node, 'scale')
+        joint_orient = node.attrs.get('jointOrient') if node.type == 'joint' else None
+        return composeMatrix(translate, rotate, scale, joint_orient)
+
+    def worldMatrix(self, node):
+        matrix = identityMatrix()
+        while node is not None:
+            if node.type in ('transform', 'joint'):
+                matrix = multMatrix(matrix, multMatrix(self.localMatrix(node),
+                                                       self.getValue(node, 'offsetParentMatrix')))
+            node = node.parent
+        return matrix
+
+    def setWorldMatrix(self, node, matrix):
+        parent_world = self.worldMatrix(node.parent) if node.parent else identityMatrix()
+        offset = self.getValue(node, 'offsetParentMatrix')
+        local = multMatrix(matrix, inverseMatrix(multMatrix(offset, parent_world)))
+        self.setLocalMatrix(node, local)
+
+    def setLocalMatrix(self, node, matrix):
+        joint_orient = node.attrs.get('jointOrient') if node.type == 'joint' else None
+        translate, rotate, scale = decomposeMatrix(matrix, joint_orient)
+        self.setPlug(node, 'translate', translate)
+        self.setPlug(node, 'rotate', rotate)
+        self.setPlug(node, 'scale', scale)
+
+    def getValue(self, node, attr):
+        attr = longAttr(attr)
+        source = self.connections.get((node, attr))
+        if source is not None:
+            return self.getValue(source[0], source[1])
+        for vector in ('translate', 'rotate', 'scale'):
+            if attr.startswith(vector) and len(attr) == len(vector) + 1:
+                return self.getValue(node, vector)['XYZ'.index(attr[-1])]
+        if attr in ('translate', 'rotate', 'scale'):
+            value = list(node.attrs.get(attr, vector_attrs[attr]))
+            for i, axis in enumerate('XYZ'):
+                child = self.connections.get((node, attr + axis))
+                if child is not None:
+                    value[i] = self.getValue(child[0], child[1])
+            return value
+        if attr == 'matrix':
+            return self.localMatrix(node)
+        if attr in ('worldMatrix', 'worldMatrix[0]'):
+            return self.worldMatrix(node)
+        if attr in ('worldInverseMatrix', 'worldInverseMatrix[0]'):
+            return inverseMatrix(self.worldMatrix(node))
+        if attr in ('parentMatrix', 'parentMatrix[0]'):
+            return self.worldMatrix(node.parent) if node.parent else identityMatrix()
+        if attr == 'offsetParentMatrix':
+            return node.attrs.get(attr, identityMatrix())
+        if attr == 'matrixSum':
+            matrix = identityMatrix()
+            indices = set()
+            for key in list(node.attrs) + [key[1] for key in self.connections if key[0] is node]:
+                match = re.match(r'^matrixIn\[(\d+)\]$', key)
+                if match:
+                    indices.add(int(match.group(1)))
+            for index in sorted(indices):
+                matrix = multMatrix(matrix, self.getValue(node, 'matrixIn[{}]'.format(index)))
+            return matrix
+        if attr.startswith('matrixIn['):
+            return node.attrs.get(attr, identityMatrix())
+        return node.attrs.get(attr)
+
+    def setPlug(self, node, attr, value):
+        '''
+        Sets the value of a plug. Child plugs of translate, rotate and scale set one value of their vector
+        Returns:
+            undo: what restorePlug needs to set the plug back
+        '''
+        attr = longAttr(attr)
+        if attr == 'cached':
+            # the curve of a shape
+            undo = (node, attr, True, node.curve)
+            value = copy.deepcopy(value)
+        else:
+            key = attr
+            if attr[:-1] in ('translate', 'rotate', 'scale') and attr[-1] in 'XYZ':
+                key = attr[:-1]
+                vector = list(node.attrs.get(key, vector_attrs[key]))
+                vector['XYZ'.index(attr[-1])] = value
+                value = vector
+            undo = (node, key, key in node.attrs, node.attrs.get(key))
+        redo = (undo[0], undo[1], True, value)
+        self.restorePlug(redo)
+        self.record(functools.partial(self.restorePlug, undo), functools.partial(self.restorePlug, redo))
+        return undo
+
+    def restorePlug(self, undo):
+        node, key, existed, value = undo
+        if key == 'cached':
+            node.curve = value
+        elif existed:
+            node.attrs[key] = value
+        else:
+            node.attrs.pop(key, None)
+
+    # undo
+    def record(self, undo, redo):
+        '''
+        Adds a change to the journal of the running command, see undoable
+        '''
+        if self.journal is not None:
+            self.journal.append((undo, redo))
+
+    def addUndoStep(self, changes, name=''):
+        '''
+        Adds the changes of a command to the open undo chunk, or as a step of its own
+        Args:
+            changes: (list) (undo, redo) functions
+            name: (string) name of the step, the command or chunk name
+        '''
+        if not changes:
+            return
+        if self.open_chunks:
+            self.open_chunks[-1].extend(changes)
+        else:
+            self.undo_stack.append(UndoStep(changes, name))
+        self.redo_stack = []
+
+
+scene = Scene()
+
+
+# ---------------------------------------------------------------------------------------------
+# maya.cmds
+
+def flag(kwargs, short, long_name, default=None):
+    '''
+    Returns the value of a command flag given by either its short or long name
+    '''
+    if short in kwargs:
+        return kwargs[short]
+    return kwargs.get(long_name, default)
+
+
+def asList(objects):
+    if objects is None:
+        return []
+    if isinstance(objects, (list, tuple)):
+        result = []
+        for each in objects:
+            result.extend(asList(each))
+        return result
+    return [objects]
+
+
+def targets(args):
+    '''
+    Returns the nodes given as command arguments, or the selection if none were given
+    '''
+    names = asList(list(args))
+    if not names:
+        return list(scene.selection)
+    return [scene.find(name) for name in names]
+
+
+def outName(node, long_names=False):
+    return node.fullPath() if long_names else node.name
+
+
+def createCircleCurve(radius=1.0):
+    cvs = []
+    for i in range(8):
+        angle = 2.0 * math.pi * i / 8.0
+        cvs.append([math.cos(angle) * radius, math.sin(angle) * radius, 0.0])
+    cvs += cvs[:3]
+    return {'cvs': cvs, 'knots': [float(i) for i in range(-2, 11)], 'degree': 3, 'form': 2}
+
+
+def cmd_group(*args, **kwargs):
+    if not flag(kwargs, 'em', 'empty'):
+        raise RuntimeError('mayaStandIn.group only supports empty groups')
+    node = scene.createNode('transform', flag(kwargs, 'n', 'name') or 'group1', flag(kwargs, 'p', 'parent'))
+    scene.setSelection([node])
+    return node.name
+
+
+def cmd_createNode(node_type, **kwargs):
+    node = scene.createNode(node_type, flag(kwargs, 'n', 'name'), flag(kwargs, 'p', 'parent'))
+    if not flag(kwargs, 'ss', 'skipSelect'):
+        scene.setSelection([node])
+    return node.name
+
+
+def cmd_circle(**kwargs):
+    transform = scene.createNode('transform', flag(kwargs, 'n', 'name') or 'nurbsCircle1')
+    shape = scene.createNode('nurbsCurve', transform.name + 'Shape', transform)
+    shape.curve = createCircleCurve(flag(kwargs, 'r', 'radius', 1.0))
+    history = scene.createNode('makeNurbCircle', 'makeNurbCircle1')
+    scene.connect((shape, 'create'), (history, 'outputCurve'))
+    scene.setSelection([transform])
+    return [transform.name, history.name]
+
+
+def cmd_joint(*args, **kwargs):
+    parent = None
+    if scene.selection and scene.selection[-1].type == 'joint':
+        parent = scene.selection[-1]
+    node = scene.createNode('joint', flag(kwargs, 'n', 'name') or 'joint1', parent)
+    scene.setSelection([node])
+    return node.name
+
+
+def cmd_parent(*args, **kwargs):
+    names = asList(list(args))
+    world = flag(kwargs, 'w', 'world')
+    relative = flag(kwargs, 'r', 'relative')
+    if world:
+        children, parent = [scene.find(name) for name in names], None
+    else:
+        children, parent = [scene.find(name) for name in names[:-1]], scene.find(names[-1])
+    result = []
+    for child in children:
+        if child.parent is parent:
+            raise RuntimeError("Object '{}' is already a child of '{}'.".format(child.name, parent.name if parent else 'world'))
+        if child.isDag() and child.type not in shape_types and not relative:
+            world_matrix = scene.worldMatrix(child)
+            scene.setParent(child, parent)
+            scene.setWorldMatrix(child, world_matrix)
+        else:
+            scene.setParent(child, parent)
+        result.append(child.name)
+    return result
+
+
+def cmd_listRelatives(*args, **kwargs):
+    nodes = targets(args)
+    long_names = flag(kwargs, 'f', 'fullPath')
+    node_type = flag(kwargs, 'typ', 'type')
+    result = []
+    for node in nodes:
+        if flag(kwargs, 'p', 'parent') or flag(kwargs, 'ap', 'allParents'):
+            found = [node.parent] if node.parent else []
+        elif flag(kwargs, 'ad', 'allDescendents'):
+            found = list(reversed(scene.descendants(node)))
+        else:
+            found = list(node.children)
+        if flag(kwargs, 's', 'shapes'):
+            found = [each for each in found if each.type in shape_types]
+        if node_type:
+            types_wanted = asList(node_type)
+            found = [each for each in found if each.type in types_wanted or
+                     ('transform' in types_wanted and each.type == 'joint')]
+        for each in found:
+            name = outName(each, long_names)
+            if name not in result:
+                result.append(name)
+    return result or None
+
+
+def cmd_matchTransform(source, target, **kwargs):
+    source, target = scene.find(source), scene.find(target)
+    scene.setWorldMatrix(source, scene.worldMatrix(target))
+
+
+def cmd_xform(*args, **kwargs):
+    node = targets(args)[0]
+    world_space = flag(kwargs, 'ws', 'worldSpace')
+    if flag(kwargs, 'q', 'query'):
+        if flag(kwargs, 'm', 'matrix'):
+            return scene.worldMatrix(node) if world_space else scene.localMatrix(node)
+        if flag(kwargs, 't', 'translation'):
+            matrix = scene.worldMatrix(node) if world_space else scene.localMatrix(node)
+            return matrix[12:15]
+        raise RuntimeError('mayaStandIn.xform query only supports matrix and translation')
+    matrix = flag(kwargs, 'm', 'matrix')
+    if matrix is not None:
+        if world_space:
+            scene.setWorldMatrix(node, list(matrix))
+        else:
+            scene.setLocalMatrix(node, list(matrix))
+    translation = flag(kwargs, 't', 'translation')
+    if translation is not None:
+        scene.setPlug(node, 'translate', list(translation))
+
+
+def cmd_connectAttr(source, destination, **kwargs):
+    src = scene.splitPlug(source)
+    dst = scene.splitPlug(destination)
+    if dst in scene.connections and not flag(kwargs, 'f', 'force'):
+        raise RuntimeError("The destination attribute '{}' is already connected.".format(destination))
+    scene.connect(dst, src)
+
+
+def cmd_disconnectAttr(source, destination, **kwargs):
+    scene.disconnect(scene.splitPlug(destination))
+
+
+def cmd_listConnections(*args, **kwargs):
+    names = asList(list(args))
+    if not names:
+        return None
+    queried = {}
+    for name in names:
+        if '.' in str(name):
+            node, attr = scene.splitPlug(name)
+        else:
+            node, attr = scene.find(name), None
+        queried.setdefault(node, set()).add(attr)
+
+    def matches(node, attr):
+        attrs = queried.get(node)
+        return attrs is not None and (None in attrs or attr in attrs)
+
+    sources = flag(kwargs, 's', 'source', True)
+    destinations = flag(kwargs, 'd', 'destination', True)
+    plugs = flag(kwargs, 'p', 'plugs')
+    with_connections = flag(kwargs, 'c', 'connections')
+    result = []
+    for (dst_node, dst_attr), (src_node, src_attr) in scene.connections.items():
+        if sources and matches(dst_node, dst_attr):
+            if with_connections:
+                result.append('{}.{}'.format(dst_node.name, dst_attr))
+            result.append('{}.{}'.format(src_node.name, src_attr) if plugs else src_node.name)
+        if destinations and matches(src_node, src_attr):
+            if with_connections:
+                result.append('{}.{}'.format(src_node.name, src_attr))
+            result.append('{}.{}'.format(dst_node.name, dst_attr) if plugs else dst_node.name)
+    return result or None
+
+
+def cmd_duplicate(*args, **kwargs):
+    nodes = targets(args)
+    result = []
+    for node in nodes:
+        copied = duplicateNode(node, node.parent)
+        result.append(copied[0].name)
+        if flag(kwargs, 'rc', 'renameChildren'):
+            result.extend(each.name for each in copied[1:])
+    scene.setSelection([scene.find(result[0])])
+    return result
+
+
+def duplicateNode(node, parent):
+    new_node = scene.createNode(node.type, node.name, parent)
+    new_node.attrs = copy.deepcopy(node.attrs)
+    new_node.curve = copy.deepcopy(node.curve)
+    copied = [new_node]
+    for child in list(node.children):
+        copied.extend(duplicateNode(child, new_node))
+    return copied
+
+
+def cmd_delete(*args, **kwargs):
+    for node in targets(args):
+        if scene.nodes.get(node.name) is node:
+            scene.deleteNode(node)
+
+
+def cmd_objExists(name):
+    name = str(name)
+    if '.' in name:
+        node_name, attr = name.split('.', 1)
+        if not scene.exists(node_name):
+            return False
+        return attributeExists(scene.find(node_name), longAttr(attr))
+    return scene.exists(name)
+
+
+def attributeExists(node, attr):
+    if attr in node.attrs or attr in ('matrix', 'worldMatrix', 'worldInverseMatrix', 'parentMatrix'):
+        return True
+    if node.type in ('transform', 'joint') and attr in ('offsetParentMatrix', 'translateX', 'translateY',
+                                                       'translateZ', 'rotateX', 'rotateY', 'rotateZ',
+                                                       'scaleX', 'scaleY', 'scaleZ'):
+        return True
+    return False
+
+
+def cmd_ls(*args, **kwargs):
+    long_names = flag(kwargs, 'l', 'long')
+    node_type = asList(flag(kwargs, 'typ', 'type'))
+    objects_only = flag(kwargs, 'o', 'objectsOnly')
+    if flag(kwargs, 'sl', 'selection'):
+        nodes = list(scene.selection)
+    elif args:
+        nodes = []
+        for pattern in asList(list(args)):
+            pattern = str(pattern)
+            attr = None
+            if '.' in pattern:
+                pattern, attr = pattern.split('.', 1)
+                attr = longAttr(attr)
+            if scene.exists(pattern):
+                found = [scene.find(pattern)]
+            elif not any(char in pattern for char in '*?['):
+                found = []
+            else:
+                found = [node for name, node in scene.nodes.items() if fnmatch.fnmatchcase(name, pattern)]
+            for node in found:
+                if attr and not attributeExists(node, attr):
+                    continue
+                if node not in nodes:
+                    nodes.append(node)
+            if attr and not objects_only:
+                return ['{}.{}'.format(outName(node, long_names), attr) for node in nodes] or []
+    else:
+        nodes = list(scene.nodes.values())
+    if node_type:
+        nodes = [node for node in nodes if node.type in node_type or
+                 ('transform' in node_type and node.type == 'joint')]
+    return [outName(node, long_names) for node in nodes]
+
+
+def cmd_select(*args, **kwargs):
+    if flag(kwargs, 'cl', 'clear'):
+        scene.setSelection([])
+        return
+    nodes = [scene.find(name) for name in asList(list(args))]
+    if flag(kwargs, 'add', 'add'):
+        scene.setSelection(scene.selection + [node for node in nodes if node not in scene.selection])
+    elif flag(kwargs, 'd', 'deselect'):
+        scene.setSelection([node for node in scene.selection if node not in nodes])
+    else:
+        scene.setSelection(nodes)
+
+
+def cmd_hide(*args, **kwargs):
+    for node in targets(args):
+        scene.setPlug(node, 'visibility', False)
+
+
+def cmd_showHidden(*args, **kwargs):
+    for node in targets(args):
+        scene.setPlug(node, 'visibility', True)
+
+
+def cmd_getAttr(plug, **kwargs):
+    node, attr = scene.splitPlug(plug)
+    if attr == 'visibility':
+        return bool(scene.getValue(node, attr))
+    value = scene.getValue(node, attr)
+    if value is None:
+        return attr_defaults.get(attr)
+    if attr in ('translate', 'rotate', 'scale', 'jointOrient'):
+        return [tuple(value)]
+    return copy.deepcopy(value)
+
+
+def cmd_setAttr(plug, *values, **kwargs):
+    node, attr = scene.splitPlug(plug)
+    value_type = flag(kwargs, 'typ', 'type')
+    if (node, attr) in scene.connections:
+        raise RuntimeError("setAttr: The attribute '{}' is locked or connected and cannot be modified.".format(plug))
+    if value_type == 'matrix':
+        scene.setPlug(node, attr, list(values[0]))
+    elif len(values) == 3:
+        scene.setPlug(node, attr, list(values))
+    else:
+        scene.setPlug(node, attr, values[0])
+
+
+def cmd_addAttr(*args, **kwargs):
+    node = targets(args)[0]
+    attr = flag(kwargs, 'ln', 'longName')
+    data_type = flag(kwargs, 'dt', 'dataType')
+    if attr in node.attrs:
+        raise RuntimeError("Found more than one attribute named '{}'".format(attr))
+    scene.setPlug(node, attr, '' if data_type == 'string' else flag(kwargs, 'dv', 'defaultValue', 0))
+
+
+def cmd_attributeQuery(attr, **kwargs):
+    node = scene.find(flag(kwargs, 'n', 'node'))
+    return attributeExists(node, longAttr(attr))
+
+
+def cmd_rename(old, new, **kwargs):
+    return scene.rename(scene.find(old), new)
+
+
+def cmd_objectType(name, **kwargs):
+    return scene.find(name).type
+
+
+def cmd_undoInfo(**kwargs):
+    if flag(kwargs, 'ock', 'openChunk'):
+        scene.open_chunks.append(UndoStep(name=flag(kwargs, 'cn', 'chunkName', '')))
+    elif flag(kwargs, 'cck', 'closeChunk'):
+        if scene.open_chunks:
+            chunk = scene.open_chunks.pop()
+            scene.addUndoStep(chunk, chunk.name)
+    elif flag(kwargs, 'q', 'query'):
+        if flag(kwargs, 'un', 'undoName'):
+            return scene.undo_stack[-1].name if scene.undo_stack else ''
+        return True
+
+
+def cmd_undo(**kwargs):
+    if scene.undo_stack:
+        changes = scene.undo_stack.pop()
+        for undo, redo in reversed(changes):
+            undo()
+        scene.redo_stack.append(changes)
+
+
+def cmd_redo(**kwargs):
+    if scene.redo_stack:
+        changes = scene.redo_stack.pop()
+        for undo, redo in changes:
+            redo()
+        scene.undo_stack.append(changes)
+
+
+def cmd_loadPlugin(path, **kwargs):
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name not in loaded_plugins:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.initializePlugin(MObject())
+        loaded_plugins[name] = module
+    return [name]
+
+
+def cmd_pluginInfo(name, **kwargs):
+    if flag(kwargs, 'l', 'loaded'):
+        return os.path.splitext(os.path.basename(name))[0] in loaded_plugins
+    raise RuntimeError('mayaStandIn.pluginInfo only supports querying if a plug-in is loaded')
+
+
+def cmd_refresh(**kwargs):
+    pass
+
+
+def cmd_file(*args, **kwargs):
+    path = args[0] if args else None
+    if flag(kwargs, 'q', 'query'):
+        if flag(kwargs, 'sn', 'sceneName'):
+            return scene.filename or ''
+        raise RuntimeError('mayaStandIn.file only supports querying the scene name')
+    if flag(kwargs, 'f', 'force') and flag(kwargs, 'new', 'newFile'):
+        resetScene()
+        return
+    if flag(kwargs, 'rn', 'rename'):
+        scene.filename = kwargs.get('rn', kwargs.get('rename'))
+        return scene.filename
+    if flag(kwargs, 'o', 'open'):
+        resetScene()
+        importFile(path)
+        scene.filename = path
+        return path
+    if flag(kwargs, 'i', 'i'):
+        return importFile(path)
+    if flag(kwargs, 'es', 'exportSelected'):
+        nodes = []
+        for node in scene.selection:
+            nodes.append(node)
+            nodes.extend(scene.descendants(node))
+        writeFile(path, nodes, top_nodes=scene.selection)
+        return path
+    if flag(kwargs, 's', 'save'):
+        top_nodes = [node for node in scene.nodes.values() if node.parent is None]
+        writeFile(scene.filename, list(scene.nodes.values()), top_nodes)
+        return scene.filename
+    raise RuntimeError('mayaStandIn.file does not support flags: {}'.format(sorted(kwargs)))
+
+
+def writeFile(path, nodes, top_nodes):
+    data = {'standIn': 1, 'nodes': [], 'connections': []}
+    node_set = set(id(node) for node in nodes)
+    for node in nodes:
+        data['nodes'].append({
+            'name': node.name,
+            'type': node.type,
+            'parent': node.parent.name if node.parent and node not in top_nodes else None,
+            'attrs': node.attrs,
+            'curve': node.curve,
+        })
+    for (dst_node, dst_attr), (src_node, src_attr) in scene.connections.items():
+        if id(dst_node) in node_set and id(src_node) in node_set:
+            data['connections'].append([src_node.name, src_attr, dst_node.name, dst_attr])
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def importFile(path):
+    with open(path) as f:
+        head = f.read(1)
+    if head != '{':
+        if path.lower().endswith('.ma'):
+            return importMayaAscii(path)
+        raise RuntimeError('mayaStandIn can only read files it wrote itself and Maya ASCII guides: {}'.format(path))
+    with open(path) as f:
+        data = json.load(f)
+    renamed = {}
+    for entry in data['nodes']:
+        node = scene.createNode(entry['type'], entry['name'])
+        node.attrs = entry['attrs']
+        node.curve = entry['curve']
+        renamed[entry['name']] = node
+    for entry in data['nodes']:
+        if entry['parent']:
+            scene.setParent(renamed[entry['name']], renamed[entry['parent']])
+    for src_name, src_attr, dst_name, dst_attr in data['connections']:
+        scene.connect((renamed[dst_name], dst_attr), (renamed[src_name], src_attr))
+    return [node.name for node in renamed.values()]
+
+
+def importMayaAscii(path):
+    '''
+    Imports the guide transforms and curve shapes of a Maya ASCII file
+    '''
+    from . import maParser
+    template = maParser.toTemplate(maParser.parseFile(path))
+    nodes = []
+    names = []
+    for entry in template['guides']:
+        parent = nodes[entry['parent']] if entry['parent'] is not None else None
+        node = scene.createNode('transform', entry['name'], parent)
+        scene.setLocalMatrix(node, entry['matrix'])
+        names.append(node.name)
+        for curve in entry['curves']:
+            shape = scene.createNode('nurbsCurve', node.name + 'Shape', node)
+            shape.curve = dict((key, copy.deepcopy(curve[key])) for key in ('cvs', 'knots', 'degree', 'form'))
+            shape.attrs.update(curve.get('display') or {})
+            names.append(shape.name)
+        nodes.append(node)
+    return names
+
+
+command_functions = dict((name[len('cmd_'):], function) for name, function in list(globals().items())
+                         if name.startswith('cmd_'))
+
+
+# commands that don't go on the undo queue
+not_undoable_commands = ('undoInfo', 'undo', 'redo', 'loadPlugin', 'pluginInfo', 'refresh')
+
+
+def countCalls(name, function):
+    def wrapper(*args, **kwargs):
+        scene.calls[name] += 1
+        return function(*args, **kwargs)
+    wrapper.__name__ = name
+    return wrapper
+
+
+def undoable(function):
+    '''
+    Returns a command that records the changes it makes and adds them to the undo queue
+    '''
+    def wrapper(*args, **kwargs):
+        if scene.journal is not None:
+            return function(*args, **kwargs)
+        changes = scene.journal = []
+        try:
+            return function(*args, **kwargs)
+        finally:
+            # file -new and -open start a new scene, with an empty undo queue
+            if scene.journal is changes:
+                scene.journal = None
+                scene.addUndoStep(changes, function.__name__.replace('cmd_', '', 1))
+    return wrapper
+
+
+# ---------------------------------------------------------------------------------------------
+# maya.api.OpenMaya
+
+class MSpace(object):
+    kTransform = 1
+    kObject = 2
+    kWorld = 4
+
+
+class MFn(object):
+    kDagNode = 107
+    kTransform = 110
+    kJoint = 121
+    kNurbsCurve = 267
+
+
+fn_types = {
+    MFn.kDagNode: dag_types,
+    MFn.kTransform: ('transform', 'joint'),
+    MFn.kJoint: ('joint',),
+    MFn.kNurbsCurve: ('nurbsCurve',),
+}
+
+
+class MObject(object):
+
+    def __init__(self, node=None):
+        self.node = node
+        # the curve of curve data from MFnNurbsCurveData
+        self.data = None
+
+    def isNull(self):
+        return self.node is None
+
+    def hasFn(self, fn):
+        return self.node is not None and self.node.type in fn_types.get(fn, ())
+
+    def __eq__(self, other):
+        return isinstance(other, MObject) and self.node is other.node
+
+    def __hash__(self):
+        return id(self.node)
+
+
+MObject.kNullObj = MObject()
+
+
+class MMatrix(object):
+
+    def __init__(self, values=None):
+        self.values = list(values) if values is not None else identityMatrix()
+
+    def __mul__(self, other):
+        return MMatrix(multMatrix(self.values, other.values))
+
+    def inverse(self):
+        return MMatrix(inverseMatrix(self.values))
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return 16
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+
+class MPoint(object):
+
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        if isinstance(x, (list, tuple, MPoint)):
+            x, y, z = list(x)[:3]
+        self.x, self.y, self.z, self.w = float(x), float(y), float(z), w
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z, self.w))
+
+
+def MPointArray(points=None):
+    return [MPoint(point) for point in points or []]
+
+
+def MDoubleArray(values=None):
+    return [float(value) for value in values or []]
+
+
+class MDagPath(object):
+
+    def __init__(self, other=None):
+        self.nodes = list(other.nodes) if other is not None else []
+
+    def node(self):
+        return MObject(self.nodes[-1])
+
+    def length(self):
+        return len(self.nodes)
+
+    def pop(self, count=1):
+        del self.nodes[-count:]
+
+    def childCount(self):
+        return len(self.nodes[-1].children)
+
+    def child(self, index):
+        return MObject(self.nodes[-1].children[index])
+
+    def inclusiveMatrix(self):
+        return MMatrix(scene.worldMatrix(self.nodes[-1]))
+
+    def inclusiveMatrixInverse(self):
+        return MMatrix(inverseMatrix(scene.worldMatrix(self.nodes[-1])))
+
+    def fullPathName(self):
+        return self.nodes[-1].fullPath() if self.nodes else ''
+
+    def partialPathName(self):
+        return self.nodes[-1].name if self.nodes else ''
+
+
+def dagPathOf(node):
+    path = MDagPath()
+    while node is not None:
+        path.nodes.insert(0, node)
+        node = node.parent
+    return path
+
+
+class MSelectionList(object):
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, name):
+        try:
+            self.items.append(scene.find(name))
+        except ValueError:
+            raise RuntimeError('(kInvalidParameter): Object does not exist: {}'.format(name))
+        return self
+
+    def length(self):
+        return len(self.items)
+
+    def getDagPath(self, index):
+        return dagPathOf(self.items[index])
+
+    def getDependNode(self, index):
+        return MObject(self.items[index])
+
+
+class MPlug(object):
+
+    def __init__(self, node, attr):
+        self.node = node
+        self.attr = attr
+
+    def name(self):
+        return '{}.{}'.format(self.node.name, self.attr)
+
+    def elementByLogicalIndex(self, index):
+        return MPlug(self.node, '{}[{}]'.format(self.attr, index))
+
+    def value(self):
+        value = scene.getValue(self.node, self.attr)
+        return attr_defaults.get(self.attr, 0) if value is None else value
+
+    def asBool(self):
+        return bool(self.value())
+
+    def asInt(self):
+        return int(self.value())
+
+    def asFloat(self):
+        return float(self.value())
+
+
+class MFnNumericData(object):
+    kBoolean = 1
+
+
+class MFnNumericAttribute(object):
+    '''
+    Makes dynamic attributes for MDGModifier.addAttribute. The data of the attribute's MObject is its name and
+    default value
+    '''
+
+    def create(self, long_name, short_name, data_type, default=0):
+        attr = MObject()
+        attr.data = (long_name, default)
+        return attr
+
+
+class MFnMatrixData(object):
+
+    def create(self, matrix):
+        return MMatrix(matrix.values)
+
+
+class MFnNurbsCurveData(object):
+
+    def create(self):
+        obj = MObject()
+        obj.data = {}
+        return obj
+
+
+class MFnDependencyNode(object):
+
+    def __init__(self, obj=None):
+        self.obj = obj
+
+    def name(self):
+        return self.obj.node.name
+
+    def setName(self, name):
+        return scene.rename(self.obj.node, name)
+
+    def findPlug(self, attr, want_networked=False):
+        return MPlug(self.obj.node, longAttr(attr))
+
+    def typeName(self):
+        return self.obj.node.type
+
+
+class MFnDagNode(MFnDependencyNode):
+
+    def __init__(self, obj=None):
+        if isinstance(obj, MDagPath):
+            obj = obj.node()
+        super(MFnDagNode, self).__init__(obj)
+
+    def parent(self, index=0):
+        return MObject(self.obj.node.parent)
+
+    def fullPathName(self):
+        return self.obj.node.fullPath()
+
+    @property
+    def isIntermediateObject(self):
+        return bool(self.obj.node.attrs.get('intermediateObject'))
+
+
+class MVector(object):
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+
+class MEulerRotation(MVector):
+    pass
+
+
+class MAngle(object):
+
+    def __init__(self, value=0.0):
+        self.value = value
+
+    def asRadians(self):
+        return self.value
+
+    def asDegrees(self):
+        return math.degrees(self.value)
+
+
+class MTransformationMatrix(object):
+    '''
+    Holds a matrix and splits it into translate, xyz rotation and scale. There is no shear
+    '''
+
+    def __init__(self, matrix=None):
+        self.matrix = matrix if matrix is not None else MMatrix()
+
+    def asMatrix(self):
+        return self.matrix
+
+    def translation(self, space=MSpace.kTransform):
+        return MVector(*decomposeMatrix(self.matrix.values)[0])
+
+    def rotation(self, as_quaternion=False):
+        return MEulerRotation(*[math.radians(value) for value in decomposeMatrix(self.matrix.values)[1]])
+
+    def scale(self, space=MSpace.kTransform):
+        return decomposeMatrix(self.matrix.values)[2]
+
+    def shear(self, space=MSpace.kTransform):
+        return [0.0, 0.0, 0.0]
+
+
+class MFnTransform(MFnDagNode):
+
+    def setTransformation(self, transformation):
+        scene.setLocalMatrix(self.obj.node, transformation.asMatrix().values)
+
+    def transformation(self):
+        return MTransformationMatrix(MMatrix(scene.localMatrix(self.obj.node)))
+
+
+class MFnNurbsCurve(MFnDagNode):
+
+    kOpen = 1
+    kClosed = 2
+    kPeriodic = 3
+
+    def cvPositions(self, space=MSpace.kObject):
+        cvs = self.obj.node.curve['cvs']
+        if space == MSpace.kWorld:
+            matrix = scene.worldMatrix(self.obj.node.parent)
+            cvs = [multMatrix(list(cv) + [1.0] + [0.0] * 12, matrix)[:3] for cv in cvs]
+        return MPointArray(cvs)
+
+    def knots(self):
+        return MDoubleArray(self.obj.node.curve['knots'])
+
+    @property
+    def degree(self):
+        return self.obj.node.curve['degree']
+
+    @property
+    def form(self):
+        return self.obj.node.curve['form']
+
+    @property
+    def numCVs(self):
+        return len(self.obj.node.curve['cvs'])
+
+    def create(self, cvs, knots, degree, form, is2D, rational, parent=MObject.kNullObj):
+        if parent.data is not None:
+            # curve data, for plugs of modifiers
+            parent.data.update({'cvs': [[point.x, point.y, point.z] for point in cvs],
+                                'knots': list(knots), 'degree': degree, 'form': form})
+            return parent
+        if parent.isNull():
+            parent = MObject(scene.createNode('transform', 'curve1'))
+            shape = scene.createNode('nurbsCurve', 'curveShape1', parent.node)
+        else:
+            shape = scene.createNode('nurbsCurve', 'curveShape1', parent.node)
+        shape.curve = {'cvs': [[point.x, point.y, point.z] for point in cvs],
+                       'knots': list(knots), 'degree': degree, 'form': form}
+        self.obj = MObject(shape)
+        return MObject(shape)
+
+
+class MDGModifier(object):
+    '''
+    Queues changes and makes them on doIt. undoIt reverts them, and doIt makes them again after undoIt,
+    as the modifier command of apiBackend.py needs for redo
+    '''
+
+    def __init__(self):
+        self.operations = []
+        # how to revert what the last doIt changed, for undoIt
+        self.undo_operations = []
+
+    def connect(self, source, destination):
+        self.operations.append(('connect', source, destination))
+
+    def disconnect(self, source, destination):
+        self.operations.append(('disconnect', source, destination))
+
+    def createNode(self, node_type):
+        # the node is added to the scene by doIt
+        node = scene.newNode(node_type)
+        self.operations.append(('create', node, None))
+        return MObject(node)
+
+    def renameNode(self, obj, name):
+        self.operations.append(('rename', obj, name))
+
+    def addAttribute(self, obj, attr):
+        self.operations.append(('set', MPlug(obj.node, attr.data[0]), attr.data[1]))
+
+    def newPlugValueString(self, plug, value):
+        self.operations.append(('set', plug, value))
+
+    def newPlugValueBool(self, plug, value):
+        self.operations.append(('set', plug, bool(value)))
+
+    def newPlugValueInt(self, plug, value):
+        self.operations.append(('set', plug, int(value)))
+
+    def newPlugValueFloat(self, plug, value):
+        self.operations.append(('set', plug, float(value)))
+
+    def newPlugValueDouble(self, plug, value):
+        self.operations.append(('set', plug, float(value)))
+
+    def newPlugValueMAngle(self, plug, angle):
+        # rotations are kept in degrees, like maya.cmds gives them
+        self.operations.append(('set', plug, angle.asDegrees()))
+
+    def newPlugValue(self, plug, data):
+        # the stand-in knows matrix data from MFnMatrixData and curve data from MFnNurbsCurveData
+        if isinstance(data, MObject):
+            self.operations.append(('set', plug, copy.deepcopy(data.data)))
+        else:
+            self.operations.append(('set', plug, list(data.values)))
+
+    def doIt(self):
+        scene.calls['{}.doIt'.format(type(self).__name__)] += 1
+        self.undo_operations = []
+        for operation in self.operations:
+            if operation[0] == 'create':
+                scene.addNode(operation[1], operation[2])
+                self.undo_operations.append(('remove', operation[1]))
+            elif operation[0] == 'connect':
+                source, destination = operation[1], operation[2]
+                if (destination.node, destination.attr) in scene.connections:
+                    raise RuntimeError('(kInvalidParameter): Destination is already connected: {}'.format(destination.name()))
+                scene.connections[(destination.node, destination.attr)] = (source.node, source.attr)
+                self.undo_operations.append(('connection', (destination.node, destination.attr), None))
+            elif operation[0] == 'disconnect':
+                key = (operation[2].node, operation[2].attr)
+                self.undo_operations.append(('connection', key, scene.connections.pop(key, None)))
+            elif operation[0] == 'rename':
+                self.undo_operations.append(('rename', operation[1].node, operation[1].node.name))
+                scene.rename(operation[1].node, operation[2])
+            elif operation[0] == 'reparent':
+                self.undo_operations.append(('reparent', operation[1].node, operation[1].node.parent))
+                scene.setParent(operation[1].node, None if operation[2].isNull() else operation[2].node)
+            elif operation[0] == 'set':
+                self.undo_operations.append(('set', scene.setPlug(operation[1].node, operation[1].attr,
+                                                                  operation[2])))
+
+    def undoIt(self):
+        scene.calls['{}.undoIt'.format(type(self).__name__)] += 1
+        for operation in reversed(self.undo_operations):
+            if operation[0] == 'remove':
+                if scene.nodes.get(operation[1].name) is operation[1]:
+                    scene.deleteNode(operation[1])
+            elif operation[0] == 'connection':
+                if operation[2] is None:
+                    scene.connections.pop(operation[1], None)
+                else:
+                    scene.connections[operation[1]] = operation[2]
+            elif operation[0] == 'rename':
+                scene.rename(operation[1], operation[2])
+            elif operation[0] == 'reparent':
+                scene.setParent(operation[1], operation[2])
+            elif operation[0] == 'set':
+                scene.restorePlug(operation[1])
+        self.undo_operations = []
+
+
+class MDagModifier(MDGModifier):
+
+    def createNode(self, node_type, parent=MObject.kNullObj):
+        if parent.isNull() and node_type not in ('transform', 'joint'):
+            transform = scene.newNode('transform')
+            self.operations.append(('create', transform, None))
+            self.operations.append(('create', scene.newNode(node_type), transform))
+            return MObject(transform)
+        node = scene.newNode(node_type)
+        self.operations.append(('create', node, None if parent.isNull() else parent.node))
+        return MObject(node)
+
+    def reparentNode(self, obj, parent=MObject.kNullObj):
+        self.operations.append(('reparent', obj, parent))
+
+
+# ---------------------------------------------------------------------------------------------
+# Plug-ins. Commands registered by a plug-in are added to maya.cmds like Maya does
+
+loaded_plugins = {}
+
+
+class MPxCommand(object):
+
+    def doIt(self, args):
+        pass
+
+    def redoIt(self):
+        pass
+
+    def undoIt(self):
+        pass
+
+    def isUndoable(self):
+        return False
+
+
+class MArgList(list):
+    '''
+    Arguments of a plug-in command
+    '''
+
+    def length(self):
+        return len(self)
+
+    def asString(self, index):
+        return str(self[index])
+
+
+class MFnPlugin(object):
+
+    def __init__(self, obj=None, vendor='', version=''):
+        self.obj = obj
+
+    def registerCommand(self, name, creator):
+        setattr(sys.modules['maya.cmds'], name, countCalls(name, pluginCommand(name, creator)))
+
+    def deregisterCommand(self, name):
+        delattr(sys.modules['maya.cmds'], name)
+
+
+def pluginCommand(name, creator):
+    '''
+    Returns the maya.cmds function of a plug-in command
+    '''
+    def command(*args, **kwargs):
+        command_object = creator()
+        command_object.doIt(MArgList(args))
+        if command_object.isUndoable():
+            scene.addUndoStep([(command_object.undoIt, command_object.redoIt)], name)
+    return command
+
+
+# ---------------------------------------------------------------------------------------------
+# maya.utils. Deferred calls run when processIdleEvents is called, as Maya runs them when it's idle
+
+deferred_calls = collections.deque()
+
+
+def executeDeferred(function, *args, **kwargs):
+    deferred_calls.append((function, args, kwargs))
+
+
+def processIdleEvents():
+    '''
+    Runs the deferred calls queued so far. Calls they queue run on the next processIdleEvents
+    '''
+    for i in range(len(deferred_calls)):
+        function, args, kwargs = deferred_calls.popleft()
+        function(*args, **kwargs)
+
+
+# ---------------------------------------------------------------------------------------------
+# Installing the stand-in
+
+def resetScene():
+    '''
+    Empties the stand-in scene, keeping the call counts
+    '''
+    calls = scene.calls
+    scene.__init__()
+    scene.calls = calls
+
+
+def resetCalls():
+    scene.calls = collections.Counter()
+
+
+def install():
+    '''
+    Registers the stand-in as maya, maya.cmds, maya.mel, maya.utils and maya.api.OpenMaya in sys.modules.
+    Does nothing if a real Maya is already importable, or if the stand-in is installed already, so modules that
+    imported maya.cmds keep working.
+    Returns:
+        installed: (bool) True if the stand-in is installed
+    '''
+    try:
+        import maya.cmds
+        return bool(getattr(maya.cmds, 'isStandIn', False))
+    except ImportError:
+        pass
+
+    loaded_plugins.clear()
+    maya_module = types.ModuleType('maya')
+    maya_module.__path__ = []
+    cmds_module = types.ModuleType('maya.cmds')
+    cmds_module.isStandIn = True
+    for name, function in command_functions.items():
+        if name not in not_undoable_commands:
+            function = undoable(function)
+        setattr(cmds_module, name, countCalls(name, function))
+    mel_module = types.ModuleType('maya.mel')
+    mel_module.eval = lambda *args, **kwargs: None
+    utils_module = types.ModuleType('maya.utils')
+    utils_module.executeDeferred = executeDeferred
+    utils_module.processIdleEvents = processIdleEvents
+    api_module = types.ModuleType('maya.api')
+    api_module.__path__ = []
+    om_module = types.ModuleType('maya.api.OpenMaya')
+    for name in ('MSpace', 'MFn', 'MObject', 'MMatrix', 'MPoint', 'MVector', 'MEulerRotation', 'MAngle',
+                 'MPointArray', 'MDoubleArray',
+                 'MDagPath', 'MSelectionList', 'MPlug', 'MFnDependencyNode', 'MFnDagNode',
+                 'MTransformationMatrix', 'MFnTransform', 'MFnNurbsCurve', 'MFnNurbsCurveData', 'MFnMatrixData',
+                 'MFnNumericData', 'MFnNumericAttribute',
+                 'MDGModifier', 'MDagModifier', 'MPxCommand', 'MArgList', 'MFnPlugin'):
+        setattr(om_module, name, globals()[name])
+
+    maya_module.cmds = cmds_module
+    maya_module.mel = mel_module
+    maya_module.utils = utils_module
+    maya_module.api = api_module
+    api_module.OpenMaya = om_module
+    sys.modules['maya'] = maya_module
+    sys.modules['maya.cmds'] = cmds_module
+    sys.modules['maya.mel'] = mel_module
+    sys.modules['maya.utils'] = utils_module
+    sys.modules['maya.api'] = api_module
+    sys.modules['maya.api.OpenMaya'] = om_module
+    return True
@@ -0,0 +1,56 @@
+# Maya plug-in that registers the undoable command apiBackend runs its modifiers through, see apiBackend.doIt.
+#
+# cmds.loadPlugin loads this file as a module of its own, outside the package, so it doesn't import the package.
+# apiBackend.doIt passes its module name to the command, and the command takes the modifier from that module in
+# sys.modules. That is the module object doIt queued the modifier on, whatever the package is called and however
+# often it was reloaded.
+
+import sys
+
+import maya.api.OpenMaya as om
+
+# the same as apiBackend.modifier_command
+command_name = 'ghostControlRiggerModifier'
+
+
+def maya_useNewAPI():
+    '''
+    Tells Maya the modifier command uses OpenMaya 2.0
+    '''
+    pass
+
+
+class ModifierCommand(om.MPxCommand):
+    '''
+    Runs the modifier apiBackend.doIt hands it. Undo calls the modifier's undoIt and redo its doIt again
+    '''
+
+    def __init__(self):
+        om.MPxCommand.__init__(self)
+        self.modifier = None
+
+    @staticmethod
+    def creator():
+        return ModifierCommand()
+
+    def doIt(self, args):
+        # the only argument is the name of the apiBackend module that queued the modifier
+        self.modifier = sys.modules[args.asString(0)].pending_modifiers.pop()
+        self.modifier.doIt()
+
+    def redoIt(self):
+        self.modifier.doIt()
+
+    def undoIt(self):
+        self.modifier.undoIt()
+
+    def isUndoable(self):
+        return True
+
+
+def initializePlugin(plugin):
+    om.MFnPlugin(plugin).registerCommand(command_name, ModifierCommand.creator)
+
+
+def uninitializePlugin(plugin):
+    om.MFnPlugin(plugin).deregisterCommand(command_name)
@@ -0,0 +1,562 @@
+'''
+Qt model, search proxy and background scanning of the guide template list
+
+TemplateListModel holds the templates of the catalog (see catalog.py) and hands them to the view in batches as
+it scrolls (canFetchMore/fetchMore), so a library of 10k templates costs the view no more than the rows it shows.
+TemplateFilterProxy filters and ranks it with templateSearch.py, on the search index the model keeps up to date.
+While the user types, each search only looks at the templates the previous text matched.
+
+TemplateLibrary keeps the model in sync with a templates directory without blocking Maya: the directory is
+scanned by TemplateScanThread, which only reads new and changed templates and sends them to the model in
+batches as they are found. A QFileSystemWatcher on the directory notices files being added, removed or renamed.
+Its signal doesn't say which files, so the scan that follows only lists the file names and looks at the ones the
+list doesn't have or has lost, without checking every template. The model is updated in place, rows that didn't
+change stay as they are.
+Templates saved in place without a rename don't always make the directory change, and a watcher doesn't see the
+changes other machines make to a network share (SMB, NFS), so the whole directory is also scanned every
+full_rescan_interval, and after an export. A template archive is read from its index instead, and scanned again
+whenever the archive file changes. Writing an archive replaces its file, which ends the watch on it, so the new
+file is watched again before every scan.
+
+Each template shows a preview of its curves (see thumbnails.py). When a scan is done, TemplateThumbnailThread
+draws the previews missing from the thumbnail cache in a pool of worker processes, and the rows get their
+preview as they are drawn.
+
+The threads only run catalog.py, archive.py and thumbnails.py code, which doesn't use Maya.
+
+How to use:
+library = TemplateLibrary()
+proxy = TemplateFilterProxy()
+proxy.setSourceModel(library.model)
+view.setModel(proxy)
+library.setDirectory(path)
+search_field.textChanged.connect(proxy.setSearchText)
+'''
+
+import bisect
+import functools
+import os
+import time
+
+from vendor.Qt import QtCore, QtGui
+
+from . import archive
+from . import catalog
+from . import templateSearch
+from . import thumbnails
+
+# role that returns the template file name, to import it
+name_role = QtCore.Qt.UserRole
+# role that returns the template's catalog entry
+entry_role = QtCore.Qt.UserRole + 1
+
+# scan and thumbnail threads that are still running. They have no parent so closing the UI doesn't delete a
+# running thread
+running_threads = set()
+
+
+class TemplateListModel(QtCore.QAbstractListModel):
+    '''
+    List model of guide templates, sorted by file name, that gives its rows to the view in batches of fetch_size
+    '''
+
+    fetch_size = 200
+    # previews kept loaded, the view only asks for the rows it shows
+    max_icons = 500
+
+    # emitted after templates were added, changed or removed, rows may have moved
+    templatesChanged = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super(TemplateListModel, self).__init__(parent)
+        self.templates = []
+        self.names = []
+        self.search_index = []
+        self.fetched = 0
+        # content hash -> QIcon, None if the thumbnail isn't drawn yet
+        self.icons = {}
+
+    def setTemplates(self, templates):
+        '''
+        Replaces the templates of the list
+        Args:
+            templates: (list) (file name, catalog entry) pairs from catalog.getTemplateEntries
+        '''
+        self.beginResetModel()
+        self.templates = sorted(templates)
+        self.names = [name for name, entry in self.templates]
+        self.search_index = templateSearch.makeSearchIndex(self.templates)
+        self.fetched = min(self.fetch_size, len(self.templates))
+        self.endResetModel()
+
+    def updateTemplates(self, templates):
+        '''
+        Adds templates to the list, or updates the ones it already has, in place
+        Args:
+            templates: (list) (file name, catalog entry) pairs
+        '''
+        if not templates:
+            return
+        templates = sorted(templates)
+        if not self.names or templates[0][0] > self.names[-1]:
+            # a scan sends templates in order, add them all at the end
+            self.insertTemplates(len(self.templates), templates)
+        else:
+            for name, entry in templates:
+                row = bisect.bisect_left(self.names, name)
+                if row < len(self.names) and self.names[row] == name:
+                    self.templates[row] = (name, entry)
+                    self.search_index[row] = templateSearch.makeSearchIndex([(name, entry)])[0]
+                    if row < self.fetched:
+                        index = self.index(row)
+                        self.dataChanged.emit(index, index)
+                else:
+                    self.insertTemplates(row, [(name, entry)])
+        self.templatesChanged.emit()
+
+    def insertTemplates(self, row, templates):
+        '''
+        Inserts templates at a row. Rows after the fetched ones are added without telling the view
+        '''
+        if row <= self.fetched and (row < self.fetched or row < self.fetch_size):
+            self.beginInsertRows(QtCore.QModelIndex(), row, row + len(templates) - 1)
+            self.insertData(row, templates)
+            self.fetched += len(templates)
+            self.endInsertRows()
+        else:
+            self.insertData(row, templates)
+
+    def insertData(self, row, templates):
+        self.templates[row:row] = templates
+        self.names[row:row] = [name for name, entry in templates]
+        self.search_index[row:row] = templateSearch.makeSearchIndex(templates)
+
+    def removeTemplates(self, names):
+        '''
+        Removes templates from the list
+        Args:
+            names: (list) file names
+        '''
+        removed = False
+        for name in names:
+            row = bisect.bisect_left(self.names, name)
+            if row == len(self.names) or self.names[row] != name:
+                continue
+            fetched = row < self.fetched
+            if fetched:
+                self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+            del self.templates[row]
+            del self.names[row]
+            del self.search_index[row]
+            if fetched:
+                self.fetched -= 1
+                self.endRemoveRows()
+            removed = True
+        if removed:
+            self.templatesChanged.emit()
+
+    def getEntries(self):
+        '''
+        Returns file name -> catalog entry of every template in the list
+        '''
+        return dict(self.templates)
+
+    def fetchTo(self, count):
+        '''
+        Makes sure the first count templates are rows of the model
+        '''
+        count = min(count, len(self.templates))
+        if count <= self.fetched:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self.fetched, count - 1)
+        self.fetched = count
+        self.endInsertRows()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.fetched
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.fetched < len(self.templates)
+
+    def fetchMore(self, parent):
+        self.fetchTo(self.fetched + self.fetch_size)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < self.fetched:
+            return None
+        name, entry = self.templates[index.row()]
+        if role in (QtCore.Qt.DisplayRole, name_role):
+            return name
+        if role == QtCore.Qt.ToolTipRole:
+            return '{} guides: {}'.format(entry['guides'], ', '.join(entry['names']))
+        if role == entry_role:
+            return entry
+        if role == QtCore.Qt.DecorationRole:
+            return self.getIcon(entry['hash'])
+        return None
+
+    def getIcon(self, content_hash):
+        '''
+        Returns the preview of a template, None if its thumbnail isn't drawn yet
+        '''
+        if content_hash not in self.icons:
+            if len(self.icons) >= self.max_icons:
+                self.icons.clear()
+            path = thumbnails.getThumbnailPath(content_hash)
+            self.icons[content_hash] = QtGui.QIcon(path) if os.path.isfile(path) else None
+        return self.icons[content_hash]
+
+    def setThumbnailsDrawn(self, content_hashes):
+        '''
+        Shows the previews of templates whose thumbnails were just drawn
+        Args:
+            content_hashes: (list) content hashes of the templates
+        '''
+        content_hashes = set(content_hashes)
+        for content_hash in content_hashes:
+            self.icons.pop(content_hash, None)
+        for row in range(self.fetched):
+            if self.templates[row][1]['hash'] in content_hashes:
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
+
+
+class TemplateFilterProxy(QtCore.QSortFilterProxyModel):
+    '''
+    Shows the templates matching the search text, best matches first. See templateSearch.py for the matching
+    '''
+
+    def __init__(self, parent=None):
+        super(TemplateFilterProxy, self).__init__(parent)
+        self.search_text = ''
+        # source row -> score of the matching templates, None when there is no search text
+        self.scores = None
+
+    def setSourceModel(self, model):
+        super(TemplateFilterProxy, self).setSourceModel(model)
+        # new templates or rows that moved, search them again
+        model.modelReset.connect(self.refresh)
+        model.templatesChanged.connect(self.refresh)
+
+    def setSearchText(self, text):
+        '''
+        Filters the list with a search text
+        Args:
+            text: (string) search text, empty to show every template
+        '''
+        model = self.sourceModel()
+        if not templateSearch.getWords(text):
+            scores = None
+        else:
+            rows = None
+            if self.scores is not None and templateSearch.isRefinement(text, self.search_text):
+                rows = sorted(self.scores)
+            scores = templateSearch.search(model.search_index, text, rows)
+            # matches may be templates the view didn't fetch yet
+            if scores:
+                model.fetchTo(max(scores) + 1)
+        self.search_text = text
+        self.scores = scores
+        # filter and sort again, rows that still match may have new scores
+        self.invalidate()
+        self.sort(-1 if scores is None else 0)
+
+    def refresh(self):
+        '''
+        Searches the current text again, over every template
+        '''
+        self.scores = None
+        self.setSearchText(self.search_text)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self.scores is None or source_row in self.scores
+
+    def lessThan(self, left, right):
+        scores = self.scores or {}
+        return (scores.get(left.row(), 0), left.row()) < (scores.get(right.row(), 0), right.row())
+
+
+class TemplateScanThread(QtCore.QThread):
+    '''
+    Brings the catalog of a templates directory up to date in a worker thread and sends the templates that are new
+    or changed compared to the ones the list has
+    '''
+
+    batch_size = 200
+
+    # (list) (file name, catalog entry) pairs of new or changed templates
+    found = QtCore.Signal(object)
+    # (list) file names of templates that are gone or can't be read anymore
+    removed = QtCore.Signal(object)
+    # (list) (file name, error) of templates that can't be read
+    unreadable = QtCore.Signal(object)
+
+    def __init__(self, directory, known, full=True, parent=None):
+        '''
+        Args:
+            directory: (string) templates directory
+            known: (dict) file name -> catalog entry of the templates the list has
+            full: (bool) check every template. Otherwise only the templates that were added to or removed from
+                the directory are looked at, see getChangedNames
+        '''
+        super(TemplateScanThread, self).__init__(parent)
+        self.directory = directory
+        self.known = known
+        self.full = full
+
+    def getChangedNames(self):
+        '''
+        Returns the file names of the templates that are in the directory but not in the list, or the other way
+        around. Only the file names are listed, no file is opened or stat'ed
+        '''
+        names = set(name for name in os.listdir(self.directory) if catalog.isTemplateName(name))
+        return names.symmetric_difference(self.known)
+
+    def run(self):
+        batch = []
+        seen = set()
+        # file names the scan looked at, None for every template
+        scanned = None
+        errors = []
+        try:
+            if archive.isArchive(self.directory):
+                templates = archive.getEntries(self.directory)
+            elif self.full:
+                templates = catalog.iterRefreshCatalog(self.directory, catalog.loadCatalog(self.directory))
+            else:
+                scanned = self.getChangedNames()
+                templates = catalog.iterRefreshEntries(self.directory, catalog.loadCatalog(self.directory), scanned)
+            for name, entry in templates:
+                if self.isInterruptionRequested():
+                    return
+                if entry is None:
+                    continue
+                if entry['error']:
+                    errors.append((name, entry['error']))
+                    continue
+                seen.add(name)
+                if self.known.get(name) != entry:
+                    batch.append((name, entry))
+                if len(batch) >= self.batch_size:
+                    self.found.emit(batch)
+                    batch = []
+        except (EnvironmentError, RuntimeError) as error:
+            errors.append((self.directory, str(error)))
+        self.found.emit(batch)
+        self.removed.emit([name for name in self.known if name not in seen and (scanned is None or name in scanned)])
+        if errors:
+            self.unreadable.emit(errors)
+
+
+class TemplateThumbnailThread(QtCore.QThread):
+    '''
+    Draws the thumbnails of templates that aren't in the thumbnail cache yet, see thumbnails.generateThumbnails
+    '''
+
+    # seconds between drawn signals, so the view isn't repainted for every thumbnail
+    signal_interval = 0.25
+
+    # (list) content hashes of templates whose thumbnails were drawn
+    drawn = QtCore.Signal(object)
+    # (list) (template file, error) of templates that couldn't be drawn
+    unreadable = QtCore.Signal(object)
+
+    def __init__(self, directory, templates, parent=None):
+        '''
+        Args:
+            directory: (string) templates directory
+            templates: (list) (file name, catalog entry) pairs
+        '''
+        super(TemplateThumbnailThread, self).__init__(parent)
+        self.templates = [(os.path.join(directory, name), entry['hash']) for name, entry in templates]
+
+    def run(self):
+        drawn = []
+        errors = []
+        paths = dict((content_hash, path) for path, content_hash in self.templates)
+        last_signal = time.time()
+        results = thumbnails.generateThumbnails(self.templates)
+        try:
+            for content_hash, thumbnail, error in results:
+                if self.isInterruptionRequested():
+                    break
+                if error:
+                    errors.append((paths[content_hash], error))
+                else:
+                    drawn.append(content_hash)
+                if time.time() - last_signal > self.signal_interval:
+                    self.drawn.emit(drawn)
+                    drawn = []
+                    last_signal = time.time()
+        except EnvironmentError as error:
+            errors.append((thumbnails.cache_dir, str(error)))
+        finally:
+            # stops the worker processes
+            results.close()
+        self.drawn.emit(drawn)
+        if errors:
+            self.unreadable.emit(errors)
+
+
+class TemplateLibrary(QtCore.QObject):
+    '''
+    Keeps a TemplateListModel in sync with a templates directory, see the module docs
+    '''
+
+    # time to wait for more changes before scanning, copying many files changes the directory many times
+    rescan_delay = 500
+    # time between scans of every template, for the changes the watcher doesn't see
+    full_rescan_interval = 5 * 60 * 1000
+
+    def __init__(self, parent=None):
+        super(TemplateLibrary, self).__init__(parent)
+        self.model = TemplateListModel(self)
+        self.directory = None
+        self.thread = None
+        # None, or 'changes' or 'full', the scan to start when the running one is done
+        self.rescan_pending = None
+        self.thumbnail_thread = None
+        self.thumbnails_pending = False
+
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.scheduleRescan)
+        self.watcher.fileChanged.connect(self.scheduleRescan)
+        self.rescan_timer = QtCore.QTimer(self)
+        self.rescan_timer.setSingleShot(True)
+        self.rescan_timer.setInterval(self.rescan_delay)
+        self.rescan_timer.timeout.connect(self.rescanChanges)
+        self.full_rescan_timer = QtCore.QTimer(self)
+        self.full_rescan_timer.setInterval(self.full_rescan_interval)
+        self.full_rescan_timer.timeout.connect(self.rescan)
+
+        application = QtCore.QCoreApplication.instance()
+        if application is not None:
+            application.aboutToQuit.connect(self.stopScan)
+
+    def setDirectory(self, directory):
+        '''
+        Shows the templates of another directory, or of a template archive (see archive.py). The list is emptied
+        and filled as the directory is scanned
+        '''
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        if self.watcher.files():
+            self.watcher.removePaths(self.watcher.files())
+        self.stopScan()
+        self.directory = directory
+        self.model.setTemplates([])
+        if directory and (QtCore.QDir(directory).exists() or archive.isArchive(directory)):
+            self.watcher.addPath(directory)
+            self.rescan()
+            self.full_rescan_timer.start()
+
+    def scheduleRescan(self, path=None):
+        self.rescan_timer.start()
+
+    def rescanChanges(self):
+        '''
+        Scans the templates added to or removed from the directory, see rescan
+        '''
+        self.rescan(full=False)
+
+    def rescan(self, full=True):
+        '''
+        Scans the directory in a worker thread. If a scan is running, another one starts when it's done
+        Args:
+            full: (bool) check every template, otherwise only the ones added to or removed from the directory
+        '''
+        if self.directory is None:
+            return
+        if self.thread is not None:
+            self.rescan_pending = 'full' if full or self.rescan_pending == 'full' else 'changes'
+            return
+        if archive.isArchive(self.directory) and self.directory not in self.watcher.files():
+            self.watcher.addPath(self.directory)
+        self.rescan_pending = None
+        thread = TemplateScanThread(self.directory, self.model.getEntries(), full)
+        running_threads.add(thread)
+        thread.finished.connect(functools.partial(running_threads.discard, thread))
+        # the slots are methods of this object, so they run in the main thread. They ignore signals of earlier scans
+        thread.found.connect(self.onFound)
+        thread.removed.connect(self.onRemoved)
+        thread.unreadable.connect(self.onUnreadable)
+        thread.finished.connect(self.onFinished)
+        self.thread = thread
+        thread.start()
+
+    def stopScan(self):
+        '''
+        Stops the running scan and thumbnail drawing, waiting for the template they are reading
+        '''
+        self.rescan_pending = None
+        self.thumbnails_pending = False
+        self.full_rescan_timer.stop()
+        for thread in (self.thread, self.thumbnail_thread):
+            if thread is not None:
+                thread.requestInterruption()
+                thread.wait()
+        self.thread = None
+        self.thumbnail_thread = None
+
+    def updateThumbnails(self):
+        '''
+        Draws the missing thumbnails of the listed templates in a worker thread. If it's already drawing, it
+        starts again when it's done
+        '''
+        if self.thumbnail_thread is not None:
+            self.thumbnails_pending = True
+            return
+        self.thumbnails_pending = False
+        thread = TemplateThumbnailThread(self.directory, self.model.templates)
+        running_threads.add(thread)
+        thread.finished.connect(functools.partial(running_threads.discard, thread))
+        thread.drawn.connect(self.onThumbnailsDrawn)
+        thread.unreadable.connect(self.onThumbnailErrors)
+        thread.finished.connect(self.onThumbnailsFinished)
+        self.thumbnail_thread = thread
+        thread.start()
+
+    @QtCore.Slot(object)
+    def onFound(self, templates):
+        if self.sender() is self.thread:
+            self.model.updateTemplates(templates)
+
+    @QtCore.Slot(object)
+    def onRemoved(self, names):
+        if self.sender() is self.thread:
+            self.model.removeTemplates(names)
+
+    @QtCore.Slot(object)
+    def onUnreadable(self, errors):
+        for name, error in errors:
+            print('Skipping unreadable template {}: {}'.format(name, error))
+
+    @QtCore.Slot()
+    def onFinished(self):
+        if self.sender() is not self.thread:
+            return
+        self.thread = None
+        if self.rescan_pending:
+            self.rescan(self.rescan_pending == 'full')
+        else:
+            self.updateThumbnails()
+
+    @QtCore.Slot(object)
+    def onThumbnailsDrawn(self, content_hashes):
+        if self.sender() is self.thumbnail_thread:
+            self.model.setThumbnailsDrawn(content_hashes)
+
+    @QtCore.Slot(object)
+    def onThumbnailErrors(self, errors):
+        for path, error in errors:
+            print('No preview for template {}: {}'.format(path, error))
+
+    @QtCore.Slot()
+    def onThumbnailsFinished(self):
+        if self.sender() is not self.thumbnail_thread:
+            return
+        self.thumbnail_thread = None
+        if self.thumbnails_pending:
+            self.updateThumbnails()
@@ -0,0 +1,182 @@
+# Cache of parsed guide templates
+#
+# Riggers import the same few templates many times per session. TemplateCache keeps the parsed data of the
+# compact templates (see templateFormat.py) read last, so importing them again builds the guides from memory
+# instead of reading the file.
+#
+# Only compact templates are cached. .ma templates are imported as Maya scenes with cmds.file, so they keep
+# everything Maya wrote (see templates.template_import), and get raises an error for them.
+#
+# Entries are keyed by file path and checked against the file's mtime and size on every get, so a template that
+# changed on disk is read again. Templates in an archive (see archive.py) are checked against their index entry.
+# The cache is bounded by the approximate memory its data takes, the templates used least recently are dropped
+# first. Templates that can't be read are remembered too, so they aren't parsed again before every import, and
+# get raises their error again.
+#
+# This module doesn't need Maya.
+#
+# How to run:
+# from ghostControlRigger import templateCache
+# cache = templateCache.TemplateCache(max_bytes=64 * 1024 * 1024)
+# template = cache.get('/path/to/guide_templates/collar.json')
+# print(cache.getStats())
+
+import collections
+import os
+
+from . import archive
+from . import templateFormat
+
+# default bound of a cache, in bytes of parsed data
+default_max_bytes = 64 * 1024 * 1024
+
+# approximate memory of one number of the parsed data: a float and its place in a list
+number_bytes = 32
+# approximate memory of a guide or curve dict and its lists
+guide_bytes = 600
+
+
+def readCompactTemplate(path):
+    '''
+    Reads a compact template file into template data
+    Args:
+        path: (string) template file, or template in an archive
+    Returns:
+        template: (dict) template data
+    Raises RuntimeError if the file can't be read or isn't a compact template
+    '''
+    if not templateFormat.isTemplateFile(path):
+        raise RuntimeError('Only compact templates are cached, {} is not one'.format(path))
+    if archive.isMemberPath(path):
+        return archive.readTemplate(*os.path.split(path))
+    return templateFormat.readTemplate(path)
+
+
+def getStamp(path):
+    '''
+    Returns (mtime, size) of a template file or of a template in an archive
+    Raises RuntimeError if there is no such template
+    '''
+    if archive.isMemberPath(path):
+        entry = archive.getEntry(*os.path.split(path))
+        if entry is None:
+            raise RuntimeError('Guide template not found: {}'.format(path))
+        return entry['mtime'], entry['size']
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise RuntimeError('Guide template not found: {}'.format(path))
+    return stat.st_mtime, stat.st_size
+
+
+def getTemplateBytes(template):
+    '''
+    Returns the approximate memory parsed template data takes
+    '''
+    total = 0
+    for guide in template['guides']:
+        total += guide_bytes + len(guide['name']) + 16 * number_bytes
+        for curve in guide['curves']:
+            total += guide_bytes + (len(curve['cvs']) * 3 + len(curve['knots'])) * number_bytes
+    return total
+
+
+class TemplateCache(object):
+    '''
+    Least recently used cache of parsed template data, bounded by memory. See the module docs
+    '''
+
+    def __init__(self, max_bytes=default_max_bytes, loader=readCompactTemplate):
+        '''
+        Args:
+            max_bytes: (int) approximate memory the cached data can take
+            loader: (function) reads a compact template file into template data, raising RuntimeError if it can't
+        '''
+        self.max_bytes = max_bytes
+        self.loader = loader
+        # path -> (mtime, size, template or None, error or None, bytes), least recently used first
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path):
+        '''
+        Returns the parsed data of a compact template file, from memory if the file didn't change since it was read
+        Args:
+            path: (string) compact template file
+        Returns:
+            template: (dict) template data. Don't change it, it's shared by every caller
+        Raises RuntimeError if the file can't be read or isn't a compact template
+        '''
+        path = os.path.abspath(path)
+        try:
+            stamp = getStamp(path)
+        except RuntimeError:
+            self.discard(path)
+            raise
+
+        entry = self.entries.get(path)
+        if entry is not None and entry[:2] == stamp:
+            self.hits += 1
+            self.entries.move_to_end(path)
+        else:
+            self.misses += 1
+            self.discard(path)
+            try:
+                template = self.loader(path)
+                entry = stamp + (template, None, getTemplateBytes(template))
+            except (RuntimeError, ValueError, IndexError, KeyError) as error:
+                entry = stamp + (None, str(error), guide_bytes)
+            self.entries[path] = entry
+            self.bytes += entry[4]
+            self.evict()
+
+        if entry[3] is not None:
+            raise RuntimeError(entry[3])
+        return entry[2]
+
+    def discard(self, path):
+        '''
+        Drops a template from the cache
+        '''
+        entry = self.entries.pop(os.path.abspath(path), None)
+        if entry is not None:
+            self.bytes -= entry[4]
+
+    def evict(self):
+        '''
+        Drops the templates used least recently until the cache fits in max_bytes. The template used last is
+        always kept
+        '''
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            path, entry = self.entries.popitem(last=False)
+            self.bytes -= entry[4]
+            self.evictions += 1
+
+    def clear(self):
+        '''
+        Drops every template and resets the statistics
+        '''
+        self.entries.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def getStats(self):
+        '''
+        Returns:
+            stats: (dict) 'hits', 'misses', 'evictions', 'hit_rate' (0-1), 'entries', 'bytes' and 'max_bytes'
+        '''
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+        }
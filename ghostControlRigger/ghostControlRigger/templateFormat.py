@@ -0,0 +1,218 @@
+# Compact guide template format
+#
+# A .ma template is a whole Maya scene: besides the guide curves it carries render globals, color management,
+# shading lists and construction history. This format only keeps what a guide template is made of:
+#
+# {
+#     "format": "ghostControlRigger.guides",
+#     "version": 1,
+#     "guides": [
+#         {"name": "collar", "parent": null, "matrix": [16 floats], "curves": [{"cvs": [[x, y, z], ...],
+#          "knots": [...], "degree": 3, "form": 3, "display": {"overrideEnabled": true, "overrideColor": 17}}]},
+#         {"name": "collar_tip", "parent": 0, ...},
+#     ]
+# }
+#
+# Guides are listed parents first. "parent" is the index of the parent guide in the list, or null for top guides.
+# "matrix" is the transform relative to the parent guide, or the world matrix for top guides,
+# as a flat row-major list like Maya matrices. Curve data is in the format of curves.getCurveData.
+# "display" holds the display attributes of the curve shape that aren't at their default, see display_attrs.
+# Templates written before it existed don't have it.
+# This module doesn't need Maya, so templates can be read and written by offline tools too.
+
+import hashlib
+import json
+import os
+
+format_name = 'ghostControlRigger.guides'
+format_version = 1
+template_extension = '.json'
+
+# digits floats are rounded to when writing, enough for guide positions and keeps the files small
+float_digits = 6
+
+# Display attributes of curve shapes kept in curve data: (name, short name in .ma files, type, default)
+display_attrs = (
+    ('overrideEnabled', 'ove', 'bool', False),
+    ('overrideDisplayType', 'ovdt', 'int', 0),
+    ('overrideLevelOfDetail', 'ovlod', 'int', 0),
+    ('overrideShading', 'ovs', 'bool', True),
+    ('overrideTexturing', 'ovt', 'bool', True),
+    ('overridePlayback', 'ovp', 'bool', True),
+    ('overrideVisibility', 'ovv', 'bool', True),
+    ('overrideColor', 'ovc', 'int', 0),
+    ('overrideRGBColors', 'ovrgbf', 'bool', False),
+    ('overrideColorR', 'ovcr', 'float', 0.0),
+    ('overrideColorG', 'ovcg', 'float', 0.0),
+    ('overrideColorB', 'ovcb', 'float', 0.0),
+    ('lineWidth', 'lw', 'float', -1.0),
+    ('alwaysDrawOnTop', 'adot', 'bool', False),
+)
+
+
+def makeGuide(name, parent, matrix, curves):
+    '''
+    Returns the template entry of one guide
+    Args:
+        name: (string) guide name
+        parent: (int) index of the parent guide in the template, None for top guides
+        matrix: (list) 16 floats, transform relative to the parent guide or world matrix for top guides
+        curves: (list) curve dicts from curves.getCurveData
+    Returns:
+        guide: (dict)
+    '''
+    return {'name': name, 'parent': parent, 'matrix': list(matrix), 'curves': curves}
+
+
+def makeTemplate(guides):
+    '''
+    Returns template data holding the given guide entries
+    Args:
+        guides: (list) guide entries from makeGuide, parents first
+    Returns:
+        template: (dict)
+    '''
+    return {'format': format_name, 'version': format_version, 'guides': guides}
+
+
+def mergeTemplates(templates):
+    '''
+    Returns template data holding the guides of several templates, one after the other
+    Args:
+        templates: (list) template data
+    Returns:
+        template: (dict) new template data. The guide entries are copies, the curves are shared
+    '''
+    guides = []
+    for template in templates:
+        offset = len(guides)
+        for guide in template['guides']:
+            parent = guide['parent'] if guide['parent'] is None else guide['parent'] + offset
+            guides.append(makeGuide(guide['name'], parent, guide['matrix'], guide['curves']))
+    return makeTemplate(guides)
+
+
+def isTemplateFile(path):
+    '''
+    Returns True if the path has the extension of this format
+    '''
+    return path.lower().endswith(template_extension)
+
+
+def validateTemplate(template):
+    '''
+    Checks template data is in this format and its hierarchy is consistent
+    Args:
+        template: (dict) template data
+    Raises RuntimeError describing the first problem found
+    '''
+    if not isinstance(template, dict) or template.get('format') != format_name:
+        raise RuntimeError('Not a guide template')
+    if template.get('version', 0) > format_version:
+        raise RuntimeError('Guide template version {} is newer than this tool supports ({})'.format(
+            template.get('version'), format_version))
+    for i, guide in enumerate(template.get('guides', [])):
+        parent = guide.get('parent')
+        if parent is not None and not 0 <= parent < i:
+            raise RuntimeError("Guide '{}' has parent index {}, parents must come before their children".format(
+                guide.get('name'), parent))
+        if len(guide.get('matrix', [])) != 16:
+            raise RuntimeError("Guide '{}' doesn't have a 4x4 matrix".format(guide.get('name')))
+        for curve in guide.get('curves', []):
+            if len(curve['knots']) != len(curve['cvs']) + curve['degree'] - 1:
+                raise RuntimeError("Guide '{}' has a curve with {} cvs and {} knots, that doesn't match degree {}"
+                                   .format(guide.get('name'), len(curve['cvs']), len(curve['knots']),
+                                           curve['degree']))
+
+
+def roundFloats(data, digits=float_digits):
+    '''
+    Returns nested lists and dicts with every float rounded
+    '''
+    if isinstance(data, float):
+        return round(data, digits) + 0.0
+    if isinstance(data, (list, tuple)):
+        return [roundFloats(each, digits) for each in data]
+    if isinstance(data, dict):
+        return dict((key, roundFloats(value, digits)) for key, value in data.items())
+    return data
+
+
+def dumpTemplate(template):
+    '''
+    Returns template data as the text of a template file
+    '''
+    validateTemplate(template)
+    return json.dumps(roundFloats(template), separators=(',', ':'))
+
+
+def parseTemplate(text, path):
+    '''
+    Reads and checks the text of a template file
+    Args:
+        text: (string) content of the file
+        path: (string) name of the file, for errors
+    Returns:
+        template: (dict) template data
+    '''
+    try:
+        template = json.loads(text)
+    except ValueError as error:
+        raise RuntimeError('Guide template {} is not valid JSON: {}'.format(path, error))
+    validateTemplate(template)
+    return template
+
+
+def writeTemplate(path, template):
+    '''
+    Writes template data to a file
+    Args:
+        path: (string) file to write. It's written through a temporary file, so it's never seen half written
+        template: (dict) template data from makeTemplate
+    '''
+    text = dumpTemplate(template)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temp_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def hashTemplate(template):
+    '''
+    Returns a content hash of the guides of template data: their names, hierarchy, matrices and curves with their
+    display attributes, with floats rounded like writeTemplate does. The order the guides are listed in doesn't
+    change the hash
+    Args:
+        template: (dict) template data
+    Returns:
+        hash: (string) sha1 hex digest
+    '''
+    paths = []
+    guides = []
+    for guide in template['guides']:
+        path = guide['name'] if guide['parent'] is None else '{}|{}'.format(paths[guide['parent']], guide['name'])
+        paths.append(path)
+        guide_curves = [[curve['degree'], curve['form'], [[float(value) for value in cv] for cv in curve['cvs']],
+                         [float(knot) for knot in curve['knots']], sorted((curve.get('display') or {}).items())]
+                        for curve in guide['curves']]
+        guides.append([path, [float(value) for value in guide['matrix']], guide_curves])
+    data = json.dumps(roundFloats(sorted(guides)), separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def readTemplate(path):
+    '''
+    Reads and checks a template file
+    Args:
+        path: (string) file to read
+    Returns:
+        template: (dict) template data
+    '''
+    if not os.path.isfile(path):
+        raise RuntimeError('Guide template not found: {}'.format(path))
+    with open(path) as f:
+        return parseTemplate(f.read(), path)
@@ -0,0 +1,108 @@
+# Template search
+#
+# Matches a search text against the template names and the names of the guides inside the templates, as listed
+# by the template catalog (see catalog.py).
+#
+# Every word of the search text has to match, in the template name or in one of its guide names. A word matches
+# as a substring or, failing that, fuzzily: its letters in order with anything in between, so 'clr' finds
+# 'collar'. Lower scores are better matches:
+#     0  substring of the template name
+#     1  substring of a guide name
+#     2  fuzzy match of the template name
+#     3  fuzzy match of a guide name
+# and the score of a template is the sum over the words.
+#
+# The text that is matched is lower cased once, in makeSearchIndex, and each word is matched with one compiled
+# regular expression, so a search over 10k templates takes around ten milliseconds. Anything matching a search
+# text also matches the text without its last letters, so while the user types, search only needs to look at
+# the templates the previous text matched.
+#
+# This module doesn't need Maya or Qt.
+#
+# How to run:
+# from ghostControlRigger import catalog, templateSearch
+# templates = catalog.getTemplateEntries('/path/to/guide_templates')
+# index = templateSearch.makeSearchIndex(templates)
+# scores = templateSearch.search(index, 'clr')
+
+import os
+import re
+
+
+def makeSearchIndex(templates):
+    '''
+    Returns the search index of a list of templates
+    Args:
+        templates: (list) (file name, catalog entry) pairs, in the order rows are shown
+    Returns:
+        index: (list) (template name, guide names) per template, lower cased. Guide names are joined by newlines
+    '''
+    return [(os.path.splitext(name)[0].lower(), '\n'.join(entry.get('names', [])).lower())
+            for name, entry in templates]
+
+
+def getWords(text):
+    '''
+    Returns the lower cased words of a search text
+    '''
+    return text.lower().split()
+
+
+def compileWord(word):
+    '''
+    Returns (substring, fuzzy) patterns of a search word. The fuzzy pattern doesn't cross guide names
+    '''
+    fuzzy = '[^\n]*?'.join(re.escape(letter) for letter in word)
+    return re.compile(re.escape(word)), re.compile(fuzzy)
+
+
+def getScore(patterns, name, guides):
+    '''
+    Returns the score of one template, None if a word doesn't match
+    Args:
+        patterns: (list) compileWord result of each search word
+        name: (string) lower cased template name
+        guides: (string) lower cased guide names, joined by newlines
+    '''
+    score = 0
+    for substring, fuzzy in patterns:
+        if substring.search(name):
+            continue
+        if substring.search(guides):
+            score += 1
+        elif fuzzy.search(name):
+            score += 2
+        elif fuzzy.search(guides):
+            score += 3
+        else:
+            return None
+    return score
+
+
+def search(index, text, rows=None):
+    '''
+    Searches templates
+    Args:
+        index: (list) from makeSearchIndex
+        text: (string) search text
+        rows: (iterable) rows of the index to look at, None for all. Pass the rows that matched a text this
+            text starts with to search while the user types
+    Returns:
+        scores: (dict) row -> score of the matching templates. Every row for an empty text, with score 0
+    '''
+    patterns = [compileWord(word) for word in getWords(text)]
+    if rows is None:
+        rows = range(len(index))
+    scores = {}
+    for row in rows:
+        score = getScore(patterns, *index[row])
+        if score is not None:
+            scores[row] = score
+    return scores
+
+
+def isRefinement(text, previous_text):
+    '''
+    Returns True if everything text matches is known to match previous_text too
+    '''
+    return previous_text is not None and text.lower().startswith(previous_text.lower())
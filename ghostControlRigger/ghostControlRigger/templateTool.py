@@ -0,0 +1,254 @@
+'''
+Offline checks and conversion for a library of guide templates
+
+Walks a templates directory and checks every .ma template with maParser.py in a pool of worker processes:
+    duplicate names   - node names used more than once. Guides and rig nodes are found by name, so a template
+                        with duplicate names builds a broken rig
+    non-curve nodes   - nodes a guide template doesn't need: construction history, joints, meshes, transforms
+                        with no guide curves under them...
+    render settings   - render globals, color management and other scene settings saved with the template,
+                        and plugins the file requires (requires "mtoa" makes Maya load Arnold on import)
+With --convert every template is also written in the compact template format (see templateFormat.py), next to
+the .ma file or under --output, keeping the folder layout.
+
+A summary is printed and --report writes every result to a JSON file. The command exits with status 1 if a
+template has problems or can't be read, so it can run as a check on the shared drive.
+
+Only the Python standard library is needed, no Maya.
+
+How to run (from the folder that holds the ghostControlRigger package):
+python -m ghostControlRigger.templateTool /path/to/guide_templates
+python -m ghostControlRigger.templateTool /path/to/guide_templates --jobs 8 --report report.json
+python -m ghostControlRigger.templateTool /path/to/guide_templates --convert --output /path/to/compact_templates
+'''
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from . import maParser
+from . import templateFormat
+
+template_extension = '.ma'
+
+# requires lines that don't load a plugin
+core_requires = ('maya',)
+
+
+def findTemplates(directory):
+    '''
+    Returns the .ma files under a directory, sorted
+    Args:
+        directory: (string) templates directory, searched recursively
+    '''
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(template_extension):
+                found.append(os.path.join(root, name))
+    return found
+
+
+def getDuplicateNames(info):
+    '''
+    Returns short name -> number of nodes with that name, for names used more than once
+    '''
+    counts = collections.Counter(record['name'] for record in info['nodes'].values())
+    return collections.OrderedDict((name, count) for name, count in sorted(counts.items()) if count > 1)
+
+
+def getNonCurveNodes(info):
+    '''
+    Returns node type -> names of the nodes that aren't guide curves or transforms above them
+    '''
+    template_paths = set(maParser.getTemplatePaths(info))
+    found = collections.OrderedDict()
+    for path, record in info['nodes'].items():
+        if record['type'] == 'transform' and path in template_paths:
+            continue
+        if record['type'] == 'nurbsCurve' and not maParser.isIntermediate(record):
+            continue
+        found.setdefault(record['type'], []).append(record['name'])
+    return found
+
+
+def getRenderSettings(info):
+    '''
+    Returns (settings, plugins): names of the shared scene nodes the file sets attributes on and the plugins
+    the file requires
+    '''
+    settings = [name for name, count in info['shared'].items() if count]
+    plugins = [words[0] for words in info['requires'] if words and words[0] not in core_requires]
+    return settings, plugins
+
+
+def getTemplatePath(path, directory, output=None):
+    '''
+    Returns the compact template path a .ma template converts to
+    Args:
+        path: (string) .ma template
+        directory: (string) templates directory the template was found in
+        output: (string) folder to write compact templates to, None to write them next to the .ma files
+    '''
+    template_path = os.path.splitext(path)[0] + templateFormat.template_extension
+    if output is None:
+        return template_path
+    return os.path.join(output, os.path.relpath(template_path, directory))
+
+
+def checkTemplate(path, template_path=None):
+    '''
+    Checks one .ma template and converts it if a template path is given. A file that isn't a Maya ASCII file
+    or has no guide curves is an error, and isn't converted
+    Args:
+        path: (string) .ma template
+        template_path: (string) compact template file to write, None to only check
+    Returns:
+        result: (dict) with 'path', 'size' (bytes), 'time' (seconds), 'guides', 'nodes', 'duplicate_names',
+            'non_curve_nodes', 'render_settings', 'plugins', 'problems' (number of problems found) and
+            'error' (message, None if the file was read). Converted templates also have 'template' and
+            'template_size'
+    '''
+    start = time.time()
+    result = {'path': path, 'size': os.path.getsize(path), 'error': None, 'problems': 0}
+    try:
+        info = maParser.parseFile(path)
+        guide_count = len(maParser.getGuidePaths(info))
+        if not guide_count:
+            raise RuntimeError('No guide curves found in {}'.format(path))
+        result['guides'] = guide_count
+        result['nodes'] = len(info['nodes'])
+        result['duplicate_names'] = getDuplicateNames(info)
+        result['non_curve_nodes'] = getNonCurveNodes(info)
+        result['render_settings'], result['plugins'] = getRenderSettings(info)
+        result['problems'] = (len(result['duplicate_names']) + sum(map(len, result['non_curve_nodes'].values()))
+                              + len(result['render_settings']) + len(result['plugins']))
+        if template_path is not None:
+            folder = os.path.dirname(template_path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            templateFormat.writeTemplate(template_path, maParser.toTemplate(info))
+            result['template'] = template_path
+            result['template_size'] = os.path.getsize(template_path)
+    except (RuntimeError, EnvironmentError, ValueError, IndexError, KeyError) as error:
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+    result['time'] = time.time() - start
+    return result
+
+
+def _checkTemplate(args):
+    # pool workers get one argument
+    return checkTemplate(*args)
+
+
+def checkTemplates(directory, jobs=None, convert=False, output=None):
+    '''
+    Checks every .ma template under a directory in a pool of worker processes
+    Args:
+        directory: (string) templates directory
+        jobs: (int) number of worker processes, None for one per CPU
+        convert: (bool) also write every template in the compact template format
+        output: (string) folder for the compact templates, None to write them next to the .ma files
+    Returns:
+        results: (list) results of checkTemplate, sorted by path
+    '''
+    paths = findTemplates(directory)
+    tasks = [(path, getTemplatePath(path, directory, output) if convert else None) for path in paths]
+    if not tasks:
+        return []
+    jobs = max(1, min(jobs or multiprocessing.cpu_count(), len(tasks)))
+    if jobs == 1:
+        results = [_checkTemplate(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            # big chunks keep the pool overhead low with many small templates
+            chunksize = max(1, len(tasks) // (jobs * 4))
+            results = list(pool.imap_unordered(_checkTemplate, tasks, chunksize))
+        finally:
+            pool.close()
+            pool.join()
+    return sorted(results, key=lambda result: result['path'])
+
+
+def getTotals(results):
+    '''
+    Returns totals over the results of checkTemplates
+    '''
+    totals = collections.OrderedDict()
+    totals['templates'] = len(results)
+    totals['with_problems'] = sum(1 for result in results if result['problems'])
+    totals['unreadable'] = sum(1 for result in results if result['error'])
+    totals['guides'] = sum(result.get('guides', 0) for result in results)
+    totals['size'] = sum(result['size'] for result in results)
+    converted = [result for result in results if 'template' in result]
+    if converted:
+        totals['converted'] = len(converted)
+        totals['converted_size'] = sum(result['size'] for result in converted)
+        totals['template_size'] = sum(result['template_size'] for result in converted)
+    return totals
+
+
+def report(results, directory, stream=None):
+    '''
+    Prints a readable summary of the results of checkTemplates
+    '''
+    stream = stream or sys.stdout
+    for result in results:
+        name = os.path.relpath(result['path'], directory)
+        if result['error']:
+            stream.write('ERROR  {}\n       {}\n'.format(name, result['error']))
+            continue
+        stream.write('{:<6} {}  {} guides, {} nodes, {} bytes'.format(
+            'ok' if not result['problems'] else 'CHECK', name, result['guides'], result['nodes'], result['size']))
+        if 'template' in result:
+            stream.write(' -> {} bytes'.format(result['template_size']))
+        stream.write('\n')
+        for duplicate, count in result['duplicate_names'].items():
+            stream.write('       duplicate name: {} ({} nodes)\n'.format(duplicate, count))
+        for node_type, names in result['non_curve_nodes'].items():
+            stream.write('       non-curve {}: {}\n'.format(node_type, ', '.join(names)))
+        if result['render_settings']:
+            stream.write('       render settings: {}\n'.format(', '.join(result['render_settings'])))
+        if result['plugins']:
+            stream.write('       requires plugins: {}\n'.format(', '.join(result['plugins'])))
+
+    totals = getTotals(results)
+    stream.write('\n{templates} templates, {guides} guides, {size} bytes. {with_problems} with problems, '
+                 '{unreadable} unreadable\n'.format(**totals))
+    if 'converted' in totals:
+        stream.write('{converted} converted: {converted_size} -> {template_size} bytes\n'.format(**totals))
+    stream.flush()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Check and convert a library of guide templates without Maya.')
+    parser.add_argument('directory', help='templates directory, searched recursively for .ma files')
+    parser.add_argument('--jobs', type=int, help='worker processes, one per CPU by default')
+    parser.add_argument('--convert', action='store_true',
+                        help='also write every template in the compact template format')
+    parser.add_argument('--output', help='folder for the compact templates, next to the .ma files by default')
+    parser.add_argument('--report', help='write every result to this JSON file')
+    options = parser.parse_args(args)
+
+    if not os.path.isdir(options.directory):
+        parser.error('Not a directory: {}'.format(options.directory))
+    start = time.time()
+    results = checkTemplates(options.directory, options.jobs, options.convert or bool(options.output),
+                             options.output)
+    report(results, options.directory)
+    print('Checked in {:.2f}s'.format(time.time() - start))
+    if options.report:
+        with open(options.report, 'w') as f:
+            json.dump({'directory': options.directory, 'totals': getTotals(results), 'results': results}, f,
+                      indent=2)
+    return 1 if any(result['problems'] or result['error'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
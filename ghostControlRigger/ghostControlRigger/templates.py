@@ -2,8 +2,20 @@
 
 import maya.mel as mel
 import maya.cmds as cmds
+import maya.api.OpenMaya as om
+import collections
+import shutil
 import sys
 import os
+import tempfile
+
+from . import apiBackend
+from . import archive
+from . import catalog
+from . import curves
+from . import ghostControlRigger as r
+from . import templateCache
+from . import templateFormat
 
 
 # Guide Template' Directory
@@ -20,13 +32,25 @@ if 'win32' in platform:
 else:
     sep = '/'
 
-templates_Dir = '{}{}guide_templates'.format(currentPath, sep)
+# the templates that come with the tool, templates_Dir until set_templates_Dir changes it
+default_templates_Dir = '{}{}guide_templates'.format(currentPath, sep)
+templates_Dir = default_templates_Dir
 print("templatesDir = {}".format(templates_Dir))
 
+# File types template_export can write:
+#   'mayaAscii' - a Maya ASCII scene of the selected guides
+#   'json'      - the compact guide template format, see templateFormat.py
+template_file_types = ('mayaAscii', 'json')
+
+# parsed compact templates of this session, so importing a template again builds it from memory. See templateCache.py
+template_cache = templateCache.TemplateCache()
+
 
 def template_import(filename):
     '''
-    Imports guide templates
+    Imports guide templates. .ma templates are imported as Maya scenes, so they keep everything Maya wrote.
+    Compact templates are built straight from their data, which is kept in template_cache so importing the same
+    template again doesn't read the file
     Args:
         filename (str): filename of the guide template
     '''
@@ -38,15 +62,143 @@ def template_import(filename):
         print ('Not windows OS')
         sep = '/'
     filepath = '{}{}{}'.format(templates_Dir, sep, filename)
-    cmds.file(filepath, i=True)
+    if not templateFormat.isTemplateFile(filepath):
+        importScene(filepath)
+        return
+    buildTemplate(template_cache.get(filepath))
+
+
+def template_import_many(filenames):
+    '''
+    Imports several guide templates in one operation and puts them under the guides group.
+    Compact templates are merged and built together in one MDagModifier transaction, see buildTemplate.
+    Name clashes with the scene and between them are resolved before anything is made, see getUniqueNames.
+    .ma templates aren't merged: each one is a separate cmds.file import, so it keeps everything Maya wrote,
+    parented under guides afterwards. Their name clashes are left to Maya, which renames clashing nodes one file
+    at a time as it imports them. Convert them to compact templates (templateTool.py --convert) to merge them too.
+    Everything runs in one undo chunk, so the whole import is undone in one step
+    Args:
+        filenames: (list) filenames of the guide templates
+    Returns:
+        guides: (list) names of the new top guides
+    '''
+
+    # Get separator based on os
+    platform = sys.platform
+    sep = r'\\'
+    if 'win32' not in platform:
+        sep = '/'
+
+    templates = []
+    scene_files = []
+    for filename in filenames:
+        filepath = '{}{}{}'.format(templates_Dir, sep, filename)
+        if templateFormat.isTemplateFile(filepath):
+            templates.append(template_cache.get(filepath))
+        else:
+            scene_files.append(filepath)
+
+    template = templateFormat.mergeTemplates(templates)
+    names = getUniqueNames([guide['name'] for guide in template['guides']])
+    for guide, name in zip(template['guides'], names):
+        guide['name'] = name
+
+    cmds.undoInfo(openChunk=True, chunkName='template_import_many')
+    try:
+        if not cmds.objExists(r.all_guides_grp):
+            cmds.group(em=True, n=r.all_guides_grp)
+        guides = buildTemplate(template, r.all_guides_grp)
+        # one import per .ma file, after the compact templates, see the docs above
+        for filepath in scene_files:
+            new_nodes = importScene(filepath, returnNewNodes=True) or []
+            top_nodes = [node for node in cmds.ls(new_nodes, type='transform', long=True) or []
+                         if node.count('|') == 1]
+            if top_nodes:
+                guides += cmds.parent(top_nodes, r.all_guides_grp)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+    return guides
 
 
-def template_export(filename):
+def importScene(filepath, **kwargs):
     '''
-    Exports selected guides
+    Imports a .ma template as a Maya scene. A template in an archive is extracted to a temporary file first
     Args:
-        filename: (string) name of file to be exported
+        filepath: (string) template file, or template in an archive
+        kwargs: more flags of cmds.file
+    Returns:
+        the result of cmds.file
+    '''
+
+    if not archive.isMemberPath(filepath):
+        return cmds.file(filepath, i=True, **kwargs)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        temp_path = os.path.join(temp_dir, os.path.basename(filepath))
+        archive.extractTemplate(os.path.dirname(filepath), os.path.basename(filepath), temp_path)
+        return cmds.file(temp_path, i=True, **kwargs)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def getUniqueNames(names):
+    '''
+    Returns names that don't clash with nodes in the scene or with each other, resolved in one pass. The scene is
+    queried once for the names, and once for the numbered names of the ones that clash. A name that clashes
+    gets the next free number, like Maya would give it
+    Args:
+        names: (list) node names
+    Returns:
+        names: (list) unique names, in the same order
+    '''
+
+    taken = set(name.split('|')[-1] for name in cmds.ls(list(set(names))) or [])
+    clashing = set(name for name in names if name in taken)
+    clashing.update(name for name, count in collections.Counter(names).items() if count > 1)
+    bases = set(name.rstrip('0123456789') for name in clashing)
+    if bases:
+        taken.update(name.split('|')[-1] for name in cmds.ls([base + '*' for base in bases]) or [])
+
+    unique = []
+    counters = {}
+    for name in names:
+        if name in taken:
+            base = name.rstrip('0123456789')
+            index = counters.get(base, 1)
+            while '{}{}'.format(base, index) in taken:
+                index += 1
+            counters[base] = index
+            name = '{}{}'.format(base, index)
+        taken.add(name)
+        unique.append(name)
+    return unique
+
+
+def get_template_cache_stats():
     '''
+    Returns:
+        stats: (dict) hits, misses and size of the cache of parsed templates, see templateCache.getStats
+    '''
+    return template_cache.getStats()
+
+
+def template_export(filename, fileType='mayaAscii'):
+    '''
+    Exports selected guides. The file is only written if the guides differ from the ones it already holds,
+    compared by their guide hash in the template catalog (see catalog.py), and is written through a temporary file.
+    If the templates directory is an archive, the template is written to it, see archive.py
+    Args:
+        filename: (string) name of file to be exported. A name ending in .json is always written as 'json'
+        fileType: (string) one of template_file_types
+    Returns:
+        written: (bool) False if the template already held these guides
+    '''
+
+    if fileType not in template_file_types:
+        raise RuntimeError("Unknown template file type '{}'. Use one of: {}".format(
+            fileType, ', '.join(template_file_types)))
+    if templateFormat.isTemplateFile(filename):
+        fileType = 'json'
 
     # get selected objects, make sure they are curves
     selection = get_selected_curves()
@@ -60,7 +212,137 @@ def template_export(filename):
         sep = '/'
 
     filepath = '{}{}{}'.format(templates_Dir, sep, filename)
-    cmds.file(filepath, force=True, exportSelected=True, type='mayaAscii' )
+    extension = templateFormat.template_extension if fileType == 'json' else '.ma'
+    if not filepath.lower().endswith(extension):
+        filepath += extension
+    directory, name = os.path.split(filepath)
+
+    template = getTemplateData(selection)
+    in_archive = archive.isArchive(directory)
+    if in_archive:
+        entry = archive.getEntry(directory, name)
+    else:
+        entry = catalog.getEntry(directory, name)
+    if entry and not entry['error'] and entry['guide_hash'] == templateFormat.hashTemplate(template):
+        print('Guide template {} is unchanged, not writing it'.format(filepath))
+        return False
+
+    if in_archive:
+        # the archive is replaced by a complete new one when it's written (see archive.py), the template goes
+        # straight into it
+        if fileType == 'json':
+            data = templateFormat.dumpTemplate(template).encode('utf-8')
+        else:
+            temp_dir = tempfile.mkdtemp()
+            try:
+                temp_path = os.path.join(temp_dir, name)
+                cmds.file(temp_path, force=True, exportSelected=True, type='mayaAscii')
+                with open(temp_path, 'rb') as f:
+                    data = f.read()
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        archive.writeTemplate(directory, name, data, template)
+        return True
+
+    if fileType == 'json':
+        templateFormat.writeTemplate(filepath, template)
+    else:
+        # Maya only writes .ma files, the temporary file is hidden so it's never listed as a template
+        temp_path = os.path.join(directory, '.{}.{}.tmp.ma'.format(os.path.splitext(name)[0], os.getpid()))
+        try:
+            cmds.file(temp_path, force=True, exportSelected=True, type='mayaAscii')
+            os.replace(temp_path, filepath)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    catalog.getEntry(directory, name, template)
+    return True
+
+
+def getTemplateData(nodes):
+    '''
+    Reads the given guides and everything under them into compact template data
+    Args:
+        nodes: (list) top guides to export
+    Returns:
+        template: (dict) template data, see templateFormat.py
+    '''
+
+    # full paths of the guides and their descendants, parents first
+    paths = cmds.ls(nodes, long=True) or []
+    paths += cmds.listRelatives(nodes, ad=True, typ='transform', f=True) or []
+    paths = sorted(dict.fromkeys(paths), key=lambda path: path.count('|'))
+    index = dict((path, i) for i, path in enumerate(paths))
+
+    sel = om.MSelectionList()
+    for path in paths:
+        sel.add(path)
+
+    guides = []
+    for i, path in enumerate(paths):
+        dag_path = sel.getDagPath(i)
+        parent = index.get(path.rsplit('|', 1)[0])
+        matrix = dag_path.inclusiveMatrix()
+        if parent is not None:
+            matrix = matrix * sel.getDagPath(parent).inclusiveMatrixInverse()
+        guides.append(templateFormat.makeGuide(path.split('|')[-1], parent, list(matrix),
+                                               curves.getCurveDataFromPath(dag_path)))
+    return templateFormat.makeTemplate(guides)
+
+
+def loadTemplate(filepath):
+    '''
+    Builds the guides of a compact template file, see buildTemplate
+    Args:
+        filepath: (string) template file, see templateFormat.py
+    Returns:
+        guides: (list) names of the new top guides
+    '''
+
+    return buildTemplate(templateFormat.readTemplate(filepath))
+
+
+def buildTemplate(template, parent=None):
+    '''
+    Builds guides straight from template data: all transforms and their curve shapes are made in one MDagModifier
+    transaction, the shapes from the stored CVs, knots and display attributes. The modifiers run through
+    apiBackend.doIt, so the build is on the undo queue
+    Args:
+        template: (dict) template data, see templateFormat.py
+        parent: (string) transform to build the top guides under, keeping their world matrices. None for the world
+    Returns:
+        guides: (list) names of the new top guides. Names that already exist get a number added by Maya
+    '''
+
+    entries = template['guides']
+
+    top_parent = om.MObject.kNullObj
+    top_matrix = om.MMatrix()
+    if parent is not None:
+        sel = om.MSelectionList()
+        sel.add(parent)
+        top_parent = sel.getDependNode(0)
+        top_matrix = sel.getDagPath(0).inclusiveMatrixInverse()
+
+    dag_mod = om.MDagModifier()
+    nodes = []
+    for entry in entries:
+        node_parent = top_parent if entry['parent'] is None else nodes[entry['parent']]
+        node = apiBackend.createTransform(dag_mod, entry['name'], node_parent)
+        curves.createCurveShapes(dag_mod, entry['curves'], node, entry['name'])
+        nodes.append(node)
+    apiBackend.doIt(dag_mod)
+
+    place_mod = om.MDGModifier()
+    for entry, node in zip(entries, nodes):
+        matrix = om.MMatrix(entry['matrix'])
+        if entry['parent'] is None:
+            matrix = matrix * top_matrix
+        apiBackend.setLocalMatrix(place_mod, node, matrix)
+    apiBackend.doIt(place_mod)
+
+    return [om.MFnDependencyNode(node).name() for entry, node in zip(entries, nodes) if entry['parent'] is None]
+
 
 def get_selected_curves():
     '''
@@ -92,7 +374,8 @@ def set_templates_Dir(path):
     '''
     Sets global variable 'templates_Dir' to given path
     Args:
-        path(string): Directory where we want to export and import guide templates from
+        path(string): Directory where we want to export and import guide templates from, or a template archive,
+            see archive.py
     '''
     global templates_Dir
     templates_Dir = path
@@ -0,0 +1,357 @@
+# Template preview thumbnails
+#
+# Draws the guide curves of a template, seen from the front (world X right, Y up), into a small PNG without Maya
+# or a GPU. Curves come from the compact template data (see templateFormat.py), or from maParser.py for .ma
+# templates, and are sampled as NURBS then drawn as 1 pixel lines on a transparent background.
+#
+# Thumbnails are kept in a cache folder, one file per template content hash (the 'hash' of the template catalog,
+# see catalog.py) and size, so a template only gets a new thumbnail when its content changes, and copies of a
+# template share one. The cache is local to the user, not next to the templates, so browsing a share doesn't
+# write to it.
+#
+# generateThumbnails draws the missing thumbnails in a pool of worker processes. Inside Maya the workers run
+# mayapy, as multiprocessing would otherwise start new Maya sessions.
+#
+# NumPy is used to draw when it can be imported, the pure Python drawing gives the same pixels.
+#
+# How to run:
+# from ghostControlRigger import catalog, thumbnails
+# templates = catalog.getTemplateEntries(path)
+# for content_hash, thumbnail, error in thumbnails.generateThumbnails(
+#         [(os.path.join(path, name), entry['hash']) for name, entry in templates]):
+#     print(thumbnail or error)
+
+import math
+import multiprocessing
+import os
+import struct
+import sys
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import archive
+from . import maParser
+from . import templateFormat
+
+cache_dir = os.path.join(os.path.expanduser('~'), '.ghostControlRigger', 'thumbnails')
+thumbnail_size = 64
+# empty pixels around the drawing
+thumbnail_margin = 3
+line_color = (230, 230, 230, 255)
+# points drawn per curve span, degree 1 spans are drawn as one straight line
+samples_per_span = 8
+
+
+def getThumbnailPath(content_hash, size=thumbnail_size):
+    '''
+    Returns the cache file of the thumbnail of a template
+    Args:
+        content_hash: (string) template content hash from the catalog
+        size: (int) width and height in pixels
+    '''
+    return os.path.join(cache_dir, '{}_{}.png'.format(content_hash, size))
+
+
+def getCurvePoints(curve, samples=samples_per_span, cvs=None):
+    '''
+    Samples a NURBS curve
+    Args:
+        curve: (dict) curve data in the format of curves.getCurveData
+        samples: (int) points per span
+        cvs: (list) cvs to use instead of the curve's, such as its cvs in world space. Sampling the transformed
+            cvs gives the transformed curve
+    Returns:
+        points: (list) [x, y, z] points along the curve
+    '''
+    degree = curve['degree']
+    cvs = curve['cvs'] if cvs is None else cvs
+    if degree == 1:
+        return [list(cv) for cv in cvs]
+    # Maya leaves out the first and last knot, they don't change the curve
+    knots = [curve['knots'][0]] + list(curve['knots']) + [curve['knots'][-1]]
+    points = []
+    for span in range(degree, len(cvs)):
+        if knots[span + 1] <= knots[span]:
+            continue
+        weights = getSpanWeights(tuple(knots[span - degree + 1:span + degree + 1]), degree, samples,
+                                 span == len(cvs) - 1)
+        span_cvs = cvs[span - degree:span + 1]
+        for sample_weights in weights:
+            points.append([sum(weight * cv[axis] for weight, cv in zip(sample_weights, span_cvs))
+                           for axis in range(3)])
+    return points
+
+
+span_weights_cache = {}
+
+
+def getSpanWeights(knots, degree, samples, last):
+    '''
+    Returns the weights of the degree + 1 cvs of a span at each sample. Curves with evenly spaced knots share
+    the same weights for every span, so they are cached by the knots relative to the span start
+    Args:
+        knots: (tuple) the 2 * degree knots around the span, the span is knots[degree - 1], knots[degree]
+        degree: (int)
+        samples: (int) samples per span
+        last: (bool) also sample the end of the span
+    '''
+    start = knots[degree - 1]
+    key = (tuple(knot - start for knot in knots), degree, samples, last)
+    weights = span_weights_cache.get(key)
+    if weights is None:
+        length = knots[degree] - start
+        unit_cvs = [[1.0 if i == j else 0.0 for j in range(degree + 1)] for i in range(degree + 1)]
+        full_knots = (None,) + key[0] + (None,)
+        weights = [deBoor(full_knots, unit_cvs, degree, degree, length * i / float(samples))
+                   for i in range(samples + 1 if last else samples)]
+        span_weights_cache[key] = weights
+    return weights
+
+
+def deBoor(knots, cvs, degree, span, parameter):
+    '''
+    Evaluates a B-spline at a parameter in knots[span], knots[span + 1]
+    '''
+    points = [list(cvs[span - degree + i]) for i in range(degree + 1)]
+    for level in range(1, degree + 1):
+        for i in range(degree, level - 1, -1):
+            low = knots[span - degree + i]
+            high = knots[span + 1 + i - level]
+            alpha = (parameter - low) / (high - low) if high > low else 0.0
+            points[i] = [(1.0 - alpha) * a + alpha * b for a, b in zip(points[i - 1], points[i])]
+    return points[degree]
+
+
+def getPolylines(template):
+    '''
+    Returns the curves of a template as world space polylines
+    Args:
+        template: (dict) compact template data
+    Returns:
+        polylines: (list) lists of [x, y, z] points
+    '''
+    world_matrices = []
+    polylines = []
+    for guide in template['guides']:
+        matrix = list(guide['matrix'])
+        if guide['parent'] is not None:
+            matrix = maParser.multMatrix(matrix, world_matrices[guide['parent']])
+        world_matrices.append(matrix)
+        for curve in guide['curves']:
+            cvs = [maParser.transformPoint(cv, matrix) for cv in curve['cvs']]
+            polylines.append(getCurvePoints(curve, cvs=cvs))
+    return polylines
+
+
+def getPixelTransform(polylines, size, margin=thumbnail_margin):
+    '''
+    Returns (scale, offset x, offset y) that fit the front view of polylines in the thumbnail, keeping proportions
+    '''
+    xs = [point[0] for polyline in polylines for point in polyline]
+    ys = [point[1] for polyline in polylines for point in polyline]
+    width = max(xs) - min(xs)
+    height = max(ys) - min(ys)
+    room = size - 1 - 2 * margin
+    scale = room / max(width, height) if max(width, height) > 0 else 0.0
+    offset_x = margin + (room - width * scale) / 2.0 - min(xs) * scale
+    offset_y = margin + (room - height * scale) / 2.0 - min(ys) * scale
+    return scale, offset_x, offset_y
+
+
+def getSegments(polylines, size):
+    '''
+    Returns the line segments of polylines in pixel coordinates, y down: (x0, y0, x1, y1) lists
+    '''
+    scale, offset_x, offset_y = getPixelTransform(polylines, size)
+    segments = []
+    for polyline in polylines:
+        pixels = [(point[0] * scale + offset_x, size - 1 - (point[1] * scale + offset_y)) for point in polyline]
+        if len(pixels) == 1:
+            pixels = pixels * 2
+        for start, end in zip(pixels, pixels[1:]):
+            segments.append((start[0], start[1], end[0], end[1]))
+    return segments
+
+
+def rasterize(polylines, size=thumbnail_size, color=line_color):
+    '''
+    Draws polylines from the front into an RGBA image
+    Args:
+        polylines: (list) lists of world space [x, y, z] points
+        size: (int) width and height in pixels
+        color: (tuple) RGBA line color, 0-255
+    Returns:
+        pixels: (bytes) size * size RGBA pixels, rows from the top
+    '''
+    polylines = [polyline for polyline in polylines if polyline]
+    if not polylines:
+        return bytes(size * size * 4)
+    segments = getSegments(polylines, size)
+    if numpy is not None:
+        return rasterizeNumpy(segments, size, color)
+    return rasterizePython(segments, size, color)
+
+
+def rasterizePython(segments, size, color):
+    image = bytearray(size * size * 4)
+    pixel = bytes(color)
+    for x0, y0, x1, y1 in segments:
+        dx = x1 - x0
+        dy = y1 - y0
+        count = int(math.ceil(max(abs(dx), abs(dy)))) + 1
+        denominator = float(max(count - 1, 1))
+        for i in range(count):
+            t = i / denominator
+            x = int(math.floor(x0 + dx * t + 0.5))
+            y = int(math.floor(y0 + dy * t + 0.5))
+            if 0 <= x < size and 0 <= y < size:
+                offset = (y * size + x) * 4
+                image[offset:offset + 4] = pixel
+    return bytes(image)
+
+
+def rasterizeNumpy(segments, size, color):
+    segments = numpy.array(segments, dtype=numpy.float64)
+    x0, y0, x1, y1 = segments.T
+    dx = x1 - x0
+    dy = y1 - y0
+    counts = numpy.ceil(numpy.maximum(numpy.abs(dx), numpy.abs(dy))).astype(numpy.int64) + 1
+    # one row per drawn point: the segment it's on and its index along the segment
+    segment = numpy.repeat(numpy.arange(len(counts)), counts)
+    index = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    t = index / numpy.maximum(counts - 1, 1).astype(numpy.float64)[segment]
+    x = numpy.floor(x0[segment] + dx[segment] * t + 0.5).astype(numpy.int64)
+    y = numpy.floor(y0[segment] + dy[segment] * t + 0.5).astype(numpy.int64)
+    inside = (x >= 0) & (x < size) & (y >= 0) & (y < size)
+    image = numpy.zeros((size, size, 4), dtype=numpy.uint8)
+    image[y[inside], x[inside]] = color
+    return image.tobytes()
+
+
+def writePng(path, width, height, pixels):
+    '''
+    Writes RGBA pixels to a PNG file
+    Args:
+        path: (string) file to write
+        width: (int)
+        height: (int)
+        pixels: (bytes) width * height RGBA pixels, rows from the top
+    '''
+    def chunk(chunk_type, data):
+        return (struct.pack('>I', len(data)) + chunk_type + data
+                + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    row_size = width * 4
+    # every row starts with filter type 0, no filter
+    rows = b''.join(b'\x00' + pixels[row * row_size:(row + 1) * row_size] for row in range(height))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows, 9)))
+        f.write(chunk(b'IEND', b''))
+
+
+def readTemplateData(path):
+    '''
+    Reads a .ma or compact template file into compact template data, without Maya
+    Args:
+        path: (string) template file, or template in an archive
+    Returns:
+        template: (dict) template data
+    Raises RuntimeError if the file can't be read, or if it's a .ma file without guide curves or with curves
+    whose data can only be read by Maya
+    '''
+    if archive.isMemberPath(path):
+        return archive.readTemplate(*os.path.split(path))
+    if templateFormat.isTemplateFile(path):
+        return templateFormat.readTemplate(path)
+    if not os.path.isfile(path):
+        raise RuntimeError('Guide template not found: {}'.format(path))
+    template = maParser.toTemplate(maParser.parseFile(path))
+    if not template['guides']:
+        raise RuntimeError('No guide curves found in {}'.format(path))
+    return template
+
+
+def makeThumbnail(path, thumbnail_path, size=thumbnail_size):
+    '''
+    Draws the thumbnail of a template file
+    Args:
+        path: (string) .ma or compact template file
+        thumbnail_path: (string) PNG file to write. It's written through a temporary file, so processes making
+            the same thumbnail don't get in each other's way
+        size: (int) width and height in pixels
+    '''
+    pixels = rasterize(getPolylines(readTemplateData(path)), size)
+    folder = os.path.dirname(thumbnail_path)
+    if folder and not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            if not os.path.isdir(folder):
+                raise
+    temp_path = '{}.{}.tmp'.format(thumbnail_path, os.getpid())
+    writePng(temp_path, size, size, pixels)
+    os.replace(temp_path, thumbnail_path)
+
+
+def _makeThumbnail(args):
+    # pool workers get one argument and report errors instead of raising them
+    path, content_hash, thumbnail_path, size = args
+    try:
+        makeThumbnail(path, thumbnail_path, size)
+    except (RuntimeError, EnvironmentError, ValueError, IndexError, KeyError, ZeroDivisionError) as error:
+        return content_hash, None, '{}: {}'.format(type(error).__name__, error)
+    return content_hash, thumbnail_path, None
+
+
+def getPoolContext():
+    '''
+    Returns the multiprocessing context to start thumbnail workers with. Inside Maya, sys.executable is the Maya
+    application, so the workers are started with the mayapy next to it
+    '''
+    context = multiprocessing.get_context('spawn')
+    executable = os.path.basename(sys.executable).lower()
+    if executable.startswith('maya') and not executable.startswith('mayapy'):
+        mayapy = os.path.join(os.path.dirname(sys.executable), 'mayapy' + ('.exe' if sys.platform == 'win32' else ''))
+        context.set_executable(mayapy)
+    return context
+
+
+def generateThumbnails(templates, size=thumbnail_size, processes=None):
+    '''
+    Draws the thumbnails that aren't in the cache yet, in a pool of worker processes
+    Args:
+        templates: (list) (template file, content hash) pairs
+        size: (int) width and height in pixels
+        processes: (int) number of worker processes, None for one per CPU
+    Yields:
+        (content hash, thumbnail file or None, error message or None) of each new thumbnail, as they are done
+    '''
+    tasks = []
+    for path, content_hash in templates:
+        # workers get the thumbnail path, they don't see changes made to cache_dir in this process
+        thumbnail_path = getThumbnailPath(content_hash, size) if content_hash else None
+        if thumbnail_path and not os.path.isfile(thumbnail_path):
+            tasks.append((path, content_hash, thumbnail_path, size))
+    # templates with the same content share a thumbnail
+    tasks = list(dict((task[1], task) for task in tasks).values())
+    if not tasks:
+        return
+    processes = max(1, min(processes or multiprocessing.cpu_count(), len(tasks)))
+    if processes == 1:
+        for task in tasks:
+            yield _makeThumbnail(task)
+        return
+    pool = getPoolContext().Pool(processes)
+    try:
+        for result in pool.imap_unordered(_makeThumbnail, tasks, max(1, len(tasks) // (processes * 8))):
+            yield result
+    finally:
+        # also stops the workers when the caller stops early
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,25 @@
+# The tests run on the Maya stand-in (see mayaStandIn.py) with a plain Python interpreter.
+#
+# How to run (from the folder that holds the ghostControlRigger package):
+# python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ghostControlRigger import mayaStandIn
+
+mayaStandIn.install()
+
+
+@pytest.fixture(autouse=True)
+def scene():
+    '''
+    Gives every test an empty stand-in scene
+    '''
+    mayaStandIn.resetScene()
+    mayaStandIn.resetCalls()
+    yield mayaStandIn.scene
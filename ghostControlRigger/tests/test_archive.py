@@ -0,0 +1,123 @@
+# Checks that template archives keep every template through concurrent writes, never leave half an archive, and
+# that changes are appended without recompressing the other templates
+
+import json
+import os
+import threading
+import zipfile
+
+import pytest
+
+from ghostControlRigger import archive
+
+# the templates that come with the tool
+template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guide_templates')
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    path = str(tmp_path / ('library' + archive.archive_extension))
+    archive.packDirectory(template_dir, path)
+    return path
+
+
+def test_round_trip(archive_path, tmp_path):
+    archive.setTags(archive_path, 'control.ma', ['shirt', 'collar'])
+    archive.writeTemplate(archive_path, 'control.ma', archive.readBytes(archive_path, 'control.ma'))
+    assert archive.getEntry(archive_path, 'control.ma')['tags'] == ['shirt', 'collar']
+
+    names = archive.extractArchive(archive_path, str(tmp_path / 'extracted'))
+    for name in names:
+        with open(os.path.join(template_dir, name), 'rb') as original:
+            with open(str(tmp_path / 'extracted' / name), 'rb') as extracted:
+                assert extracted.read() == original.read()
+
+    archive.removeTemplate(archive_path, 'control.ma')
+    assert archive.getEntry(archive_path, 'control.ma') is None
+    with pytest.raises(RuntimeError):
+        archive.readBytes(archive_path, 'control.ma')
+
+
+def test_concurrent_writes(archive_path):
+    content = archive.readBytes(archive_path, 'control.ma')
+    writers = [threading.Thread(target=archive.writeTemplate, args=(archive_path, 'copy{}.ma'.format(i), content))
+               for i in range(8)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert len(archive.getEntries(archive_path)) == 9
+    assert sorted(os.listdir(os.path.dirname(archive_path))) == [os.path.basename(archive_path)]
+
+
+def test_locked_archive(archive_path, monkeypatch):
+    monkeypatch.setattr(archive, 'lock_timeout', 0.2)
+    open(archive_path + '.lock', 'w').close()
+    with pytest.raises(RuntimeError):
+        archive.setTags(archive_path, 'control.ma', ['shirt'])
+    assert archive.getEntry(archive_path, 'control.ma')['tags'] == []
+
+
+def test_not_an_archive(tmp_path):
+    path = str(tmp_path / ('library' + archive.archive_extension))
+    with zipfile.ZipFile(path, 'w') as archive_zip:
+        archive_zip.writestr('readme.txt', 'not a template archive')
+    with pytest.raises(RuntimeError):
+        archive.getEntries(path)
+
+
+def test_changes_only_append(archive_path, monkeypatch):
+    content = archive.readBytes(archive_path, 'control.ma')
+    with open(archive_path, 'rb') as f:
+        before = f.read()
+    read_members = []
+    read = zipfile.ZipFile.read
+    monkeypatch.setattr(zipfile.ZipFile, 'read', lambda self, name, *args: read_members.append(name) or
+                        read(self, name, *args))
+
+    archive.writeTemplate(archive_path, 'cuff.ma', content.replace(b'control', b'cuff'))
+    # the old templates weren't decompressed, and their bytes weren't touched
+    assert not [name for name in read_members if name.startswith(archive.template_folder)]
+    with open(archive_path, 'rb') as f:
+        after = f.read()
+    with zipfile.ZipFile(archive_path) as archive_zip:
+        cuff = archive_zip.getinfo(archive.getMemberName('cuff.ma', archive.getEntry(archive_path, 'cuff.ma')))
+    assert after[:cuff.header_offset] == before[:cuff.header_offset]
+
+    # writing the same content again only appends an index
+    archive.writeTemplate(archive_path, 'cuff.ma', content.replace(b'control', b'cuff'))
+    with zipfile.ZipFile(archive_path) as archive_zip:
+        templates = [name for name in archive_zip.namelist() if name.startswith(archive.template_folder)]
+    assert len(templates) == 2
+    assert archive.readBytes(archive_path, 'cuff.ma') == content.replace(b'control', b'cuff')
+
+
+def test_dead_bytes_are_compacted(archive_path):
+    content = archive.readBytes(archive_path, 'control.ma')
+    for i in range(30):
+        archive.writeTemplate(archive_path, 'control.ma', content + '// {}\n'.format(i).encode('ascii'))
+        archive.setTags(archive_path, 'control.ma', ['take{}'.format(i)])
+    with zipfile.ZipFile(archive_path) as archive_zip:
+        live = archive.getLiveBytes(archive_zip, archive.loadIndex(archive_path))
+        assert len(archive_zip.namelist()) < 20
+    assert os.path.getsize(archive_path) <= 2 * live + 1024
+    assert archive.readBytes(archive_path, 'control.ma') == content + b'// 29\n'
+    assert archive.getEntry(archive_path, 'control.ma')['tags'] == ['take29']
+
+
+def test_version_2_archive(archive_path, tmp_path):
+    # templates under their names and one index, as version 2 wrote them
+    old_path = str(tmp_path / ('old' + archive.archive_extension))
+    with zipfile.ZipFile(archive_path) as new_zip, zipfile.ZipFile(old_path, 'w') as old_zip:
+        templates = archive.loadIndex(archive_path)
+        for name, entry in templates.items():
+            old_zip.writestr(archive.template_folder + name, new_zip.read(entry['member']))
+        old_templates = dict((name, dict((key, value) for key, value in entry.items() if key != 'member'))
+                             for name, entry in templates.items())
+        old_zip.writestr(archive.index_member, json.dumps({'format': archive.archive_format, 'version': 2,
+                                                           'templates': old_templates}))
+    content = archive.readBytes(old_path, 'control.ma')
+    archive.writeTemplate(old_path, 'cuff.ma', content)
+    archive.setTags(old_path, 'control.ma', ['shirt'])
+    assert archive.readBytes(old_path, 'control.ma') == content
+    assert archive.readBytes(old_path, 'cuff.ma') == content
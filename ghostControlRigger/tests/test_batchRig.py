@@ -0,0 +1,29 @@
+# Checks that the jobs of a batch a worker runs one after the other don't see each other's settings
+
+import os
+import shutil
+
+from ghostControlRigger import batchRig
+from ghostControlRigger import templates
+
+# the templates that come with the tool
+template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guide_templates')
+
+
+def test_jobs_without_templates_dir_use_the_default(tmp_path, monkeypatch):
+    monkeypatch.setattr(templates, 'default_templates_Dir', template_dir)
+    monkeypatch.setattr(templates, 'templates_Dir', template_dir)
+    other_dir = tmp_path / 'other_templates'
+    other_dir.mkdir()
+    shutil.copy(os.path.join(template_dir, 'control.ma'), str(other_dir / 'other.ma'))
+    jobs = [
+        {'scene': None, 'templates': ['other.ma'], 'templates_dir': str(other_dir),
+         'output': str(tmp_path / 'other_rig.ma'), 'build': {}},
+        {'scene': None, 'templates': ['control.ma'], 'templates_dir': None,
+         'output': str(tmp_path / 'control_rig.ma'), 'build': {}},
+    ]
+    for job in jobs:
+        result = batchRig.rigScene(job)
+        assert result['error'] is None, result['traceback']
+        assert result['guides']
+    assert templates.get_templates_Dir() == template_dir
@@ -0,0 +1,52 @@
+# Checks builds against the maya.cmds call budgets of instrument.py
+
+import contextlib
+import io
+
+import pytest
+
+import maya.cmds as cmds
+
+from ghostControlRigger import benchmark
+from ghostControlRigger import ghostControlRigger as r
+from ghostControlRigger import instrument
+
+guide_counts = (10, 200)
+
+
+def recordBuild(**build_options):
+    with instrument.recording() as recorder, contextlib.redirect_stdout(io.StringIO()):
+        r.buildControls(**build_options)
+    return recorder
+
+
+@pytest.mark.parametrize('guide_count', guide_counts)
+@pytest.mark.parametrize('backend', r.build_backends)
+def test_build_stays_in_budget(backend, guide_count):
+    benchmark.makeGuideHierarchy(guide_count, 3, 3)
+    recorder = recordBuild(backend=backend)
+    instrument.checkBudget(recorder, guide_count, instrument.build_budgets[backend])
+
+
+@pytest.mark.parametrize('guide_count', guide_counts)
+def test_incremental_rebuild_stays_in_budget(guide_count):
+    guides = benchmark.makeGuideHierarchy(guide_count, 3, 3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        r.buildControls()
+    cmds.setAttr(guides[len(guides) // 2] + '.t', 0.5, 1.5, 0.5)
+    recorder = recordBuild(incremental=True)
+    instrument.checkBudget(recorder, guide_count, instrument.build_budgets['incremental'])
+
+
+def test_per_guide_query_goes_over_budget(monkeypatch):
+    make_control = r.makeControl
+
+    def makeControl(guide, parent, matrix):
+        r.cmds.objExists(guide)
+        return make_control(guide, parent, matrix)
+
+    monkeypatch.setattr(r, 'makeControl', makeControl)
+    benchmark.makeGuideHierarchy(50, 3, 3)
+    recorder = recordBuild()
+    with pytest.raises(RuntimeError, match='objExists'):
+        instrument.checkBudget(recorder, 50, instrument.build_budgets['cmds'])
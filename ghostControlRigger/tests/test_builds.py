@@ -0,0 +1,368 @@
+# Checks that every backend and wiring mode builds a rig that moves the joints the same way, that incremental
+# rebuilds give the same rig as full builds and that builds are undone and redone as one step
+
+import contextlib
+import copy
+import importlib
+import importlib.util
+import io
+import os
+import random
+import sys
+
+import pytest
+
+import maya.api.OpenMaya as om
+import maya.cmds as cmds
+
+from ghostControlRigger import apiBackend
+from ghostControlRigger import benchmark
+from ghostControlRigger import buildScheduler
+from ghostControlRigger import curves
+from ghostControlRigger import ghostControlRigger as r
+from ghostControlRigger import mayaStandIn
+
+
+def makeGuides(count=30, seed=3):
+    return benchmark.makeGuideHierarchy(count, 3, 3, seed)
+
+
+def build(**build_options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        r.buildControls(**build_options)
+
+
+def poseControls(seed=5):
+    '''
+    Sets the same translate and rotate values on the controls and Extra groups of every rig
+    '''
+    rnd = random.Random(seed)
+    for node in sorted(cmds.ls('*_ctr', '*_ctr_Extra')):
+        cmds.setAttr(node + '.t', rnd.uniform(-1.0, 1.0), rnd.uniform(-1.0, 1.0), rnd.uniform(-1.0, 1.0))
+        cmds.setAttr(node + '.r', rnd.uniform(-45.0, 45.0), rnd.uniform(-45.0, 45.0), rnd.uniform(-45.0, 45.0))
+
+
+def getJointMatrices():
+    return dict((joint, cmds.xform(joint, q=True, ws=True, m=True)) for joint in cmds.ls(type='joint'))
+
+
+def assertSameMatrices(matrices, expected):
+    assert sorted(matrices) == sorted(expected)
+    for node, matrix in expected.items():
+        assert matrices[node] == pytest.approx(matrix, abs=1e-6), node
+
+
+def getRig():
+    '''
+    Returns what a rig is made of: every rig node with its type, parent, world matrix and curves,
+    and the connections into them
+    '''
+    nodes = cmds.listRelatives(r.all_controls_grp, r.all_w_grp, ad=True) or []
+    nodes += r.getMatrixDrivers()
+    rig = {}
+    for node in nodes:
+        node_type = cmds.objectType(node)
+        parent = (cmds.listRelatives(node, p=True) or [None])[0]
+        entry = [node_type, parent]
+        if node_type in ('transform', 'joint'):
+            entry.append([round(value, 6) for value in cmds.xform(node, q=True, ws=True, m=True)])
+            if cmds.listRelatives(node, s=True):
+                entry.append(curves.getCurveData(node))
+        rig[node] = entry
+    connections = cmds.listConnections(nodes, s=True, d=False, c=True, p=True) or []
+    return rig, sorted(zip(connections[::2], connections[1::2]))
+
+
+def getSceneState():
+    '''
+    Returns everything in the stand-in scene, to compare a scene before and after undo
+    '''
+    scene = mayaStandIn.scene
+    nodes = dict((name, (node.type, node.parent.name if node.parent else None, [child.name for child in node.children],
+                         copy.deepcopy(node.attrs), copy.deepcopy(node.curve)))
+                 for name, node in scene.nodes.items())
+    connections = sorted(('{}.{}'.format(src[0].name, src[1]), '{}.{}'.format(dst[0].name, dst[1]))
+                         for dst, src in scene.connections.items())
+    return nodes, connections
+
+
+def setGuideShape(guide, curve):
+    '''
+    Replaces the curve of a guide through an undoable modifier
+    '''
+    cmds.delete(cmds.listRelatives(guide, s=True, pa=True))
+    dag_mod = om.MDagModifier()
+    curves.createCurveShapes(dag_mod, [curve], guide, guide)
+    apiBackend.doIt(dag_mod)
+
+
+build_modes = [(backend, wiring) for backend in r.build_backends for wiring in r.wiring_modes]
+
+
+@pytest.mark.parametrize('backend, wiring', build_modes)
+def test_build_modes_move_joints_the_same(backend, wiring):
+    makeGuides()
+    build()
+    poseControls()
+    expected = getJointMatrices()
+
+    mayaStandIn.resetScene()
+    makeGuides()
+    build(backend=backend, wiring=wiring)
+    poseControls()
+    assertSameMatrices(getJointMatrices(), expected)
+
+
+def moveGuide():
+    cmds.setAttr('guide1.t', 1.0, 2.0, 3.0)
+
+
+def reparentGuide():
+    cmds.parent('guide5', 'guide14')
+
+
+def deleteGuide():
+    cmds.delete('guide2')
+
+
+def addGuide():
+    guide = cmds.circle(n='added')[0]
+    cmds.setAttr(guide + '.t', 0.5, 1.0, 0.5)
+    cmds.parent(guide, 'guide3')
+    cmds.select(clear=True)
+
+
+def renameGuide():
+    cmds.rename('guide1', 'renamed')
+
+
+def editGuideCurve():
+    setGuideShape('guide4', benchmark.circleData(3.0))
+
+
+def editGuideDisplay():
+    shape = cmds.listRelatives('guide6', s=True)[0]
+    cmds.setAttr(shape + '.overrideEnabled', True)
+    cmds.setAttr(shape + '.overrideColor', 17)
+
+
+guide_edits = [moveGuide, reparentGuide, deleteGuide, addGuide, renameGuide, editGuideCurve, editGuideDisplay]
+
+
+@pytest.mark.parametrize('wiring', r.wiring_modes)
+@pytest.mark.parametrize('edit', guide_edits, ids=[edit.__name__ for edit in guide_edits])
+def test_incremental_rebuild_matches_full_build(edit, wiring):
+    makeGuides()
+    build(wiring=wiring)
+    edit()
+    build(incremental=True, wiring=wiring)
+    poseControls()
+    incremental = getRig(), getJointMatrices()
+
+    build(wiring=wiring)
+    poseControls()
+    full = getRig(), getJointMatrices()
+    assert incremental[0] == full[0]
+    assertSameMatrices(incremental[1], full[1])
+
+
+@pytest.mark.parametrize('wiring', r.wiring_modes)
+@pytest.mark.parametrize('suffix', ('_ctr_Offset', '_ctr', '_jnt'))
+def test_rebuild_after_deleting_rig_nodes(suffix, wiring):
+    guides = makeGuides()
+    build(wiring=wiring)
+    cmds.delete(guides[1] + suffix)
+    build(incremental=True, wiring=wiring)
+    poseControls()
+    rebuilt = getRig(), getJointMatrices(), sorted(cmds.ls())
+
+    build(wiring=wiring)
+    poseControls()
+    full = getRig(), getJointMatrices(), sorted(cmds.ls())
+    assert rebuilt[0] == full[0]
+    assertSameMatrices(rebuilt[1], full[1])
+    assert rebuilt[2] == full[2]
+
+
+@pytest.mark.parametrize('backend', r.build_backends)
+def test_lean_flag_is_lean_wiring(backend):
+    makeGuides()
+    build(backend=backend, wiring='lean')
+    lean_wiring = getRig()
+    build(backend=backend, lean=True)
+    assert getRig() == lean_wiring
+    with pytest.raises(RuntimeError):
+        build(backend=backend, wiring='matrix', lean=True)
+
+
+def runSteps(**build_options):
+    '''
+    Runs iterBuildControls to the end, returns the number of 'create' steps
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return sum(phase == 'create' for phase, done, total in r.iterBuildControls(**build_options))
+
+
+# incremental rebuilds only run on the 'cmds' backend
+step_modes = [mode + (False,) for mode in build_modes] + [('cmds', wiring, True) for wiring in r.wiring_modes]
+
+
+@pytest.mark.parametrize('backend, wiring, incremental', step_modes)
+def test_small_steps_build_the_same_rig(backend, wiring, incremental):
+    makeGuides()
+    if incremental:
+        build(backend=backend, wiring=wiring)
+        moveGuide()
+        addGuide()
+    state = getSceneState()
+    assert runSteps(backend=backend, incremental=incremental, wiring=wiring, chunk_size=len(cmds.ls('guide*'))) == 1
+    poseControls()
+    one_step = getRig(), getJointMatrices()
+
+    mayaStandIn.resetScene()
+    makeGuides()
+    if incremental:
+        build(backend=backend, wiring=wiring)
+        moveGuide()
+        addGuide()
+    assert getSceneState() == state
+    assert runSteps(backend=backend, incremental=incremental, wiring=wiring, chunk_size=4) > 1
+    poseControls()
+    assert getRig() == one_step[0]
+    assertSameMatrices(getJointMatrices(), one_step[1])
+
+
+@pytest.mark.parametrize('backend, wiring', build_modes)
+def test_rebuild_keeps_other_multmatrix_nodes(backend, wiring):
+    guides = makeGuides()
+    cmds.createNode('multMatrix', n='arm_mult')
+    build(backend=backend, wiring=wiring)
+    build(backend=backend, wiring=wiring)
+    assert cmds.objExists('arm_mult')
+    stats = r.getRigStats()
+    cmds.delete('arm_mult')
+    assert r.getRigStats() == stats
+    drivers = r.getMatrixDrivers()
+    driven = {'direct': [], 'matrix': ['_ctr_w'], 'lean': ['_jnt']}[wiring]
+    assert sorted(drivers) == sorted(guide + suffix + '_mult' for guide in guides for suffix in driven)
+
+
+@pytest.mark.parametrize('clean_history', (False, True))
+def test_circle_history_cleanup_is_opt_in(clean_history):
+    makeGuides()
+    orphans = [cmds.createNode('makeNurbCircle') for i in range(3)]
+    renamed = cmds.createNode('makeNurbCircle', n='sleeve_circle')
+    used = cmds.createNode('makeNurbCircle')
+    cmds.connectAttr(used + '.outputCurve', cmds.createNode('nurbsCurve', p=cmds.createNode('transform')) + '.create')
+    build(clean_history=clean_history)
+    kept = orphans + [renamed, used]
+    if clean_history:
+        kept = [renamed, used]
+    assert sorted(cmds.ls(type='makeNurbCircle')) == sorted(kept)
+
+
+@pytest.mark.parametrize('backend, wiring', build_modes)
+def test_build_is_undone_and_redone(backend, wiring):
+    makeGuides()
+    before = getSceneState()
+    build(backend=backend, wiring=wiring)
+    built = getSceneState()
+
+    cmds.undo()
+    assert getSceneState() == before
+    cmds.redo()
+    assert getSceneState() == built
+
+
+def test_modifier_command_runs_on_the_calling_module():
+    # the package loaded a second time under another name, as a renamed copy of the tool would be
+    package_dir = os.path.dirname(apiBackend.__file__)
+    spec = importlib.util.spec_from_file_location('renamedRigger', os.path.join(package_dir, '__init__.py'),
+                                                  submodule_search_locations=[package_dir])
+    sys.modules['renamedRigger'] = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(sys.modules['renamedRigger'])
+        for backend in (apiBackend, importlib.import_module('renamedRigger.apiBackend'),
+                        importlib.reload(apiBackend)):
+            dag_mod = om.MDagModifier()
+            dag_mod.renameNode(dag_mod.createNode('transform'), 'node')
+            backend.doIt(dag_mod)
+            assert cmds.objExists('node')
+            cmds.undo()
+            assert not cmds.objExists('node')
+            assert not backend.pending_modifiers
+    finally:
+        for name in [name for name in sys.modules if name.split('.')[0] == 'renamedRigger']:
+            del sys.modules[name]
+
+
+@pytest.mark.parametrize('edit', guide_edits, ids=[edit.__name__ for edit in guide_edits])
+def test_incremental_rebuild_is_undone(edit):
+    makeGuides()
+    build()
+    edit()
+    before = getSceneState()
+    build(incremental=True)
+
+    cmds.undo()
+    assert getSceneState() == before
+
+
+@pytest.mark.parametrize('backend', r.build_backends)
+def test_cancelled_build_is_rolled_back(backend):
+    makeGuides()
+    before = getSceneState()
+    results = []
+    scheduler = buildScheduler.BuildScheduler(finished=lambda status, error: results.append(status),
+                                              backend=backend, chunk_size=5)
+    scheduler.time_slice = 0.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        scheduler.start()
+        mayaStandIn.processIdleEvents()
+        mayaStandIn.processIdleEvents()
+        scheduler.cancel()
+        while scheduler.isRunning():
+            mayaStandIn.processIdleEvents()
+    assert results == ['cancelled']
+    assert getSceneState() == before
+
+
+@pytest.mark.parametrize('backend', r.build_backends)
+def test_failed_build_is_rolled_back(backend, monkeypatch):
+    makeGuides()
+    before = getSceneState()
+
+    def failingStoreFingerprint(*args, **kwargs):
+        raise RuntimeError('failed on purpose')
+
+    monkeypatch.setattr(r, 'storeFingerprint', failingStoreFingerprint)
+    results = []
+    scheduler = buildScheduler.BuildScheduler(finished=lambda status, error: results.append((status, str(error))),
+                                              backend=backend)
+    with contextlib.redirect_stdout(io.StringIO()):
+        scheduler.start()
+        while scheduler.isRunning():
+            mayaStandIn.processIdleEvents()
+    assert results == [('failed', 'failed on purpose')]
+    assert getSceneState() == before
+
+
+@pytest.mark.parametrize('earlier_build', (False, True))
+def test_empty_rollback_keeps_earlier_steps(earlier_build):
+    makeGuides()
+    cmds.createNode('transform', n='userNode')
+    if earlier_build:
+        scheduler = buildScheduler.BuildScheduler()
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler.start()
+            while scheduler.isRunning():
+                mayaStandIn.processIdleEvents()
+    before = getSceneState()
+    scheduler = buildScheduler.BuildScheduler(incremental=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        scheduler.start()
+        scheduler.cancel()
+        mayaStandIn.processIdleEvents()
+    assert scheduler.status == 'cancelled'
+    assert getSceneState() == before
+    assert cmds.objExists('userNode')
@@ -0,0 +1,105 @@
+# Checks that the template catalog only reads templates that changed, drops deleted ones and records files that
+# aren't guide templates as errors
+
+import os
+import shutil
+
+import pytest
+
+from ghostControlRigger import catalog
+
+# the templates that come with the tool
+template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guide_templates')
+
+# content of files with template extensions that aren't guide templates
+bad_files = {
+    'garbage.ma': 'this is not a scene\n',
+    'no_guides.ma': '//Maya ASCII 2023 scene\nrequires maya "2023";\n',
+    'no_guides.json': '{"format": "ghostControlRigger.guides", "version": 1, "guides": []}',
+}
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    shutil.copy(os.path.join(template_dir, 'control.ma'), str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.parametrize('filename', sorted(bad_files))
+def test_bad_templates_are_errors(template_path, filename):
+    (template_path / filename).write_text(bad_files[filename])
+    entries = catalog.refreshCatalog(str(template_path))['templates']
+    assert entries[filename]['error']
+    assert entries[filename]['guides'] == 0
+    assert entries['control.ma']['error'] is None
+    assert [name for name, entry in catalog.getTemplateEntries(str(template_path))] == ['control.ma']
+
+
+def countReads(monkeypatch):
+    '''
+    Counts the templates whose guides the catalog reads from their file
+    '''
+    reads = []
+    read_guides = catalog.readGuides
+    monkeypatch.setattr(catalog, 'readGuides', lambda path, text=None: reads.append(path) or read_guides(path, text))
+    return reads
+
+
+def test_unchanged_templates_are_not_read(template_path, monkeypatch):
+    reads = countReads(monkeypatch)
+    entry = catalog.refreshCatalog(str(template_path))['templates']['control.ma']
+    assert entry['names'] and entry['guide_hash']
+    assert len(reads) == 1
+    assert (template_path / catalog.catalog_filename).exists()
+
+    saved = os.stat(catalog.getCatalogPath(str(template_path))).st_mtime_ns
+    assert catalog.refreshCatalog(str(template_path))['templates']['control.ma'] == entry
+    assert catalog.getEntry(str(template_path), 'control.ma') == entry
+    assert len(reads) == 1
+    assert os.stat(catalog.getCatalogPath(str(template_path))).st_mtime_ns == saved
+
+
+def test_changed_templates_are_read_again(template_path, monkeypatch):
+    reads = countReads(monkeypatch)
+    path = template_path / 'control.ma'
+    entry = catalog.refreshCatalog(str(template_path))['templates']['control.ma']
+
+    # a new mtime with the same content only hashes the file again
+    os.utime(str(path), (entry['mtime'] + 60, entry['mtime'] + 60))
+    touched = catalog.refreshCatalog(str(template_path))['templates']['control.ma']
+    assert touched['mtime'] == entry['mtime'] + 60
+    assert touched['names'] == entry['names']
+    assert len(reads) == 1
+
+    path.write_text(path.read_text().replace('nurbsCircle1', 'collar'))
+    changed = catalog.getEntry(str(template_path), 'control.ma')
+    assert changed['names'] == ['collar']
+    assert changed['hash'] != entry['hash']
+    assert changed['guide_hash'] != entry['guide_hash']
+    assert len(reads) == 2
+    assert catalog.loadCatalog(str(template_path))['templates']['control.ma'] == changed
+
+
+def test_deleted_templates_are_dropped(template_path):
+    shutil.copy(str(template_path / 'control.ma'), str(template_path / 'other.ma'))
+    assert sorted(catalog.refreshCatalog(str(template_path))['templates']) == ['control.ma', 'other.ma']
+
+    os.remove(str(template_path / 'other.ma'))
+    assert catalog.getTemplates(str(template_path)) == ['control.ma']
+    assert sorted(catalog.loadCatalog(str(template_path))['templates']) == ['control.ma']
+
+    os.remove(str(template_path / 'control.ma'))
+    assert catalog.getEntry(str(template_path), 'control.ma') is None
+    assert catalog.loadCatalog(str(template_path))['templates'] == {}
+
+
+@pytest.mark.parametrize('content', ['{"format": "ghostControlRigger.catalog", "version": 2, "templates": {}}',
+                                     '{"format": "ghostControlRigger.catalog",', '[]'],
+                         ids=['old_version', 'half_written', 'not_a_catalog'])
+def test_unusable_catalogs_are_rebuilt(template_path, monkeypatch, content):
+    (template_path / catalog.catalog_filename).write_text(content)
+    reads = countReads(monkeypatch)
+    assert catalog.loadCatalog(str(template_path)) == catalog.makeCatalog()
+    assert catalog.getTemplates(str(template_path)) == ['control.ma']
+    assert len(reads) == 1
+    assert catalog.loadCatalog(str(template_path))['version'] == catalog.catalog_version
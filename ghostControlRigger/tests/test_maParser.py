@@ -0,0 +1,146 @@
+# Checks that the .ma parser reads files a statement at a time, refuses files that aren't Maya ASCII and doesn't make
+# up curve data it can't read without Maya
+
+import os
+
+import pytest
+
+from ghostControlRigger import maParser
+from ghostControlRigger import templateFormat
+
+# the templates that come with the tool
+template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guide_templates')
+
+header = '//Maya ASCII 2023 scene\n'
+
+# a guide with a curve shape from .cc data and a display override, and a mesh whose data is never kept
+scene = header + '''//Name: collar.ma
+requires maya "2023";
+currentUnit -l centimeter -a degree -t film;
+fileInfo "application" "maya";
+createNode transform -n "collar";
+	rename -uid "4F3C318D-BC4C-7070-17A0-08B107049BB6";
+	setAttr ".t" -type "double3" 1 2 3 ;
+createNode nurbsCurve -n "collarShape" -p "collar";
+	setAttr ".ove" yes;
+	setAttr ".ovc" 17;
+	setAttr ".cc" -type "nurbsCurve"
+		1 3 0 no 3
+		4 0 1 2 3
+		4
+		0 0 0
+		1 0 0
+		1 1 0
+		0 1 0
+		;
+createNode mesh -n "bodyShape";
+	setAttr -s 4 ".vt[0:3]" -type "float3" 0 0 0 1 0 0
+		 1 1 0 0 1 0 ;
+select -ne :defaultRenderGlobals;
+	setAttr ".ren" -type "string" "arnold";
+connectAttr "collarShape.ws" "bodyShape.i";
+'''
+
+# curve shapes whose curve data isn't in the file
+unreadable_curves = {
+    # the shape is made by a node that isn't evaluated
+    'other_history': '''createNode transform -n "collar";
+createNode nurbsCurve -n "collarShape" -p "collar";
+createNode makeNurbSquare -n "makeNurbSquare1";
+connectAttr "makeNurbSquare1.oc" "collarShape.cr";
+''',
+    # a circle that isn't a whole circle
+    'partial_sweep': '''createNode transform -n "collar";
+createNode nurbsCurve -n "collarShape" -p "collar";
+createNode makeNurbCircle -n "makeNurbCircle1";
+	setAttr ".sw" 180;
+connectAttr "makeNurbCircle1.oc" "collarShape.cr";
+''',
+}
+
+
+def iterLines(text, read):
+    '''
+    Yields the lines of text, counting them in read[0] as they are read
+    '''
+    for line in text.splitlines(True):
+        read[0] += 1
+        yield line
+
+
+def test_statements_are_streamed():
+    read = [0]
+    statements = maParser.iterStatements(iterLines(scene, read))
+    first_line, statement = next(statements)
+    assert statement == 'requires maya "2023";'
+    assert read[0] == 3
+
+    # statements that aren't kept are skipped without their text
+    statements = list(maParser.iterStatements(iterLines(scene, [0]), lambda line: not line.startswith('setAttr')))
+    skipped = [first_line for first_line, statement in statements if statement is None]
+    assert skipped[-2:] == ['setAttr -s 4 ".vt[0:3]" -type "float3" 0 0 0 1 0 0',
+                            'setAttr ".ren" -type "string" "arnold";']
+
+
+def test_parse_lines():
+    read = [0]
+    info = maParser.parseLines(iterLines(scene, read), 'collar.ma')
+    assert read[0] == len(scene.splitlines())
+    assert list(info['nodes']) == ['|collar', '|collar|collarShape', '|bodyShape']
+    assert info['nodes']['|bodyShape']['attrs'] == {}
+    assert info['shared'] == {':defaultRenderGlobals': 1}
+    assert info['requires'] == [['maya', '2023']]
+    assert info['file_info'] == {'application': 'maya'}
+    assert info['connections'] == [('collarShape.ws', 'bodyShape.i')]
+
+    template = maParser.toTemplate(info)
+    templateFormat.validateTemplate(template)
+    guide, = template['guides']
+    assert guide['name'] == 'collar'
+    assert guide['matrix'][12:15] == [1.0, 2.0, 3.0]
+    curve, = guide['curves']
+    assert curve['cvs'] == [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [1.0, 1.0, 0.0], [0.0, 1.0, 0.0]]
+    assert (curve['degree'], curve['form'], curve['knots']) == (1, 1, [0.0, 1.0, 2.0, 3.0])
+    assert curve['display'] == {'overrideEnabled': True, 'overrideColor': 17}
+
+
+def test_circle_history_is_evaluated():
+    info = maParser.parseFile(os.path.join(template_dir, 'control.ma'))
+    summary = maParser.getSummary(info)
+    assert summary['count'] == 1
+    assert summary['hierarchy'] == {'group1': None, 'nurbsCircle1': 'group1'}
+    low, high = summary['bbox']
+    # a unit circle with its normal along y
+    assert low[1] == pytest.approx(0.0) and high[1] == pytest.approx(0.0)
+    assert max(high[0], high[2]) > 1.0
+
+    curve = maParser.toTemplate(info)['guides'][1]['curves'][0]
+    assert (curve['degree'], curve['form'], len(curve['cvs'])) == (3, 3, 11)
+
+
+@pytest.mark.parametrize('text', ['', '\n' + scene, 'requires maya "2023";\n', '// Maya ASCII 2023 scene\n',
+                                  '//Maya Binary 2023 scene\n'])
+def test_header_is_required(text):
+    with pytest.raises(RuntimeError, match="doesn't start with"):
+        maParser.parseLines(text.splitlines(True), 'collar.ma')
+
+
+def test_binary_files_are_refused(tmp_path):
+    path = tmp_path / 'collar.ma'
+    path.write_bytes(b'\x00\x01\xff\xfe garbage')
+    with pytest.raises(RuntimeError, match='not a Maya ASCII file'):
+        maParser.parseFile(str(path))
+
+
+@pytest.mark.parametrize('text', list(unreadable_curves.values()), ids=list(unreadable_curves))
+def test_unreadable_curves_are_errors(tmp_path, text):
+    info = maParser.parseLines((header + text).splitlines(True), 'collar.ma')
+    assert maParser.getSummary(info)['bbox'] is None
+    with pytest.raises(RuntimeError, match='no curve data'):
+        maParser.toTemplate(info)
+
+    path = tmp_path / 'collar.ma'
+    path.write_text(header + text)
+    with pytest.raises(RuntimeError):
+        maParser.convertFile(str(path), str(tmp_path / 'collar.json'))
+    assert not (tmp_path / 'collar.json').exists()
@@ -0,0 +1,78 @@
+# Checks that the template cache serves repeated reads from memory, reads changed files again and drops the
+# templates used least recently once it's full
+
+import os
+
+import pytest
+
+from ghostControlRigger import benchmark
+from ghostControlRigger import templateCache
+from ghostControlRigger import templateFormat
+
+# the templates that come with the tool
+template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guide_templates')
+
+
+def writeTemplate(path, name, radius=1.0, mtime=1000000000):
+    '''
+    Writes a compact template of one circle guide, with a fixed mtime
+    '''
+    guide = templateFormat.makeGuide(name, None, [float(i % 5 == 0) for i in range(16)],
+                                     [benchmark.circleData(radius)])
+    templateFormat.writeTemplate(path, templateFormat.makeTemplate([guide]))
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_repeated_reads_are_hits(tmp_path):
+    path = writeTemplate(str(tmp_path / 'collar.json'), 'collar')
+    cache = templateCache.TemplateCache()
+    template = cache.get(path)
+    assert cache.get(path) is template
+    assert template['guides'][0]['name'] == 'collar'
+    stats = cache.getStats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_changed_file_is_read_again(tmp_path):
+    path = writeTemplate(str(tmp_path / 'collar.json'), 'collar', radius=1.0)
+    cache = templateCache.TemplateCache()
+    cache.get(path)
+    # same size, only the mtime tells the files apart
+    writeTemplate(path, 'collar', radius=2.0, mtime=1000000060)
+    template = cache.get(path)
+    assert template['guides'][0]['curves'][0]['cvs'][0][0] == pytest.approx(2.0)
+    assert cache.getStats()['misses'] == 2
+
+    os.remove(path)
+    with pytest.raises(RuntimeError):
+        cache.get(path)
+    assert cache.getStats()['entries'] == 0
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    paths = [writeTemplate(str(tmp_path / '{}.json'.format(name)), name) for name in ('collar', 'cuff', 'hem')]
+    template_bytes = templateCache.getTemplateBytes(templateFormat.readTemplate(paths[0]))
+    cache = templateCache.TemplateCache(max_bytes=2 * template_bytes)
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])
+    cache.get(paths[2])
+    assert list(cache.entries) == [paths[0], paths[2]]
+    assert cache.getStats()['evictions'] == 1
+    assert cache.getStats()['bytes'] <= cache.max_bytes
+
+    # the template used last is kept even if it doesn't fit
+    cache.max_bytes = 0
+    cache.get(paths[1])
+    assert list(cache.entries) == [paths[1]]
+
+
+def test_ma_templates_are_not_cached():
+    cache = templateCache.TemplateCache()
+    path = os.path.join(template_dir, 'control.ma')
+    for i in range(2):
+        with pytest.raises(RuntimeError, match='Only compact templates'):
+            cache.get(path)
+    assert cache.getStats()['hits'] == 1
@@ -0,0 +1,100 @@
+# Checks that compact templates read back the guides they were written from and that files that aren't valid
+# templates are refused
+
+import copy
+import json
+import os
+
+import pytest
+
+from ghostControlRigger import benchmark
+from ghostControlRigger import maParser
+from ghostControlRigger import templateFormat
+from ghostControlRigger import templates
+
+# the templates that come with the tool
+template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guide_templates')
+
+
+def makeTemplate():
+    '''
+    Returns a template of a circle guide with a child, with a display override and floats past the rounding
+    '''
+    curve = benchmark.circleData(1.0 / 3.0)
+    curve['display'] = {'overrideEnabled': True, 'overrideColor': 17}
+    matrix = [float(i % 5 == 0) for i in range(16)]
+    child_matrix = list(matrix)
+    child_matrix[12] = 2.0 / 3.0
+    return templateFormat.makeTemplate([templateFormat.makeGuide('collar', None, matrix, [curve]),
+                                        templateFormat.makeGuide('collar_tip', 0, child_matrix, [])])
+
+
+# changes that make template data invalid
+bad_templates = {
+    'wrong_format': lambda template: template.update(format='somethingElse'),
+    'newer_version': lambda template: template.update(version=templateFormat.format_version + 1),
+    'child_before_parent': lambda template: template['guides'][1].update(parent=1),
+    'short_matrix': lambda template: template['guides'][0].update(matrix=[0.0] * 15),
+    'knot_mismatch': lambda template: template['guides'][0]['curves'][0]['knots'].pop(),
+}
+
+
+def test_file_round_trip(tmp_path):
+    template = makeTemplate()
+    path = str(tmp_path / 'collar.json')
+    templateFormat.writeTemplate(path, template)
+    assert os.listdir(str(tmp_path)) == ['collar.json']
+
+    read = templateFormat.readTemplate(path)
+    assert read == templateFormat.roundFloats(template)
+    assert read['guides'][1]['matrix'][12] == round(2.0 / 3.0, templateFormat.float_digits)
+    assert read['guides'][0]['curves'][0]['display'] == {'overrideEnabled': True, 'overrideColor': 17}
+    assert templateFormat.hashTemplate(read) == templateFormat.hashTemplate(template)
+
+
+def test_scene_round_trip(tmp_path):
+    template = maParser.toTemplate(maParser.parseFile(os.path.join(template_dir, 'control.ma')))
+    path = str(tmp_path / 'control.json')
+    templateFormat.writeTemplate(path, template)
+
+    guides = templates.buildTemplate(templateFormat.readTemplate(path))
+    assert guides
+    exported = templates.getTemplateData(guides)
+    assert len(exported['guides']) == len(template['guides'])
+    assert templateFormat.hashTemplate(exported) == templateFormat.hashTemplate(template)
+
+
+@pytest.mark.parametrize('change', list(bad_templates.values()), ids=list(bad_templates))
+def test_bad_templates_are_refused(tmp_path, change):
+    template = makeTemplate()
+    change(template)
+    with pytest.raises(RuntimeError):
+        templateFormat.validateTemplate(template)
+    with pytest.raises(RuntimeError):
+        templateFormat.writeTemplate(str(tmp_path / 'collar.json'), template)
+    assert not os.listdir(str(tmp_path))
+
+    path = tmp_path / 'collar.json'
+    path.write_text(json.dumps(template))
+    with pytest.raises(RuntimeError):
+        templateFormat.readTemplate(str(path))
+
+
+@pytest.mark.parametrize('text', ['', '{"format": "ghostControlRigger.guides",', '[]', 'null'])
+def test_bad_files_are_refused(tmp_path, text):
+    path = tmp_path / 'collar.json'
+    path.write_text(text)
+    with pytest.raises(RuntimeError, match='collar.json|Not a guide template'):
+        templateFormat.readTemplate(str(path))
+
+
+def test_missing_file_is_refused(tmp_path):
+    with pytest.raises(RuntimeError, match='not found'):
+        templateFormat.readTemplate(str(tmp_path / 'collar.json'))
+
+
+def test_valid_template_is_unchanged():
+    template = makeTemplate()
+    before = copy.deepcopy(template)
+    templateFormat.validateTemplate(template)
+    assert template == before
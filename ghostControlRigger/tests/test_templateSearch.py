@@ -0,0 +1,44 @@
+# Checks that template search finds templates by their name and guide names, ranks better matches first and
+# narrows the previous results while the user types
+
+import pytest
+
+from ghostControlRigger import templateSearch
+
+templates = [
+    ('shirt.ma', {'names': ['collar', 'cuff_L', 'cuff_R']}),
+    ('Collar.json', {'names': ['band']}),
+    ('trousers.ma', {'names': ['waist', 'hem_L', 'hem_R']}),
+    ('coat.json', {'names': ['lapel', 'lining']}),
+    ('empty.ma', {}),
+]
+
+
+@pytest.mark.parametrize('text, scores', [
+    ('', {0: 0, 1: 0, 2: 0, 3: 0, 4: 0}),
+    ('collar', {0: 1, 1: 0}),
+    ('COLLAR', {0: 1, 1: 0}),
+    ('clr', {0: 3, 1: 2}),
+    ('hem', {2: 1}),
+    ('shirt cuff', {0: 1}),
+    ('trousers cuff', {}),
+    # fuzzy matches don't run from one guide name into the next
+    ('lapl', {3: 3}),
+    ('lapelli', {}),
+    ('zzz', {}),
+])
+def test_search(text, scores):
+    index = templateSearch.makeSearchIndex(templates)
+    assert templateSearch.search(index, text) == scores
+
+
+def test_refined_search_only_looks_at_previous_matches():
+    index = templateSearch.makeSearchIndex(templates)
+    previous = templateSearch.search(index, 'c')
+    assert templateSearch.isRefinement('co', 'c')
+    assert templateSearch.isRefinement('CO', 'c')
+    assert not templateSearch.isRefinement('co', 'h')
+    assert not templateSearch.isRefinement('co', None)
+    assert templateSearch.search(index, 'co', previous) == templateSearch.search(index, 'co')
+    # rows that aren't given aren't looked at
+    assert templateSearch.search(index, 'co', [3]) == {3: 0}
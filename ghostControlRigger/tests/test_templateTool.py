@@ -0,0 +1,126 @@
+# Checks what the offline template tool converts and reports, and that it exits with an error status for templates
+# with problems and files that aren't guide templates
+
+import contextlib
+import io
+import json
+import os
+import shutil
+
+import pytest
+
+from ghostControlRigger import maParser
+from ghostControlRigger import templateFormat
+from ghostControlRigger import templateTool
+
+# the templates that come with the tool
+template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guide_templates')
+
+# content of files that end in .ma but aren't guide templates
+bad_files = {
+    'garbage': b'this is not a scene\n',
+    'binary': b'\x00\x01\xff\xfe garbage',
+    'empty': b'',
+    'no_guides': b'//Maya ASCII 2023 scene\nrequires maya "2023";\ncurrentUnit -l centimeter -a degree;\n',
+}
+
+# a template with nothing but a guide curve
+clean_file = '''//Maya ASCII 2023 scene
+requires maya "2023";
+currentUnit -l centimeter -a degree -t film;
+createNode transform -n "{0}";
+	setAttr ".t" -type "double3" 1 2 3 ;
+createNode nurbsCurve -n "{0}Shape" -p "{0}";
+	setAttr ".cc" -type "nurbsCurve"
+		1 3 0 no 3
+		4 0 1 2 3
+		4
+		0 0 0
+		1 0 0
+		1 1 0
+		0 1 0
+		;
+'''
+
+
+def runTool(*args):
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        status = templateTool.main(list(args))
+    return status, output.getvalue()
+
+
+@pytest.mark.parametrize('content', list(bad_files.values()), ids=list(bad_files))
+def test_bad_templates_are_errors(tmp_path, content):
+    shutil.copy(os.path.join(template_dir, 'control.ma'), str(tmp_path))
+    (tmp_path / 'bad.ma').write_bytes(content)
+
+    status, output = runTool(str(tmp_path), '--jobs', '1', '--convert')
+    assert status == 1
+    assert 'ERROR  bad.ma' in output
+    assert not (tmp_path / 'bad.json').exists()
+    assert (tmp_path / 'control.json').exists()
+
+    result = templateTool.checkTemplate(str(tmp_path / 'bad.ma'))
+    assert result['error']
+    assert 'guides' not in result
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_convert_to_output(tmp_path, jobs):
+    directory = tmp_path / 'templates'
+    (directory / 'shirt').mkdir(parents=True)
+    (directory / 'collar.ma').write_text(clean_file.format('collar'))
+    (directory / 'shirt' / 'cuff.ma').write_text(clean_file.format('cuff'))
+    output = tmp_path / 'compact'
+
+    status, text = runTool(str(directory), '--jobs', jobs, '--output', str(output), '--report',
+                           str(tmp_path / 'report.json'))
+    assert status == 0
+    assert sorted(os.listdir(str(directory))) == ['collar.ma', 'shirt']
+    for name in ('collar', os.path.join('shirt', 'cuff')):
+        template = templateFormat.readTemplate(str(output / (name + '.json')))
+        assert template == templateFormat.roundFloats(maParser.toTemplate(maParser.parseFile(
+            str(directory / (name + '.ma')))))
+        size = os.path.getsize(str(output / (name + '.json')))
+        assert 'ok     {}.ma  1 guides, 2 nodes'.format(name) in text
+        assert '-> {} bytes'.format(size) in text
+    assert '2 templates, 2 guides' in text
+    assert '0 with problems, 0 unreadable' in text
+
+    with open(str(tmp_path / 'report.json')) as f:
+        totals = json.load(f)['totals']
+    assert (totals['templates'], totals['converted'], totals['unreadable']) == (2, 2, 0)
+
+
+def test_convert_next_to_templates(tmp_path):
+    (tmp_path / 'collar.ma').write_text(clean_file.format('collar'))
+    status, text = runTool(str(tmp_path), '--jobs', '1')
+    assert status == 0
+    assert not (tmp_path / 'collar.json').exists()
+
+    status, text = runTool(str(tmp_path), '--jobs', '1', '--convert')
+    assert status == 0
+    assert templateFormat.readTemplate(str(tmp_path / 'collar.json'))['guides'][0]['name'] == 'collar'
+
+
+def test_problems_exit_with_error(tmp_path):
+    shutil.copy(os.path.join(template_dir, 'control.ma'), str(tmp_path))
+    (tmp_path / 'collar.ma').write_text(clean_file.format('collar'))
+
+    status, text = runTool(str(tmp_path), '--jobs', '1', '--convert')
+    assert status == 1
+    assert 'CHECK  control.ma' in text
+    assert 'non-curve makeNurbCircle: makeNurbCircle1' in text
+    assert 'requires plugins: mtoa' in text
+    assert '1 with problems, 0 unreadable' in text
+    # templates with problems are still converted
+    assert (tmp_path / 'control.json').exists()
+    assert (tmp_path / 'collar.json').exists()
+
+
+def test_missing_directory_is_an_error(tmp_path):
+    with contextlib.redirect_stderr(io.StringIO()) as errors:
+        with pytest.raises(SystemExit) as exit_info:
+            runTool(str(tmp_path / 'missing'), '--convert')
+    assert exit_info.value.code == 2
+    assert 'Not a directory' in errors.getvalue()
@@ -0,0 +1,113 @@
+# Checks that template imports are undone and redone as one step, and that exports skip templates that already hold
+# the exported guides
+
+import contextlib
+import io
+import os
+import shutil
+
+import pytest
+
+import maya.cmds as cmds
+
+from ghostControlRigger import catalog
+from ghostControlRigger import ghostControlRigger as r
+from ghostControlRigger import maParser
+from ghostControlRigger import templateFormat
+from ghostControlRigger import templates
+
+# the templates that come with the tool
+template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guide_templates')
+
+
+@pytest.fixture
+def templates_dir(tmp_path):
+    '''
+    A templates directory with control.ma and the same guides as a compact template, control.json
+    '''
+    shutil.copy(os.path.join(template_dir, 'control.ma'), str(tmp_path))
+    template = maParser.toTemplate(maParser.parseFile(os.path.join(template_dir, 'control.ma')))
+    templateFormat.writeTemplate(str(tmp_path / 'control.json'), template)
+    old_dir = templates.get_templates_Dir()
+    with contextlib.redirect_stdout(io.StringIO()):
+        templates.set_templates_Dir(str(tmp_path))
+    yield tmp_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        templates.set_templates_Dir(old_dir)
+
+
+def getScene():
+    return sorted(cmds.ls(dag=True, long=True) or [])
+
+
+@pytest.mark.parametrize('filenames', (['control.json'], ['control.ma'], ['control.json', 'control.ma']))
+def test_import_many_undo(templates_dir, filenames):
+    before = getScene()
+    with contextlib.redirect_stdout(io.StringIO()):
+        guides = templates.template_import_many(filenames)
+    assert len(guides) == len(filenames)
+    after = getScene()
+    assert cmds.listRelatives(r.all_guides_grp, c=True) == guides
+
+    cmds.undo()
+    assert getScene() == before
+    cmds.redo()
+    assert getScene() == after
+
+
+def exportTemplate(filename, fileType='mayaAscii'):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return templates.template_export(filename, fileType)
+
+
+@pytest.mark.parametrize('filename, fileType', [('collar.json', 'mayaAscii'), ('collar', 'json'),
+                                                ('collar', 'mayaAscii')])
+def test_unchanged_exports_are_skipped(templates_dir, filename, fileType):
+    template = maParser.toTemplate(maParser.parseFile(os.path.join(template_dir, 'control.ma')))
+    circle = template['guides'][1]
+    guide = templates.buildTemplate(templateFormat.makeTemplate([templateFormat.makeGuide(
+        'collar', None, circle['matrix'], circle['curves'])]))[0]
+    cmds.select(guide)
+    assert exportTemplate(filename, fileType)
+    name = filename if filename.endswith('.json') else filename + ('.json' if fileType == 'json' else '.ma')
+    path = str(templates_dir / name)
+    entry = catalog.getEntry(str(templates_dir), name)
+    assert entry['guide_hash'] == templateFormat.hashTemplate(templates.getTemplateData([guide]))
+
+    # a write would change the mtime, a new mtime alone only hashes the file again
+    os.utime(path, (1000000000, 1000000000))
+    cmds.select(guide)
+    assert not exportTemplate(filename, fileType)
+    assert os.stat(path).st_mtime == 1000000000
+    assert catalog.getEntry(str(templates_dir), name)['guide_hash'] == entry['guide_hash']
+
+    cmds.setAttr(guide + '.translateX', 5.0)
+    cmds.select(guide)
+    assert exportTemplate(filename, fileType)
+    assert os.stat(path).st_mtime != 1000000000
+    assert catalog.getEntry(str(templates_dir), name)['guide_hash'] != entry['guide_hash']
+
+
+def test_export_over_maya_template_is_skipped(templates_dir):
+    # a template Maya wrote, its guide hash comes from maParser
+    text = ('''//Maya ASCII 2023 scene
+requires maya "2023";
+createNode transform -n "collar";
+	setAttr ".t" -type "double3" 1 2 3 ;
+createNode nurbsCurve -n "collarShape" -p "collar";
+	setAttr ".cc" -type "nurbsCurve"
+		1 3 0 no 3
+		4 0 1 2 3
+		4
+		0 0 0
+		1 0 0
+		1 1 0
+		0 1 0
+		;
+''')
+    path = templates_dir / 'collar.ma'
+    path.write_text(text)
+    guides = templates.buildTemplate(maParser.toTemplate(maParser.parseFile(str(path))))
+    cmds.select(guides)
+    assert not exportTemplate('collar')
+    assert path.read_text() == text
@@ -0,0 +1,55 @@
+# Checks that thumbnails are drawn once per template content and that templates that can't be drawn are reported
+# without stopping the worker pool
+
+import os
+import shutil
+
+import pytest
+
+from ghostControlRigger import thumbnails
+
+# the templates that come with the tool
+template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'guide_templates')
+
+
+@pytest.fixture
+def template_path(tmp_path, monkeypatch):
+    # pool workers import the package from this process's sys.path, where pytest put the folder above it first
+    monkeypatch.syspath_prepend(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    monkeypatch.setattr(thumbnails, 'cache_dir', str(tmp_path / 'thumbnails'))
+    templates_dir = tmp_path / 'templates'
+    templates_dir.mkdir()
+    for name in ('control.ma', 'copy.ma', 'other.ma'):
+        shutil.copy(os.path.join(template_dir, 'control.ma'), str(templates_dir / name))
+    (templates_dir / 'bad.ma').write_text('this is not a scene\n')
+    return templates_dir
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_failed_renders_are_reported(template_path, processes):
+    templates = [(str(template_path / 'control.ma'), 'a' * 40),
+                 (str(template_path / 'bad.ma'), 'b' * 40),
+                 (str(template_path / 'copy.ma'), 'a' * 40),
+                 (str(template_path / 'missing.ma'), 'c' * 40),
+                 (str(template_path / 'other.ma'), 'd' * 40)]
+    results = dict((content_hash, (thumbnail, error)) for content_hash, thumbnail, error
+                   in thumbnails.generateThumbnails(templates, processes=processes))
+    assert sorted(results) == ['a' * 40, 'b' * 40, 'c' * 40, 'd' * 40]
+
+    for content_hash in ('a' * 40, 'd' * 40):
+        thumbnail, error = results[content_hash]
+        assert error is None
+        assert thumbnail == thumbnails.getThumbnailPath(content_hash)
+        with open(thumbnail, 'rb') as f:
+            assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+    for content_hash in ('b' * 40, 'c' * 40):
+        thumbnail, error = results[content_hash]
+        assert thumbnail is None
+        assert error.startswith('RuntimeError')
+        assert not os.path.exists(thumbnails.getThumbnailPath(content_hash))
+    assert sorted(os.listdir(thumbnails.cache_dir)) == ['{}_{}.png'.format(content_hash, thumbnails.thumbnail_size)
+                                                        for content_hash in ('a' * 40, 'd' * 40)]
+
+    # only the thumbnails that failed are tried again
+    results = list(thumbnails.generateThumbnails(templates, processes=processes))
+    assert sorted(content_hash for content_hash, thumbnail, error in results) == ['b' * 40, 'c' * 40]